@@ -0,0 +1,121 @@
+"""
+DBアクセス方式（DB_MODE=sync / async）ごとの同時実行スループット計測
+
+    cd backend
+    python benchmarks/db_concurrency.py --modes sync,async --concurrency 1,4,16,64
+
+アプリはプロセス内で起動し（httpx の ASGI 呼び出し）、同時実行数ごとに
+GET /api/spots/ を投げて req/s を表示する。DATABASE_URL を指定しなければ
+一時ディレクトリの SQLite にシードデータを作る。
+
+ローカルの SQLite はクエリがほぼCPU処理なので差が出にくい。
+--db-latency-ms でクエリごとにネットワーク往復相当の待ちを入れると、
+MySQL など別サーバーのDBを使ったときのスケールの仕方を確認できる。
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def run_child(args) -> dict:
+    os.environ["DB_MODE"] = args.mode
+    if "DATABASE_URL" not in os.environ:
+        work_dir = tempfile.mkdtemp(prefix="spotshare-bench-")
+        os.makedirs(os.path.join(work_dir, "data"))
+        os.environ["DATABASE_URL"] = f"sqlite:///{work_dir}/data/spots.db"
+        os.chdir(work_dir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import httpx
+    from sqlalchemy import event
+    from sqlalchemy.util import await_only
+
+    import main
+    from database import SessionLocal, create_tables, request_engine
+    from models import Spot, User
+
+    create_tables()
+    db = SessionLocal()
+    if db.query(Spot).count() < args.spots:
+        owner = db.query(User).filter_by(username="bench_owner").first()
+        if owner is None:
+            owner = User(username="bench_owner", hashed_password="x", display_name="bench")
+            db.add(owner)
+            db.flush()
+        db.add_all([
+            Spot(title=f"spot{i}", category="グルメ", latitude=35.0 + i * 1e-4, longitude=139.0, rating=3.0, owner_id=owner.id)
+            for i in range(args.spots)
+        ])
+        db.commit()
+    db.close()
+
+    if args.db_latency_ms:
+        latency = args.db_latency_ms / 1000
+
+        @event.listens_for(request_engine, "before_cursor_execute")
+        def simulate_latency(conn, cursor, statement, parameters, context, executemany):
+            if args.mode == "async":
+                await_only(asyncio.sleep(latency))  # 非同期ドライバの待ち（ループは塞がない）
+            else:
+                time.sleep(latency)  # 同期ドライバの待ち（ワーカースレッドを塞ぐ）
+
+    async def measure(concurrency: int) -> dict:
+        async with httpx.AsyncClient(app=main.app, base_url="http://bench") as client:
+            remaining = args.requests
+
+            async def worker():
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    response = await client.get("/api/spots/", params={"per_page": 20, "category": "グルメ"})
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        return {"concurrency": concurrency, "requests": args.requests, "rps": round(args.requests / elapsed, 1)}
+
+    async def main_loop():
+        return [await measure(c) for c in args.concurrency]
+
+    return {"mode": args.mode, "results": asyncio.run(main_loop())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=500, help="同時実行数ごとのリクエスト数")
+    parser.add_argument("--spots", type=int, default=2000, help="シードするスポット数")
+    parser.add_argument("--db-latency-ms", type=float, default=0, help="クエリごとに加える待ち時間")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    if args.mode:
+        print(json.dumps(run_child(args)))
+        return
+
+    # DB_MODE は import 時に決まるのでモードごとに別プロセスで計測
+    print(f"{'mode':<6} {'concurrency':>11} {'req/s':>9}")
+    for mode in args.modes.split(","):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode,
+             "--concurrency", ",".join(map(str, args.concurrency)),
+             "--requests", str(args.requests), "--spots", str(args.spots),
+             "--db-latency-ms", str(args.db_latency_ms)],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        for row in json.loads(output)["results"]:
+            print(f"{mode:<6} {row['concurrency']:>11} {row['rps']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+エンドポイントごとの負荷テスト（スループット・p50/p95/p99 レイテンシ）
+
+    cd backend
+    python benchmarks/load_test.py --users 1000 --spots 20000 --concurrency 16 --output bench.json
+    python benchmarks/load_test.py --output after.json --compare bench.json
+
+アプリはプロセス内で起動し（httpx の ASGI 呼び出し）、一時ディレクトリの SQLite に
+dataset_generator.py でデータを作ってから、シナリオごとに --requests 件を --concurrency 並列で投げる。
+レイテンシはクライアント側で測った1リクエストの所要時間（イベントループの待ちを含む）。
+
+結果は --output に JSON で保存する（コミット・環境・引数つき）。
+--compare に以前の結果を渡すと、シナリオごとの変化率を表示する。
+DB_MODE などの設定は環境変数でそのまま渡せる。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PASSWORD = "bench-password"
+USERNAME_PREFIX = "user"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """線形補間のパーセンタイル（sorted_values は昇順）"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)  # noqa: E731
+    return {
+        "scenario": name,
+        "requests": len(values) + errors,
+        "errors": errors,
+        "rps": round((len(values) + errors) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+    }
+
+
+def seed(args) -> None:
+    """ユーザー・フレンド関係（べき分布）・スポットを生成して INSERT する（dataset_generator.py）"""
+    import dataset_generator
+    from database import engine
+
+    dataset_generator.generate(
+        engine, args.users, args.spots, edges_per_user=args.edges_per_user,
+        password=PASSWORD, bcrypt_rounds=args.bcrypt_rounds, username_prefix=USERNAME_PREFIX,
+        seed=args.seed, log=lambda message: None,
+    )
+
+
+def scenarios(args) -> Dict[str, Callable]:
+    """シナリオ名 → (client, i) を受け取ってリクエストを送る関数"""
+    from dataset_generator import username
+
+    # 優先的選択なので最初のユーザーほどフレンドが多い
+    hub_user = username(USERNAME_PREFIX, 0)
+
+    def get(path, **params):
+        return lambda client, i: client.get(path, params=params)
+
+    def login(client, i):
+        return client.post("/api/users/login", json={
+            "username": username(USERNAME_PREFIX, i % args.users), "password": PASSWORD
+        })
+
+    hub_headers = {}
+
+    async def feed(client, i):
+        # フィードはトークンで閲覧者を決めるので、最初に1回だけログインしておく
+        if not hub_headers:
+            response = await client.post("/api/users/login", json={"username": hub_user, "password": PASSWORD})
+            hub_headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        return await client.get("/api/friends/feed", params={"limit": 20}, headers=hub_headers)
+
+    return {
+        "spots_list": get("/api/spots/", per_page=20),
+        "spots_list_card": get("/api/spots/", per_page=20, view="card", total_mode="estimate"),
+        "spots_category": get("/api/spots/", per_page=20, category="カフェ"),
+        "spots_nearby": get("/api/spots/", per_page=20, lat=35.6812, lng=139.7671, radius=2),
+        "posts": get("/posts"),
+        "login": login,
+        "friends_search": get("/api/friends/search", username=hub_user, query=USERNAME_PREFIX + "00"),
+        "friends_list": get("/api/friends/", username=hub_user),
+        "friends_feed": feed,
+    }
+
+
+async def run_scenario(client, name: str, send: Callable, requests: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            response = await send(client, i)
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    # ウォームアップ（キャッシュ・コネクションの準備）
+    for i in range(min(5, requests)):
+        await send(client, i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, time.perf_counter() - started)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            check=True, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[dict], baseline_path: str) -> None:
+    """以前の結果との差（+ はレイテンシ増・スループット増）"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {row["scenario"]: row for row in json.load(f)["results"]}
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\n比較: {baseline_path}")
+    print(f"{'scenario':<16} {'rps':>9} {'p50':>9} {'p99':>9}")
+    for row in results:
+        old = baseline.get(row["scenario"])
+        if old is None:
+            continue
+        print(f"{row['scenario']:<16} {change(row['rps'], old['rps']):>9} "
+              f"{change(row['p50_ms'], old['p50_ms']):>9} {change(row['p99_ms'], old['p99_ms']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--spots", type=int, default=5000)
+    parser.add_argument("--edges-per-user", type=int, default=5, help="フレンド関係の密度（dataset_generator.py）")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="ログインの重さ（本番相当は12）")
+    parser.add_argument("--requests", type=int, default=300, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", help="カンマ区切り（省略時はすべて）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="結果を書き出す JSON ファイル")
+    parser.add_argument("--compare", help="比較する以前の結果（JSON）")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    # main.py は data/posts.db を相対パスで開くので、一時ディレクトリで起動する
+    work_dir = tempfile.mkdtemp(prefix="spotshare-load-")
+    os.makedirs(os.path.join(work_dir, "data"))
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{work_dir}/data/spots.db")
+    os.chdir(work_dir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import httpx
+
+    import main as app_main
+    from database import DB_MODE, create_tables
+
+    create_tables()
+    seed_started = time.perf_counter()
+    seed(args)
+    print(f"シード: users={args.users} spots={args.spots} ({time.perf_counter() - seed_started:.1f}s)")
+
+    selected = scenarios(args)
+    if args.scenarios:
+        selected = {name: selected[name] for name in args.scenarios.split(",")}
+
+    async def run_all():
+        async with httpx.AsyncClient(app=app_main.app, base_url="http://bench", timeout=60) as client:
+            return [
+                await run_scenario(client, name, send, args.requests, args.concurrency)
+                for name, send in selected.items()
+            ]
+
+    results = asyncio.run(run_all())
+
+    print(f"{'scenario':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for row in results:
+        print(f"{row['scenario']:<16} {row['rps']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['errors']:>6}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "db_mode": DB_MODE,
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n結果: {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
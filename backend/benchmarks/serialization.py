@@ -0,0 +1,147 @@
+"""
+100件のスポット一覧（GET /api/spots/?per_page=100）のシリアライズ・圧縮コスト計測
+
+    cd backend
+    python benchmarks/serialization.py --requests 300
+
+モードごとに別プロセスでアプリを起動し（FAST_RESPONSES / RESPONSE_COMPRESSION は
+import 時に決まるため）、1リクエストあたりのCPU時間と転送バイト数を表示する。
+serialize は DB 読み込みを除いた「モデル → レスポンスのバイト列」だけのCPU時間。
+
+    json      : 従来（response_model で再検証 + 標準の json）
+    orjson    : FAST_RESPONSES=1（orjson で1回だけシリアライズ）
+    json+gz   : 従来 + gzip
+    orjson+gz : FAST_RESPONSES=1 + gzip
+    orjson+br : FAST_RESPONSES=1 + brotli（brotli が入っている場合）
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+MODES = {
+    "json": {"FAST_RESPONSES": "0", "RESPONSE_COMPRESSION": "off", "accept_encoding": "identity"},
+    "orjson": {"FAST_RESPONSES": "1", "RESPONSE_COMPRESSION": "off", "accept_encoding": "identity"},
+    "json+gz": {"FAST_RESPONSES": "0", "RESPONSE_COMPRESSION": "on", "accept_encoding": "gzip"},
+    "orjson+gz": {"FAST_RESPONSES": "1", "RESPONSE_COMPRESSION": "on", "accept_encoding": "gzip"},
+    "orjson+br": {"FAST_RESPONSES": "1", "RESPONSE_COMPRESSION": "on", "accept_encoding": "br"},
+}
+
+
+def run_child(args) -> dict:
+    mode = MODES[args.mode]
+    os.environ["FAST_RESPONSES"] = mode["FAST_RESPONSES"]
+    os.environ["RESPONSE_COMPRESSION"] = mode["RESPONSE_COMPRESSION"]
+    work_dir = tempfile.mkdtemp(prefix="spotshare-bench-")
+    os.makedirs(os.path.join(work_dir, "data"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{work_dir}/data/spots.db"
+    os.chdir(work_dir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import asyncio
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.testclient import TestClient
+
+    import compression
+    import main
+    import responses
+    from database import SessionLocal, create_tables
+    from models import Spot, User
+    from routers import spots as spots_router
+
+    if mode["accept_encoding"] == "br" and compression.brotli is None:
+        return {"mode": args.mode, "skipped": "brotli がインストールされていません"}
+
+    create_tables()
+    db = SessionLocal()
+    owner = User(username="bench_owner", hashed_password="x", display_name="ベンチ太郎")
+    db.add(owner)
+    db.flush()
+    db.add_all([
+        Spot(title=f"スポット{i}", description="駅から徒歩5分。落ち着いた雰囲気で、週末はやや混雑します。" * 2,
+             category="グルメ", latitude=35.0 + i * 1e-4, longitude=139.0 + i * 1e-4,
+             rating=3.5, address=f"東京都渋谷区神南1-{i}-1", owner_id=owner.id)
+        for i in range(100)
+    ])
+    db.commit()
+    db.close()
+
+    params = {"per_page": 100, "total_mode": "none"}
+    headers = {"Accept-Encoding": mode["accept_encoding"]}
+    with TestClient(main.app) as client:
+        for _ in range(20):  # ウォームアップ
+            client.get("/api/spots/", params=params, headers=headers).raise_for_status()
+
+        wire_bytes = 0
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            response = client.get("/api/spots/", params=params, headers=headers)
+            response.raise_for_status()
+            wire_bytes = response.num_bytes_downloaded
+        cpu = time.process_time() - cpu_started
+        elapsed = time.perf_counter() - started
+
+    # シリアライズだけの時間（FastAPI の response_model 処理 or orjson）
+    db = SessionLocal()
+    page = spots_router.SpotListResponse(
+        spots=[spots_router.SpotResponse.model_validate(spot) for spot in db.query(Spot).limit(100)],
+        total=None, page=1, per_page=100,
+    )
+    db.close()
+    route = next(r for r in main.app.routes if getattr(r, "path", None) == "/api/spots/" and "GET" in r.methods)
+
+    def serialize() -> bytes:
+        if responses.FAST_RESPONSES:
+            return responses.render(page).body
+        content = asyncio.run(serialize_response(field=route.response_field, response_content=page))
+        return JSONResponse(content).body
+
+    serialize_started = time.process_time()
+    for _ in range(args.requests):
+        serialize()
+    serialize_cpu = time.process_time() - serialize_started
+
+    return {
+        "mode": args.mode,
+        "serialize_ms": round(serialize_cpu / args.requests * 1000, 3),
+        "cpu_ms_per_request": round(cpu / args.requests * 1000, 3),
+        "wall_ms_per_request": round(elapsed / args.requests * 1000, 3),
+        "bytes": wire_bytes,
+        "content_encoding": response.headers.get("content-encoding", "identity"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_child(args)))
+        return
+
+    print(f"{'mode':<10} {'cpu ms/req':>10} {'wall ms/req':>11} {'serialize ms':>12} {'bytes':>8}")
+    for mode in args.modes.split(","):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--requests", str(args.requests)],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        row = json.loads(output)
+        if "skipped" in row:
+            print(f"{mode:<10} skipped: {row['skipped']}")
+            continue
+        print(f"{mode:<10} {row['cpu_ms_per_request']:>10} {row['wall_ms_per_request']:>11} {row['serialize_ms']:>12} {row['bytes']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+カテゴリ別スポット数（category_stats テーブル）の維持
+- ORM で spots を追加・更新・削除したとき、同じトランザクション内で件数を加減する
+- 一覧は件数テーブルを読むだけなので、カテゴリ数に比例した処理で済む
+- 読み出し結果はプロセス内にキャッシュし、件数が変わったコミットで破棄する
+  （spots のバージョンを渡せば、他ワーカーの更新もバージョン違いとして検出できる）
+"""
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Mapping, Optional
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from models import CategoryStat, Spot
+
+# 他ワーカーの更新も一定時間で反映されるようにTTLを付ける
+_cache = TTLCache(max_size=4, ttl_seconds=float(os.getenv("CATEGORY_CACHE_TTL_SECONDS", "30")))
+
+
+def apply_deltas(connection, deltas: Mapping[str, int]) -> None:
+    """カテゴリごとの増減を反映（行がなければ作成）"""
+    deltas = {category: delta for category, delta in deltas.items() if category and delta}
+    if not deltas:
+        return
+
+    now = datetime.now(timezone.utc)
+    table = CategoryStat.__table__
+    dialect = connection.dialect.name
+
+    for category, delta in deltas.items():
+        if dialect in ("sqlite", "mysql"):
+            if dialect == "sqlite":
+                stmt = sqlite_insert(table).values(category=category, spot_count=delta, updated_at=now)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.category],
+                    set_={"spot_count": table.c.spot_count + delta, "updated_at": now},
+                )
+            else:
+                stmt = mysql_insert(table).values(category=category, spot_count=delta, updated_at=now)
+                stmt = stmt.on_duplicate_key_update(
+                    spot_count=table.c.spot_count + delta, updated_at=now
+                )
+            connection.execute(stmt)
+        else:
+            result = connection.execute(
+                update(table).where(table.c.category == category)
+                .values(spot_count=table.c.spot_count + delta, updated_at=now)
+            )
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(category=category, spot_count=delta, updated_at=now))
+
+
+def rebuild(connection) -> None:
+    """spots から件数を集計し直す"""
+    table = CategoryStat.__table__
+    connection.execute(table.delete())
+    rows = connection.execute(
+        select(Spot.category, func.count()).where(Spot.category.isnot(None)).group_by(Spot.category)
+    ).all()
+    now = datetime.now(timezone.utc)
+    if rows:
+        connection.execute(table.insert(), [
+            {"category": category, "spot_count": count, "updated_at": now}
+            for category, count in rows
+        ])
+    invalidate()
+
+
+def create_category_stats(engine) -> None:
+    """起動時：件数テーブルが空で spots があれば集計しておく"""
+    with engine.begin() as conn:
+        has_stats = conn.execute(select(CategoryStat.category).limit(1)).first()
+        has_spots = conn.execute(select(Spot.id).limit(1)).first()
+        if not has_stats and has_spots:
+            rebuild(conn)
+
+
+def invalidate() -> None:
+    _cache.clear()
+
+
+def get_counts(db: Session, spots_version: Optional[int] = None) -> Dict[str, int]:
+    """カテゴリ → スポット数（0件のカテゴリは含まない）"""
+    key = ("counts", spots_version)
+    counts = _cache.get(key)
+    if counts is None:
+        counts = dict(
+            db.query(CategoryStat.category, CategoryStat.spot_count)
+            .filter(CategoryStat.spot_count > 0)
+            .all()
+        )
+        _cache.set(key, counts)
+    return counts
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+
+# ORM の flush で spots の増減を集計し、同じトランザクションで反映する
+@event.listens_for(Session, "after_flush")
+def _track_category_changes(session, flush_context):
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Spot):
+            deltas[obj.category] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Spot):
+            history = inspect(obj).attrs.category.history
+            deltas[(history.deleted or [obj.category])[0]] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Spot) and obj not in session.deleted:
+            history = inspect(obj).attrs.category.history
+            if history.has_changes():
+                for old in history.deleted:
+                    deltas[old] -= 1
+                for new in history.added:
+                    deltas[new] += 1
+
+    deltas = {category: delta for category, delta in deltas.items() if category and delta}
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+        session.info["categories_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("categories_changed", False):
+        invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_on_rollback(session):
+    session.info.pop("categories_changed", None)
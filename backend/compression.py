@@ -0,0 +1,145 @@
+"""
+レスポンス圧縮（gzip / brotli）の ASGI ミドルウェア
+- Accept-Encoding に br があり brotli が入っていれば br、なければ gzip
+- 一定サイズ（COMPRESSION_MINIMUM_SIZE）未満の小さなレスポンスは圧縮しない
+- ストリーミングレスポンスはチャンクごとに圧縮して流す
+- 圧縮しうるレスポンスには、実際に圧縮したかどうか（小さい・Accept-Encoding なし）に関係なく
+  Vary: Accept-Encoding を付ける（共有キャッシュが圧縮版と非圧縮版を取り違えないように）
+- RESPONSE_COMPRESSION=off で無効
+"""
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli はなくても gzip で動く
+    brotli = None
+
+ENABLED = os.getenv("RESPONSE_COMPRESSION", "on") != "off"
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))  # 動的圧縮なので速さ優先
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "text/")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding から使う圧縮方式を選ぶ（br > gzip）"""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip形式
+
+    def compress(self, data: bytes) -> bytes:
+        """途中のチャンク（クライアントがすぐ読めるように flush する）"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # 圧縮しない場合も Vary を付けるために送信を通す
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        responder = _CompressingSender(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+class _CompressingSender:
+    def __init__(self, send, encoding: Optional[str], minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    def _should_compress(self, headers: MutableHeaders) -> bool:
+        status = self.start_message["status"]
+        if status < 200 or status in (204, 304) or "content-encoding" in headers:
+            return False
+        return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+    def _add_vary(self, headers: MutableHeaders) -> None:
+        """圧縮しうるレスポンスなら Vary を付ける（304 は 200 と同じ Vary を返す）"""
+        if self.start_message["status"] == 304 or self._should_compress(headers):
+            headers.add_vary_header("Accept-Encoding")
+
+    def _set_encoding_headers(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        # 圧縮後は同じバイト列ではないので弱い ETag にする（If-None-Match は弱い比較）
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            self._add_vary(headers)
+            small = not more_body and len(body) < self.minimum_size
+            if self.encoding is None or small or not self._should_compress(headers):
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding)
+            self._set_encoding_headers(headers)
+            if not more_body:
+                # 1回で返るレスポンスはまとめて圧縮して Content-Length を付け直す
+                body = self.compressor.finish(body)
+                headers["Content-Length"] = str(len(body))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            del headers["Content-Length"]
+            await self.send(self.start_message)
+
+        body = self.compressor.compress(body) if more_body else self.compressor.finish(body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,70 @@
+"""
+条件付きGET（ETag / Last-Modified / 304）
+- データのバージョンから ETag を作り、If-None-Match が一致すれば
+  ORM の読み込みやシリアライズをせずに 304 を返す
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+# ブラウザ・nginx にキャッシュさせつつ、毎回再検証させる
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def http_date(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # DBの日時はUTC
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match は弱い比較（W/ の有無は無視）
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """キャッシュが有効なら 304 レスポンスを返す（無効なら None）"""
+    headers = cache_headers(etag, last_modified)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return None
+
+    # If-None-Match がないときだけ If-Modified-Since を見る
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        if last_modified.replace(microsecond=0) <= since:
+            return Response(status_code=304, headers=headers)
+    return None
+
+
+def set_cache_headers(response: Response, etag: str, last_modified: Optional[datetime] = None) -> None:
+    response.headers.update(cache_headers(etag, last_modified))
@@ -0,0 +1,112 @@
+"""
+スポット・投稿のエクスポート（NDJSON / CSV のストリーミング）
+- サーバーサイドカーソル（stream_results）で少しずつ読み、BATCH_SIZE 行ごとに書き出す
+- 全件をメモリに載せないので、テーブルの大きさに関係なくメモリ使用量は一定
+- スポットの出力は spot_import.py でそのまま取り込める列名
+- スポットは viewer_id のユーザーから見えるものだけ（自分の投稿・public・フレンドの private 以外）
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, select, union
+
+import feed
+import posts_db
+import spatial
+from models import Friendship, Spot, User
+
+BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+SPOT_COLUMNS = (
+    "id", "title", "description", "category", "latitude", "longitude", "rating",
+    "address", "visibility", "owner_id", "owner_name", "created_at", "updated_at",
+)
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_batches(columns: Sequence[str], batches: Iterable[Sequence[tuple]], fmt: str) -> Iterator[bytes]:
+    """行のまとまりごとに NDJSON / CSV のバイト列を返す"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(tuple(_plain(value) for value in row) for row in rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+        return
+
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+
+
+def visible_to(query, viewer_id: int):
+    """viewer_id から見えるスポットに絞る（フィードと同じく、フレンドの投稿は private 以外）"""
+    friend_ids = union(
+        select(Friendship.requested_id).where(Friendship.requester_id == viewer_id, Friendship.status == "accepted"),
+        select(Friendship.requester_id).where(Friendship.requested_id == viewer_id, Friendship.status == "accepted"),
+    )
+    return query.where(or_(
+        Spot.owner_id == viewer_id,
+        Spot.visibility == "public",
+        and_(Spot.visibility != feed.HIDDEN_VISIBILITY, Spot.owner_id.in_(friend_ids)),
+    ))
+
+
+def export_spots(
+    engine,
+    fmt: str,
+    category: Optional[str] = None,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    batch_size: int = BATCH_SIZE,
+    viewer_id: Optional[int] = None,
+) -> Iterator[bytes]:
+    """条件に合うスポットを id 順に書き出す（bbox は south, north, west, east。viewer_id=None はすべて）"""
+    query = (
+        select(
+            Spot.id, Spot.title, Spot.description, Spot.category, Spot.latitude, Spot.longitude,
+            Spot.rating, Spot.address, Spot.visibility, Spot.owner_id, User.display_name,
+            Spot.created_at, Spot.updated_at,
+        )
+        .outerjoin(User, User.id == Spot.owner_id)
+        .order_by(Spot.id)
+    )
+    if category:
+        query = query.where(Spot.category == category)
+    if bbox:
+        query = spatial.filter_bbox(query, engine.dialect.name == "sqlite", *bbox)
+    if viewer_id is not None:
+        query = visible_to(query, viewer_id)
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+        yield from encode_batches(SPOT_COLUMNS, result.partitions(batch_size), fmt)
+
+
+def export_posts(fmt: str, label: Optional[str] = None, batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """posts を id 順に書き出す（列は posts テーブルのまま）"""
+    sql = "SELECT * FROM posts"
+    params = []
+    if label:
+        sql += " WHERE label = ?"
+        params.append(label)
+    sql += " ORDER BY id"
+
+    with posts_db.connection() as conn:
+        cursor = conn.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        yield from encode_batches(columns, iter(lambda: cursor.fetchmany(batch_size), []), fmt)
@@ -1,34 +1,166 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 import os
 
+import profiling
+
 load_dotenv()
 
 # 環境変数DATABASE_URLを使う。なければSQLiteをデフォルトに
 DATABASE_URL = os.getenv(
-    "DATABASE_URL", 
+    "DATABASE_URL",
     "sqlite:///./data/spots.db"
 )
 
+# リクエスト処理のDBアクセス方式
+# sync : 同期ドライバ + スレッドプール（デフォルト）
+# async: 非同期ドライバ（aiosqlite / aiomysql）
+DB_MODE = os.getenv("DB_MODE", "sync")
+
+# SQLiteの接続設定
+# default   : SQLiteの初期設定のまま
+# production: WAL（読み込みが書き込みを待たない）+ キャッシュ・mmap・ロック待ち
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default")
+
+SQLITE_PRODUCTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+    f"PRAGMA cache_size={-int(os.getenv('SQLITE_CACHE_KB', '65536'))}",  # 負の値はKB指定
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+    "PRAGMA temp_store=MEMORY",
+]
+
+def apply_sqlite_pragmas(dbapi_connection) -> None:
+    """SQLITE_PROFILE=production のとき接続ごとにPRAGMAを設定（posts.db でも使う）"""
+    if SQLITE_PROFILE != "production":
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRODUCTION_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+def _on_sqlite_connect(dbapi_connection, connection_record):
+    apply_sqlite_pragmas(dbapi_connection)
+    # 半径検索で距離順に並べる関数（spatial.py。models を読み込むのでここで import）
+    from spatial import register_sqlite_functions
+    register_sqlite_functions(dbapi_connection)
+
 # MySQLの場合はconnect_args不要、SQLiteは特別対応
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 )
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _on_sqlite_connect)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+def to_async_url(url: str) -> str:
+    """同期用のURLを非同期ドライバのURLに変換"""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    drivers = {"sqlite": "aiosqlite", "mysql": "aiomysql"}
+    if dialect not in drivers:
+        raise ValueError(f"DB_MODE=async は {dialect} に対応していません")
+    return f"{dialect}+{drivers[dialect]}{sep}{rest}"
+
+
+if DB_MODE == "async":
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+    async_engine = create_async_engine(ASYNC_DATABASE_URL)
+    if async_engine.dialect.name == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", _on_sqlite_connect)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+    # リクエスト処理が実際に使うエンジン（イベント登録用）
+    request_engine = async_engine.sync_engine
+elif DB_MODE == "sync":
+    async_engine = None
+    AsyncSessionLocal = None
+    request_engine = engine
+else:
+    raise ValueError(f"DB_MODE は sync / async のどちらかです: {DB_MODE}")
+
+
 # DBセッション取得用
-def get_db():
+def _get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+async def _get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+get_db = _get_async_db if DB_MODE == "async" else _get_sync_db
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """DB処理 fn(session, *args) をイベントループを塞がずに実行する
+
+    - sync : スレッドプールで実行
+    - async: AsyncSession.run_sync で実行（I/Oは非同期ドライバ）
+    async では fn の外で遅延ロードできないので、リレーションなどは
+    fn の中でレスポンス用の値に変換してから返すこと
+    """
+    # プロファイラがスレッド上の処理をこのリクエストのものとして数えられるように
+    fn = profiling.track_thread(fn)
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def add_missing_columns(bind) -> None:
+    """既存テーブルにモデルで追加した列を足す（create_all は既存テーブルを変更しないため）
+
+    NULL許容の列、または server_default のある列のみ想定
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                    if column.server_default is not None:
+                        ddl += f" DEFAULT {column.server_default.arg}"
+                        if not column.nullable:
+                            ddl += " NOT NULL"
+                    conn.execute(text(ddl))
+
+
+def create_missing_indexes(bind) -> None:
+    """既存テーブルにモデルで追加したインデックスを作成（create_all は既存テーブルに追加しないため）"""
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
 # テーブル作成（初回のみ実行）
 def create_tables():
+    add_missing_columns(engine)
     Base.metadata.create_all(bind=engine)
+    create_missing_indexes(engine)
+    # SQLiteの空間インデックス（R*Tree）・ユーザー検索用の全文インデックス・カテゴリ件数・更新バージョン・フィード
+    from spatial import create_spatial_index
+    from user_search import create_user_search_index
+    from category_stats import create_category_stats
+    from versions import create_table_versions
+    from feed import create_feed
+    create_spatial_index(engine)
+    create_user_search_index(engine)
+    create_category_stats(engine)
+    create_table_versions(engine)
+    create_feed(engine)
@@ -0,0 +1,226 @@
+"""
+フレンドのフィード（フレンドが投稿したスポットの新着順）
+- 通常のユーザー: 投稿時に各フレンドのタイムライン（timeline_entries）へ書き込む（fan-out on write）
+- フレンドが FEED_FANOUT_MAX_FRIENDS 人を超えるユーザー（feed_pull_users）:
+  書き込み時には配らず、フィードを読むときに投稿を直接取りに行く（fan-out on read）
+- フレンドの承認・削除でタイムラインを作り直す（承認: 最近の投稿を配る / 削除: 取り除く）
+- visibility=private の投稿はフィードに出さない
+"""
+import os
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, literal, or_, select, union_all
+from sqlalchemy.orm import Session
+
+import pagination
+from friend_graph import friend_graph
+from models import FeedPullUser, Friendship, Spot, TimelineEntry
+
+# これより多くのフレンドがいるユーザーの投稿は読み込み時に取りに行く
+FANOUT_MAX_FRIENDS = int(os.getenv("FEED_FANOUT_MAX_FRIENDS", "1000"))
+# フレンドになったときにタイムラインへ入れる、相手の最近の投稿数
+BACKFILL_PER_AUTHOR = int(os.getenv("FEED_BACKFILL_PER_AUTHOR", "100"))
+
+HIDDEN_VISIBILITY = "private"
+
+
+def _friends_of(user_id):
+    """user_id のフレンドIDを返す select（accepted のみ）"""
+    return union_all(
+        select(Friendship.requested_id.label("friend_id")).where(
+            Friendship.requester_id == user_id, Friendship.status == "accepted"
+        ),
+        select(Friendship.requester_id.label("friend_id")).where(
+            Friendship.requested_id == user_id, Friendship.status == "accepted"
+        ),
+    ).subquery()
+
+
+def _insert_entries(connection, readers, spots) -> None:
+    """readers（friend_id 列）× spots（id, owner_id, created_at 列）をタイムラインに追加（重複は無視）"""
+    table = TimelineEntry.__table__
+    rows = select(readers.c.friend_id, spots.c.id, spots.c.owner_id, spots.c.created_at).select_from(
+        readers.join(spots, literal(True))
+    )
+    stmt = (
+        insert(table)
+        .from_select(["user_id", "spot_id", "author_id", "created_at"], rows)
+        .prefix_with("OR IGNORE", dialect="sqlite")
+        .prefix_with("IGNORE", dialect="mysql")
+    )
+    connection.execute(stmt)
+
+
+def _spots_where(*conditions, recent: Optional[int] = None):
+    query = select(Spot.id, Spot.owner_id, Spot.created_at).where(*conditions)
+    if recent is not None:
+        query = query.order_by(Spot.created_at.desc(), Spot.id.desc()).limit(recent)
+    return query.subquery()
+
+
+def is_pull_user(connection, user_id: int) -> bool:
+    return connection.execute(
+        select(FeedPullUser.user_id).where(FeedPullUser.user_id == user_id)
+    ).first() is not None
+
+
+def fan_out_spots(connection, author_id: int, spot_ids: Iterable[int]) -> None:
+    """投稿したスポットをフレンドのタイムラインに配る（フレンドが多いユーザーは配らない）"""
+    spot_ids = list(spot_ids)
+    if not spot_ids or is_pull_user(connection, author_id):
+        return
+    _insert_entries(connection, _friends_of(author_id), _spots_where(Spot.id.in_(spot_ids)))
+
+
+def fan_out_after(connection, author_id: int, after_spot_id: int) -> None:
+    """after_spot_id より後に author_id が投稿したスポットを配る（一括取り込み用）"""
+    if is_pull_user(connection, author_id):
+        return
+    _insert_entries(
+        connection, _friends_of(author_id),
+        _spots_where(Spot.owner_id == author_id, Spot.id > after_spot_id),
+    )
+
+
+def _update_pull_status(connection, user_id: int) -> None:
+    """フレンド数に応じて fan-out on read の対象に入れる・外す"""
+    friends = _friends_of(user_id)
+    count = connection.execute(select(func.count()).select_from(friends)).scalar()
+    pull = count > FANOUT_MAX_FRIENDS
+    was_pull = is_pull_user(connection, user_id)
+
+    if pull and not was_pull:
+        # 配り済みの分は残しておく（読み込み時に重複は除く）
+        connection.execute(insert(FeedPullUser.__table__).values(user_id=user_id))
+    elif was_pull and not pull:
+        # 配る側に戻るので、最近の投稿を全フレンドに配り直す
+        connection.execute(delete(FeedPullUser.__table__).where(FeedPullUser.user_id == user_id))
+        _insert_entries(
+            connection, _friends_of(user_id),
+            _spots_where(Spot.owner_id == user_id, recent=BACKFILL_PER_AUTHOR),
+        )
+
+
+def on_friendship_added(connection, user_a: int, user_b: int) -> None:
+    """フレンド承認時：お互いの最近の投稿をタイムラインに入れる（コミット前に呼ぶ）"""
+    _update_pull_status(connection, user_a)
+    _update_pull_status(connection, user_b)
+    for reader_id, author_id in ((user_a, user_b), (user_b, user_a)):
+        if is_pull_user(connection, author_id):
+            continue
+        reader = select(literal(reader_id).label("friend_id")).subquery()
+        _insert_entries(
+            connection, reader,
+            _spots_where(Spot.owner_id == author_id, recent=BACKFILL_PER_AUTHOR),
+        )
+
+
+def on_friendship_removed(connection, user_a: int, user_b: int) -> None:
+    """フレンド削除時：お互いの投稿をタイムラインから取り除く（コミット前に呼ぶ）"""
+    table = TimelineEntry.__table__
+    connection.execute(delete(table).where(or_(
+        and_(table.c.user_id == user_a, table.c.author_id == user_b),
+        and_(table.c.user_id == user_b, table.c.author_id == user_a),
+    )))
+    _update_pull_status(connection, user_a)
+    _update_pull_status(connection, user_b)
+
+
+def rebuild(connection) -> None:
+    """friendships と spots からタイムラインを作り直す"""
+    connection.execute(delete(TimelineEntry.__table__))
+    connection.execute(delete(FeedPullUser.__table__))
+
+    sides = union_all(
+        select(Friendship.requester_id.label("user_id")).where(Friendship.status == "accepted"),
+        select(Friendship.requested_id.label("user_id")).where(Friendship.status == "accepted"),
+    ).subquery()
+    counts = connection.execute(
+        select(sides.c.user_id, func.count()).group_by(sides.c.user_id)
+    ).all()
+    pull_ids = [user_id for user_id, count in counts if count > FANOUT_MAX_FRIENDS]
+    if pull_ids:
+        connection.execute(insert(FeedPullUser.__table__), [{"user_id": user_id} for user_id in pull_ids])
+
+    pull_ids = set(pull_ids)
+    for author_id, _ in counts:
+        if author_id not in pull_ids:
+            _insert_entries(
+                connection, _friends_of(author_id),
+                _spots_where(Spot.owner_id == author_id, recent=BACKFILL_PER_AUTHOR),
+            )
+
+
+def create_feed(engine) -> None:
+    """起動時：タイムラインが空でフレンド関係があれば作っておく（既存DB向け）"""
+    with engine.begin() as conn:
+        has_entries = conn.execute(select(TimelineEntry.user_id).limit(1)).first()
+        has_friends = conn.execute(
+            select(Friendship.id).where(Friendship.status == "accepted").limit(1)
+        ).first()
+        has_spots = conn.execute(select(Spot.id).limit(1)).first()
+        if not has_entries and has_friends and has_spots:
+            rebuild(conn)
+
+
+def get_feed_page(db: Session, user_id: int, cursor: Optional[str], limit: int) -> Tuple[List[int], Optional[str]]:
+    """フィード1ページ分のスポットID（新着順）と次のカーソル"""
+    friend_ids = friend_graph.get_friend_ids(db, user_id)
+    if not friend_ids:
+        return [], None
+
+    # 1. タイムライン（書き込み時に配られた分）
+    pushed = pagination.apply_created_cursor(
+        db.query(TimelineEntry.spot_id, TimelineEntry.created_at)
+        .join(Spot, Spot.id == TimelineEntry.spot_id)
+        .filter(TimelineEntry.user_id == user_id, Spot.visibility != HIDDEN_VISIBILITY),
+        cursor, TimelineEntry.created_at, TimelineEntry.spot_id,
+    ).limit(limit + 1).all()
+
+    # 2. フレンドが多いユーザーの投稿（読み込み時に取りに行く）
+    pull_ids = [
+        pull_id for (pull_id,) in
+        db.query(FeedPullUser.user_id).filter(FeedPullUser.user_id.in_(friend_ids))
+    ]
+    pulled = []
+    if pull_ids:
+        pulled = pagination.apply_created_cursor(
+            db.query(Spot.id, Spot.created_at)
+            .filter(Spot.owner_id.in_(pull_ids), Spot.visibility != HIDDEN_VISIBILITY),
+            cursor,
+        ).limit(limit + 1).all()
+
+    # 新着順にマージ（pull に切り替わる前に配られた分は重複するので除く）
+    merged = {}
+    for spot_id, created_at in [*pushed, *pulled]:
+        merged[spot_id] = created_at
+    ordered = sorted(merged.items(), key=lambda item: (item[1], item[0]), reverse=True)
+    page, has_more = pagination.page_after(ordered, limit)
+
+    next_cursor = None
+    if has_more:
+        last_id, last_created = page[-1]
+        next_cursor = pagination.encode_cursor("created", last_created.isoformat(), last_id)
+    return [spot_id for spot_id, _ in page], next_cursor
+
+
+# ORM でスポットを追加・削除したとき、同じトランザクションでタイムラインに反映する
+@event.listens_for(Session, "before_flush")
+def _remove_deleted_spots(session, flush_context, instances):
+    # スポットより先に消す（外部キー制約のあるDB向け）
+    deleted_ids = [obj.id for obj in session.deleted if isinstance(obj, Spot)]
+    if deleted_ids:
+        session.connection().execute(
+            delete(TimelineEntry.__table__).where(TimelineEntry.spot_id.in_(deleted_ids))
+        )
+
+
+@event.listens_for(Session, "after_flush")
+def _fan_out_on_flush(session, flush_context):
+    new_by_author = defaultdict(list)
+    for obj in session.new:
+        if isinstance(obj, Spot):
+            new_by_author[obj.owner_id].append(obj.id)
+    for author_id, spot_ids in new_by_author.items():
+        fan_out_spots(session.connection(), author_id, spot_ids)
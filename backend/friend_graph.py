@@ -0,0 +1,149 @@
+"""
+フレンド関係（accepted）の隣接リストキャッシュ
+- ユーザーごとにフレンドIDの集合をプロセス内に保持（LRUで上限あり・FRIEND_GRAPH_TTL 秒で読み直し）
+- 承認・削除・拒否のときに差分だけ更新する
+- are_friends(a, b) はキャッシュ済みならDBに触れずに判定できる
+- 読み込み中に承認・削除があったユーザーは、読み込んだ（古いかもしれない）集合をキャッシュしない
+  （ユーザーごとの更新世代で判定。add/remove_friendship はコミット後に呼ぶこと）
+
+※ プロセス内キャッシュなので、複数ワーカー構成では他ワーカーの更新は
+  TTL が切れるかエントリがLRUで追い出されるまで反映されない
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+import models
+
+DEFAULT_MAX_USERS = int(os.getenv("FRIEND_GRAPH_CACHE_SIZE", "10000"))
+DEFAULT_TTL = float(os.getenv("FRIEND_GRAPH_TTL", "300"))
+
+
+class FriendGraphCache:
+    def __init__(self, max_users: int = DEFAULT_MAX_USERS, ttl: float = DEFAULT_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        # ユーザーID → (フレンドID集合, 読み込んだ時刻)
+        self._adjacency: "OrderedDict[int, Tuple[set, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        # 承認・削除のたびに進める世代と、ユーザーごとの最後に変わった世代
+        self._generation = 0
+        self._changed: "OrderedDict[int, int]" = OrderedDict()
+        # _changed から追い出した中で一番新しい世代（これより前に始まった読み込みはキャッシュしない）
+        self._forgotten_generation = 0
+
+    def __len__(self) -> int:
+        return len(self._adjacency)
+
+    def _touch(self, user_id: int) -> Optional[set]:
+        entry = self._adjacency.get(user_id)
+        if entry is None:
+            return None
+        friends, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            del self._adjacency[user_id]
+            return None
+        self._adjacency.move_to_end(user_id)
+        return friends
+
+    def _store(self, user_id: int, friend_ids: set) -> None:
+        self._adjacency[user_id] = (friend_ids, time.monotonic())
+        self._adjacency.move_to_end(user_id)
+        while len(self._adjacency) > self.max_users:
+            self._adjacency.popitem(last=False)
+
+    def _mark_changed(self, *user_ids: int) -> None:
+        self._generation += 1
+        for user_id in user_ids:
+            self._changed[user_id] = self._generation
+            self._changed.move_to_end(user_id)
+        while len(self._changed) > self.max_users:
+            _, generation = self._changed.popitem(last=False)
+            self._forgotten_generation = generation
+
+    def _changed_since(self, user_id: int, generation: int) -> bool:
+        return self._changed.get(user_id, 0) > generation or self._forgotten_generation > generation
+
+    def cached_friend_ids(self, user_id: int) -> Optional[FrozenSet[int]]:
+        """キャッシュにあればフレンドID集合を返す（なければ None）"""
+        with self._lock:
+            friends = self._touch(user_id)
+            return frozenset(friends) if friends is not None else None
+
+    def get_friend_ids(self, db: Session, user_id: int) -> FrozenSet[int]:
+        with self._lock:
+            friends = self._touch(user_id)
+            if friends is not None:
+                return frozenset(friends)
+            started = self._generation
+
+        # DBの読み込みはロックの外で（他のユーザーの判定を待たせない）
+        rows = db.query(models.Friendship.requester_id, models.Friendship.requested_id).filter(
+            or_(
+                models.Friendship.requester_id == user_id,
+                models.Friendship.requested_id == user_id
+            ),
+            models.Friendship.status == "accepted"
+        ).all()
+        loaded = {requested if requester == user_id else requester for requester, requested in rows}
+
+        with self._lock:
+            # 他のリクエストが先に読み込んでいたらそちらを使う
+            friends = self._touch(user_id)
+            if friends is not None:
+                return frozenset(friends)
+            # 読み込み中に承認・削除があった → 古い集合かもしれないのでキャッシュしない
+            if not self._changed_since(user_id, started):
+                self._store(user_id, loaded)
+            return frozenset(loaded)
+
+    def are_friends(self, user_a: int, user_b: int, db: Optional[Session] = None) -> bool:
+        """どちらかのユーザーがキャッシュ済みなら O(1)。未キャッシュなら db から読み込む"""
+        with self._lock:
+            for user_id, other_id in ((user_a, user_b), (user_b, user_a)):
+                friends = self._touch(user_id)
+                if friends is not None:
+                    return other_id in friends
+        if db is None:
+            raise LookupError(f"user {user_a} と {user_b} はキャッシュされていません")
+        return user_b in self.get_friend_ids(db, user_a)
+
+    def add_friendship(self, user_a: int, user_b: int) -> None:
+        """承認時（コミット後）：キャッシュ済みのユーザーにだけ反映（未キャッシュは次回DBから読む）"""
+        with self._lock:
+            self._mark_changed(user_a, user_b)
+            for user_id, other_id in ((user_a, user_b), (user_b, user_a)):
+                entry = self._adjacency.get(user_id)
+                if entry is not None:
+                    entry[0].add(other_id)
+
+    def remove_friendship(self, user_a: int, user_b: int) -> None:
+        """削除・拒否時（コミット後）"""
+        with self._lock:
+            self._mark_changed(user_a, user_b)
+            for user_id, other_id in ((user_a, user_b), (user_b, user_a)):
+                entry = self._adjacency.get(user_id)
+                if entry is not None:
+                    entry[0].discard(other_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._adjacency.clear()
+            self._changed.clear()
+            # 読み込み中のものはキャッシュさせない
+            self._forgotten_generation = self._generation
+
+
+friend_graph = FriendGraphCache()
+
+
+def are_friends(db: Session, user_a: int, user_b: int) -> bool:
+    """他のルーターから使うフレンド判定"""
+    if user_a == user_b:
+        return False
+    return friend_graph.are_friends(user_a, user_b, db)
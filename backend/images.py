@@ -0,0 +1,220 @@
+"""
+スポット画像の保存・サムネイル作成
+- アップロードはチャンクごとにディスクへ書きながら SHA-256 を計算し、
+  内容のハッシュをファイル名にして保存（同じ画像は1つだけ保存される）
+- WebP サムネイル（THUMBNAIL_SIZES）はプロセスプールで作成し、リクエストを待たせない
+- ファイル名が内容で決まるので、配信時は長期キャッシュ（immutable）にできる
+- Pillow が入っていなければサムネイルは作らず元画像を返す
+"""
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow がなくてもアップロード・配信はできる
+    Image = None
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "data/images")
+THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv("THUMBNAIL_SIZES", "160,480,1080").split(","))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "10")) * 1024 * 1024
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+CHUNK_SIZE = 64 * 1024
+# nginx の internal location（例: /_images/ → IMAGE_DIR）を指定すると、
+# X-Accel-Redirect で nginx に sendfile で配信させる
+ACCEL_REDIRECT_PREFIX = os.getenv("IMAGE_ACCEL_REDIRECT_PREFIX")
+
+# 内容のハッシュがファイル名なので、同じURLの中身は変わらない
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# サムネイル作成前に元画像を返すときは短めに
+FALLBACK_CACHE_CONTROL = "public, max-age=60"
+
+# 先頭バイト → 拡張子
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+
+MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _detect_extension(head: bytes) -> Optional[str]:
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def original_path(filename: str) -> str:
+    # 1ディレクトリのファイル数が増えすぎないようにハッシュの先頭2文字で分ける
+    return os.path.join(IMAGE_DIR, "originals", filename[:2], filename)
+
+
+def thumbnail_filename(digest: str, size: int) -> str:
+    return f"{digest}_{size}.webp"
+
+
+def thumbnail_path(digest: str, size: int) -> str:
+    return os.path.join(IMAGE_DIR, "thumbs", digest[:2], thumbnail_filename(digest, size))
+
+
+def store_upload(source: BinaryIO) -> Tuple[str, bool]:
+    """アップロードされたファイルを保存し、(ファイル名, 新規保存したか) を返す（同期処理）"""
+    tmp_dir = os.path.join(IMAGE_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"画像は{MAX_UPLOAD_BYTES // (1024 * 1024)}MBまでです"
+                    )
+                if len(head) < 16:
+                    head += chunk[:16]
+                digest.update(chunk)
+                out.write(chunk)
+
+        extension = _detect_extension(head)
+        if extension is None:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="JPEG / PNG / GIF / WebP の画像を送ってください"
+            )
+
+        filename = f"{digest.hexdigest()}.{extension}"
+        path = original_path(filename)
+        if os.path.exists(path):
+            return filename, False  # 同じ内容の画像は保存済み
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return filename, True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def discard(filename: str) -> None:
+    """保存した元画像を消す（参照されなかったアップロード用）"""
+    try:
+        os.remove(original_path(filename))
+    except FileNotFoundError:
+        pass
+
+
+def thumbnails_missing(filename: str) -> bool:
+    """まだ作成されていないサイズのサムネイルがあるか"""
+    digest = filename.split(".")[0]
+    return any(not os.path.exists(thumbnail_path(digest, size)) for size in THUMBNAIL_SIZES)
+
+
+def make_thumbnails(source_path: str, digest: str, sizes: Tuple[int, ...]) -> List[str]:
+    """元画像から各サイズの WebP サムネイルを作成（プロセスプールで実行）"""
+    created = []
+    with Image.open(source_path) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        for size in sizes:
+            path = thumbnail_path(digest, size)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size))
+            # 書き込み途中のファイルを配信しないように一時ファイル経由で置き換える
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            thumbnail.save(tmp_path, "WEBP", quality=80, method=4)
+            os.replace(tmp_path, path)
+            created.append(path)
+    return created
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _pool
+
+
+def _log_failure(future) -> None:
+    error = future.exception()
+    if error is not None:
+        print("サムネイル作成失敗:", error)
+
+
+def schedule_thumbnails(filename: str):
+    """サムネイル作成をプロセスプールに投げる（完了は待たない）。Pillow がなければ何もしない"""
+    if Image is None:
+        return None
+    digest = filename.split(".")[0]
+    future = _get_pool().submit(make_thumbnails, original_path(filename), digest, THUMBNAIL_SIZES)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def shutdown() -> None:
+    """アプリ終了時にプロセスプールを止める（次に使うときは作り直す）"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def image_urls(filename: Optional[str]) -> Optional[Dict[str, str]]:
+    """元画像とサムネイルのURL"""
+    if not filename:
+        return None
+    digest = filename.split(".")[0]
+    urls = {"original": f"/api/spots/images/{filename}"}
+    for size in THUMBNAIL_SIZES:
+        urls[str(size)] = f"/api/spots/images/{thumbnail_filename(digest, size)}"
+    return urls
+
+
+def resolve(filename: str) -> Tuple[str, str, bool]:
+    """配信するファイル名 → (パス, Content-Type, 長期キャッシュしてよいか)
+
+    サムネイルがまだなければ元画像を返す（短いキャッシュ）
+    """
+    name, _, extension = filename.rpartition(".")
+    digest, _, size = name.partition("_")
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest) or extension not in MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+
+    if not size:
+        path = original_path(filename)
+        if os.path.exists(path):
+            return path, MEDIA_TYPES[extension], True
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+
+    if not size.isdigit() or int(size) not in THUMBNAIL_SIZES or extension != "webp":
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+    path = thumbnail_path(digest, int(size))
+    if os.path.exists(path):
+        return path, MEDIA_TYPES["webp"], True
+
+    for original_extension in ("jpg", "png", "gif", "webp"):
+        fallback = original_path(f"{digest}.{original_extension}")
+        if os.path.exists(fallback):
+            return fallback, MEDIA_TYPES[original_extension], False
+    raise HTTPException(status_code=404, detail="画像が見つかりません")
@@ -0,0 +1,159 @@
+"""
+スポットのいいね数（write-behind）
+- いいね・取り消しは spot_likes の INSERT / DELETE（(spot_id, user_id) のユニークインデックスで重複なし）
+- spots.like_count はリクエストごとには更新せず、プロセス内に増減を溜めて
+  LIKE_FLUSH_INTERVAL 秒ごとに1トランザクションでまとめて UPDATE する
+  → 人気スポットにいいねが集中しても、spots の同じ行のロックを取り合わない
+- アプリ終了時（main.py の shutdown）に残りを書き込む
+- スポットを ORM で削除すると、同じトランザクションで spot_likes も削除し、コミット後に書き込み待ちの増減を捨てる
+- like_count はフラッシュまでの間（最大 LIKE_FLUSH_INTERVAL 秒）少し古い値になる
+- フラッシュでは table_versions も updated_at も進めない（いいねのたびに一覧・詳細の ETag が変わらないように）
+  → 304 で返したキャッシュの like_count は、スポット自体が次に更新されるまで古いことがある
+
+※ プロセス内のバッファなので、プロセスが強制終了するとフラッシュ前の増減は失われる。
+  spot_likes の件数から作り直せる（recount）
+"""
+import asyncio
+import os
+import threading
+from collections import Counter
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, delete, event, func, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import versions
+from models import Spot, SpotLike
+
+FLUSH_INTERVAL = float(os.getenv("LIKE_FLUSH_INTERVAL", "1.0"))
+
+
+class LikeCounterBuffer:
+    """スポットごとのいいね数の増減を溜めておく"""
+
+    def __init__(self):
+        self._pending: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, spot_id: int, delta: int) -> None:
+        with self._lock:
+            self._pending[spot_id] += delta
+
+    def pending(self, spot_id: int) -> int:
+        """まだ書き込んでいない増減"""
+        with self._lock:
+            return self._pending.get(spot_id, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+
+    def discard(self, spot_ids: Iterable[int]) -> None:
+        """削除したスポットの増減を捨てる"""
+        with self._lock:
+            for spot_id in spot_ids:
+                self._pending.pop(spot_id, None)
+
+    def flush(self, engine) -> int:
+        """溜まった増減を書き込み、更新したスポット数を返す（失敗したら戻して例外）"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        # id 順に更新する（他のDBで複数プロセスが同時にフラッシュしてもデッドロックしないように）
+        rows = [{"spot_id": spot_id, "delta": delta} for spot_id, delta in sorted(pending.items()) if delta]
+        if not rows:
+            return 0
+
+        table = Spot.__table__
+        try:
+            with engine.begin() as conn:
+                # updated_at の onupdate も効かせない（詳細の ETag に使っているので）
+                conn.execute(
+                    update(table).where(table.c.id == bindparam("spot_id"))
+                    .values(like_count=table.c.like_count + bindparam("delta"), updated_at=table.c.updated_at),
+                    rows,
+                )
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+        return len(rows)
+
+
+like_counter = LikeCounterBuffer()
+
+_flusher: Optional[asyncio.Task] = None
+
+# コミットまで書き込み待ちの増減を残しておく削除済みスポットの session.info のキー
+_DELETED_KEY = "deleted_like_spot_ids"
+
+
+@event.listens_for(Session, "before_flush")
+def _remove_likes_of_deleted_spots(session, flush_context, instances):
+    # スポットより先に消す（外部キー制約のあるDB向け。feed.py のタイムラインと同じ）
+    deleted_ids = [obj.id for obj in session.deleted if isinstance(obj, Spot)]
+    if deleted_ids:
+        session.connection().execute(
+            delete(SpotLike.__table__).where(SpotLike.__table__.c.spot_id.in_(deleted_ids))
+        )
+        session.info.setdefault(_DELETED_KEY, set()).update(deleted_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _discard_pending_of_deleted_spots(session):
+    like_counter.discard(session.info.pop(_DELETED_KEY, ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_pending_on_rollback(session):
+    session.info.pop(_DELETED_KEY, None)
+
+
+async def _flush_periodically(engine, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(like_counter.flush, engine)
+        except Exception as e:  # 次の周期で再試行する
+            print("いいね数の書き込み失敗:", e)
+
+
+def start(engine, interval: Optional[float] = None) -> None:
+    """定期フラッシュを開始（アプリ起動時）"""
+    global _flusher
+    if _flusher is None:
+        _flusher = asyncio.get_running_loop().create_task(
+            _flush_periodically(engine, FLUSH_INTERVAL if interval is None else interval)
+        )
+
+
+async def stop(engine) -> None:
+    """定期フラッシュを止めて、残りを書き込む（アプリ終了時）"""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        try:
+            await _flusher
+        except asyncio.CancelledError:
+            pass
+        _flusher = None
+    await run_in_threadpool(like_counter.flush, engine)
+
+
+def recount(engine) -> None:
+    """spot_likes の件数から like_count を作り直す（バッファの内容は破棄）"""
+    like_counter.clear()
+    table = Spot.__table__
+    counted = (
+        select(func.count()).select_from(SpotLike.__table__)
+        .where(SpotLike.__table__.c.spot_id == table.c.id)
+        .scalar_subquery()
+    )
+    with engine.begin() as conn:
+        # 件数が変わったスポットがあるときだけバージョンを進める
+        result = conn.execute(update(table).where(table.c.like_count.is_distinct_from(counted)).values(like_count=counted))
+        if result.rowcount:
+            versions.bump(conn, ["spots"])
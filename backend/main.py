@@ -1,16 +1,29 @@
-from fastapi import FastAPI, Depends, status
+from fastapi import FastAPI, Depends, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from database import get_db, create_tables
+from database import get_db, create_tables, engine, request_engine, run_db
 from sqlalchemy.exc import SQLAlchemyError
-import sqlite3
+from typing import Optional
+
+import compression
+import conditional
+import data_export
+import images
+import likes
+import metrics
+import post_classifier
+import posts_db
+import profiling
+import responses
+import slow_queries
 
 from dotenv import load_dotenv
 load_dotenv()  # .env ファイルの読み込み
 
 # ルーターのインポート
-from routers import spots, users , friends
+from routers import spots, users , friends, admin
 
 app = FastAPI(title="Spot Share API", version="1.0.0")
 
@@ -25,16 +38,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# レスポンス圧縮（一定サイズ以上の JSON などを gzip / brotli で返す）
+if compression.ENABLED:
+    app.add_middleware(compression.CompressionMiddleware, minimum_size=compression.MINIMUM_SIZE)
+
+# プロファイラ（X-Profile: 1 のリクエストごと + 常時サンプラー。圧縮の外側で処理中のリクエストを登録する）
+app.add_middleware(profiling.ProfilerMiddleware, routes=app.router.routes, authorize=admin.is_admin_token)
+
+# メトリクス（ルートごとのレイテンシ・クエリ数・プールの待ち時間。GET /metrics）
+# 圧縮・プロファイラも含めた時間を測るので最後に登録する（Starlette は最後に追加したものが一番外側）
+if metrics.ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware, routes=app.router.routes)
+    metrics.instrument_engine(request_engine, "request")
+    if request_engine is not engine:
+        metrics.instrument_engine(engine, "sync")  # 一括取り込み・エクスポート用
+
+# 遅いクエリのログ（SLOW_QUERY_MS 以上。上位は GET /api/admin/slow-queries）
+slow_queries.instrument_engine(request_engine)
+slow_queries.instrument_engine(engine)
+
 # ルーター登録
 app.include_router(spots.router)
 app.include_router(users.router)
 app.include_router(friends.router)
+app.include_router(admin.router)
 
 @app.on_event("startup")
 async def startup_event():
     print("Starting Spot Share API...")
     create_tables()
     print("Database tables created")
+    # いいね数の定期書き込み（likes.py）
+    likes.start(engine)
+    # ルートごとのスタックの常時サンプリング（profiling.py）
+    profiling.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # サムネイル作成のプロセスプールを止める
+    images.shutdown()
+    # 書き込み待ちのいいね数を反映
+    await likes.stop(engine)
+    # 集計したスタックを書き出す
+    profiling.stop()
 
 @app.get("/")
 async def root():
@@ -44,10 +90,17 @@ async def root():
         "docs": "/docs"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus のテキスト形式（METRICS_ENABLED=0 なら 404）"""
+    if not metrics.ENABLED:
+        return PlainTextResponse("metrics disabled", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/health", status_code=200)
 async def health_check(db: Session = Depends(get_db)):
     try:
-        db.execute(text("SELECT 1"))
+        await run_db(db, lambda db: db.execute(text("SELECT 1")))
         return {
             "status": "healthy",
             "database": "connected",
@@ -78,56 +131,99 @@ async def health_check(db: Session = Depends(get_db)):
 
 # SQLiteの初期化（アプリ起動時に1度だけ）
 def init_db():
-    conn = sqlite3.connect("data/posts.db")
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS posts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        genre INTEGER,
-        rating REAL,
-        likes INTEGER,
-        byFriend INTEGER,
-        photo_url TEXT,   -- ⭐️ 画像URL追加
-        comment TEXT      -- ⭐️ コメント追加
-    )
-    """)
-    # 一度だけ初期データ追加（なければ）
-    c.execute("SELECT COUNT(*) FROM posts")
-    if c.fetchone()[0] == 0:
-        c.executemany("""
-                INSERT INTO posts (name, genre, rating, likes, byFriend, photo_url, comment)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, [
-                ("カフェくるみ", 0, 3.4, 18, 0, "images/cafe_kurumi.jpg", "内装は可愛いけど普通"),
-                ("カフェゆらり", 0, 4.9, 45, 1, "images/cafe_yurari.jpg", "静かな空間で癒される"),
-                ("定食いちばん", 3, 2.3, 2, 0, "images/teishoku_ichiban.jpg", "冷めていた"),
-                ("ラーメン虎丸", 1, 1.8, 4, 0, "images/ramen_toramaru.jpg", "油が多い"),
-                ("ピッツェリアロッソ", 2, 4.7, 40, 1, "images/pizza_rosso.jpg", "石窯ピザの香ばしさ！"),
-                ("カレーハウスZZZ", 1, 1.9, 1, 0, "images/curry_zzz.jpg", "水しか美味しくなかった"),
-                ("和定食いなほ", 3, 4.6, 35, 1, "images/teishoku_inaho.jpg", "和風だしが絶品"),
-                ("スイーツ工房ふわり", 0, 4.9, 60, 1, "images/sweets_fuwari.jpg", "SNS映えスイーツ！"),
-                ("イタリアンボーノ", 2, 2.0, 3, 0, "images/italian_buono.jpg", "味が薄い"),
-                ("ラーメン武蔵", 1, 4.8, 52, 1, "images/ramen_musashi.jpg", "極太麺が最高"),
-                ("イタリアンダイナーAmo", 2, 3.6, 20, 0, "images/italian_amo.jpg", "コスパ普通"),
-                ("定食やすらぎ", 3, 3.2, 17, 0, "images/teishoku_yasuragi.jpg", "味は家庭的"),
-                ("カレー魂", 1, 3.7, 22, 0, "images/curry_soul.jpg", "辛さが選べる"),
-                ("カフェグリーン", 0, 2.1, 5, 0, "images/cafe_green.jpg", "席が狭い"),
-                ("ラーメン黒龍", 1, 3.5, 15, 0, "images/ramen_kokuryu.jpg", "味は濃いめ")
-            ])
-    conn.commit()
-    conn.close()
+    with posts_db.connection() as conn:
+        c = conn.cursor()
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            genre INTEGER,
+            rating REAL,
+            likes INTEGER,
+            byFriend INTEGER,
+            photo_url TEXT,   -- ⭐️ 画像URL追加
+            comment TEXT      -- ⭐️ コメント追加
+        )
+        """)
+        # 変更を posts_version に記録するトリガー（/posts の ETag 用）
+        posts_db.ensure_version_table(conn)
+        # 一度だけ初期データ追加（なければ）
+        c.execute("SELECT COUNT(*) FROM posts")
+        if c.fetchone()[0] == 0:
+            c.executemany("""
+                    INSERT INTO posts (name, genre, rating, likes, byFriend, photo_url, comment)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    ("カフェくるみ", 0, 3.4, 18, 0, "images/cafe_kurumi.jpg", "内装は可愛いけど普通"),
+                    ("カフェゆらり", 0, 4.9, 45, 1, "images/cafe_yurari.jpg", "静かな空間で癒される"),
+                    ("定食いちばん", 3, 2.3, 2, 0, "images/teishoku_ichiban.jpg", "冷めていた"),
+                    ("ラーメン虎丸", 1, 1.8, 4, 0, "images/ramen_toramaru.jpg", "油が多い"),
+                    ("ピッツェリアロッソ", 2, 4.7, 40, 1, "images/pizza_rosso.jpg", "石窯ピザの香ばしさ！"),
+                    ("カレーハウスZZZ", 1, 1.9, 1, 0, "images/curry_zzz.jpg", "水しか美味しくなかった"),
+                    ("和定食いなほ", 3, 4.6, 35, 1, "images/teishoku_inaho.jpg", "和風だしが絶品"),
+                    ("スイーツ工房ふわり", 0, 4.9, 60, 1, "images/sweets_fuwari.jpg", "SNS映えスイーツ！"),
+                    ("イタリアンボーノ", 2, 2.0, 3, 0, "images/italian_buono.jpg", "味が薄い"),
+                    ("ラーメン武蔵", 1, 4.8, 52, 1, "images/ramen_musashi.jpg", "極太麺が最高"),
+                    ("イタリアンダイナーAmo", 2, 3.6, 20, 0, "images/italian_amo.jpg", "コスパ普通"),
+                    ("定食やすらぎ", 3, 3.2, 17, 0, "images/teishoku_yasuragi.jpg", "味は家庭的"),
+                    ("カレー魂", 1, 3.7, 22, 0, "images/curry_soul.jpg", "辛さが選べる"),
+                    ("カフェグリーン", 0, 2.1, 5, 0, "images/cafe_green.jpg", "席が狭い"),
+                    ("ラーメン黒龍", 1, 3.5, 15, 0, "images/ramen_kokuryu.jpg", "味は濃いめ")
+                ])
+        # おすすめ判定（KNN）の結果を保存しておく
+        post_classifier.ensure_label_columns(conn)
+        post_classifier.classify_posts(conn)
+        conn.commit()
 
 init_db()
 
 #  /posts → SQLiteから読み込んで返す
 @app.get("/posts")
-def get_posts():
-    conn = sqlite3.connect("data/posts.db")
-    conn.row_factory = sqlite3.Row  # dictで返すために必要
-    c = conn.cursor()
-    c.execute("SELECT * FROM posts")
-    rows = c.fetchall()
-    conn.close()
-
-    return [dict(row) for row in rows]
\ No newline at end of file
+def get_posts(
+    request: Request,
+    response: Response,
+    label: Optional[str] = Query(None, pattern="^(good|bad)$", description="おすすめ判定で絞り込み"),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+):
+    sql = "SELECT * FROM posts"
+    params = []
+    if label:
+        sql += " WHERE label = ?"
+        params.append(label)
+    sql += " ORDER BY id"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    # 接続はプールから借りる（posts_db.py）
+    with posts_db.connection() as conn:
+        version, last_modified = posts_db.get_version(conn)
+        etag = conditional.make_etag("posts", version, label, limit)
+        cached = conditional.not_modified(request, etag, last_modified)
+        if cached:
+            return cached
+        rows = conn.execute(sql, params).fetchall()
+
+    conditional.set_cache_headers(response, etag, last_modified)
+
+    return responses.render([dict(row) for row in rows], response)
+
+# /posts/export → posts を NDJSON / CSV で少しずつ返す（全件を fetchall しない）
+@app.get("/posts/export")
+def export_posts(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    label: Optional[str] = Query(None, pattern="^(good|bad)$"),
+):
+    return StreamingResponse(
+        data_export.export_posts(format, label),
+        media_type=data_export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="posts.{format}"'},
+    )
+
+# おすすめ判定をやり直す（学習データ変更時など。全件を書き換えるので管理者のみ）
+@app.post("/posts/classify", dependencies=[Depends(admin.require_admin)])
+def classify_posts():
+    post_classifier.train()
+    with posts_db.connection() as conn:
+        updated = post_classifier.classify_posts(conn, only_missing=False)
+        conn.commit()
+    return {"classified": updated}
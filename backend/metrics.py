@@ -0,0 +1,330 @@
+"""
+リクエストごとのメトリクス（Prometheus のテキスト形式で GET /metrics に出す）
+- ルート（パスのテンプレート）ごとのレイテンシのヒストグラム・ステータスコード別の件数
+- SQLAlchemy の before/after_cursor_execute で、1リクエストあたりのクエリ数・DB時間を数える
+  （クエリ数のヒストグラムが増えたら N+1 の疑い）
+- コネクションプールの取得待ち時間・タイムアウト件数・使用中の接続数
+- METRICS_ENABLED=0 で無効（ミドルウェアを入れない）
+
+prometheus_client は使わず、必要な型（Counter / Histogram / Gauge）だけ実装している
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ルートに当てはまらないリクエスト（404 など）はまとめる（ラベルの種類が増えすぎないように）
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}"
+            for labels, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # ラベル → [バケットごとの件数..., 合計, 件数]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, labels: tuple = ()) -> int:
+        state = self._values.get(labels)
+        return state[-1] if state else 0
+
+    def sum(self, labels: tuple = ()) -> float:
+        state = self._values.get(labels)
+        return state[-2] if state else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        lines = self.header()
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), state[:len(self.buckets)] + [state[-1]]):
+                cumulative = state[-1] if bound == float("inf") else cumulative + count
+                le = _format_labels(self.labelnames, labels, ("le", _format_number(float(bound))))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_number(float(state[-2]))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """値は出力するときに collect() で集める"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect: Callable[[], Iterable[Tuple[tuple, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}"
+            for labels, value in sorted(self.collect())
+        ]
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def clear() -> None:
+    """計測値をリセット（テスト用）"""
+    for metric in REGISTRY:
+        if hasattr(metric, "clear"):
+            metric.clear()
+
+
+# ---- HTTP ----
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time spent in SQL per request", ("method", "route"))
+
+_in_progress = 0
+_in_progress_lock = threading.Lock()
+Gauge("http_requests_in_progress", "HTTP requests being processed", collect=lambda: [((), _in_progress)])
+
+
+class RequestStats:
+    """1リクエスト中のクエリ数・DB時間"""
+    __slots__ = ("queries", "db_seconds", "route")
+
+    def __init__(self, route: Callable[[], str]):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.route = route  # ルートのテンプレートを返す（ルーティング後に呼ぶ）
+
+
+# スレッドプール（run_db）にも引き継がれる
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("metrics_request", default=None)
+
+
+def current_route() -> Optional[str]:
+    """処理中のリクエストのルート（リクエスト外・メトリクス無効なら None）"""
+    stats = _current_request.get()
+    return stats.route() if stats is not None else None
+
+
+class RouteLabeler:
+    """scope からルートのテンプレート（/api/spots/{spot_id} など）を引く
+
+    routes には app.router.routes を渡す
+    """
+
+    def __init__(self, routes: Sequence):
+        self.routes = routes
+        self._paths: Dict[Callable, str] = {}
+
+    def __call__(self, scope) -> str:
+        # ルーティング後の scope に入るエンドポイントからパスのテンプレートを引く
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        path = self._paths.get(endpoint)
+        if path is None:
+            self._paths = {getattr(route, "endpoint", None): route.path for route in self.routes}
+            path = self._paths.get(endpoint, UNMATCHED_ROUTE)
+        return path
+
+
+class MetricsMiddleware:
+    """リクエストごとのレイテンシ・ステータス・クエリ数を記録する ASGI ミドルウェア
+
+    routes には app.router.routes を渡す（ルートのテンプレートをラベルにする）
+    """
+
+    def __init__(self, app, routes: Sequence):
+        self.app = app
+        self._route_label = RouteLabeler(routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _in_progress
+        stats = RequestStats(lambda: self._route_label(scope))
+        token = _current_request.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with _in_progress_lock:
+            _in_progress += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            with _in_progress_lock:
+                _in_progress -= 1
+            _current_request.reset(token)
+            labels = (scope["method"], self._route_label(scope))
+            REQUESTS.inc((*labels, str(status_code)))
+            REQUEST_SECONDS.observe(labels, elapsed)
+            REQUEST_QUERIES.observe(labels, stats.queries)
+            REQUEST_DB_SECONDS.observe(labels, stats.db_seconds)
+
+
+# ---- SQLAlchemy ----
+
+QUERY_SECONDS = Histogram("db_query_duration_seconds", "SQL statement latency", ("engine",))
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time waiting to check out a pooled connection", ("engine",)
+)
+POOL_TIMEOUTS = Counter("db_pool_checkout_timeouts_total", "Pool checkouts that timed out", ("engine",))
+
+_engines: Dict[str, object] = {}
+
+
+def _pool_gauge(method: str):
+    def collect():
+        values = []
+        for name, engine in _engines.items():
+            measure = getattr(engine.pool, method, None)
+            if measure is not None:
+                values.append(((name,), measure()))
+        return values
+    return collect
+
+
+Gauge("db_pool_size", "Configured pool size", ("engine",), collect=_pool_gauge("size"))
+Gauge("db_pool_checked_out", "Connections currently checked out", ("engine",), collect=_pool_gauge("checkedout"))
+Gauge("db_pool_overflow", "Connections opened beyond pool_size", ("engine",), collect=_pool_gauge("overflow"))
+
+
+def _instrument_pool(pool, name: str) -> None:
+    # Pool にはチェックアウト前のイベントがないので connect を包んで待ち時間を測る
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc((name,))
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.observe((name,), time.perf_counter() - started)
+
+    pool.connect = timed_connect
+
+
+def instrument_engine(engine, name: str) -> None:
+    """エンジンのクエリ・プールを計測対象にする（同期エンジンを渡す。async は sync_engine）"""
+    if name in _engines:
+        return
+    _engines[name] = engine
+    _instrument_pool(engine.pool, name)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info["metrics_query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("metrics_query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        QUERY_SECONDS.observe((name,), elapsed)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
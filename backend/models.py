@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime, timezone
@@ -17,8 +17,8 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
-    display_name = Column(String(100)) # 表示名 補助
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    display_name = Column(String(100), index=True) # 表示名 補助（短い検索語の前方一致用にインデックス）
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     is_active = Column(Boolean, default=True) # アカウント無効化 補助
     
     # リレーション
@@ -53,14 +53,31 @@ class Spot(Base):
     address = Column(String(200))  # 住所
     image_path = Column(String(255))  # 画像ファイルパス
     
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     visibility = Column(String(20), default="friends_only") # 友達だけ
+    # いいね数（spot_likes の件数。likes.py がまとめて更新するので数秒遅れることがある）
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
     # 外部キー
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
     # リレーション
     owner = relationship("User", back_populates="spots")
 
+    __table_args__ = (
+        # 半径検索用（SQLiteでは spots_rtree を使う。spatial.py 参照）
+        Index("ix_spots_lat_lng", "latitude", "longitude"),
+        # 新着順のカーソルページネーション用
+        Index("ix_spots_created_id", "created_at", "id"),
+        Index("ix_spots_category_created_id", "category", "created_at", "id"),
+        # フレンドのフィード（読み込み時に取りに行くユーザーの投稿）
+        Index("ix_spots_owner_created_id", "owner_id", "created_at", "id"),
+    )
+
+    @property
+    def owner_name(self) -> str:
+        return self.owner.display_name if self.owner else ""
+
 class Friendship(Base):
     """
     フレンド関係テーブル
@@ -73,12 +90,71 @@ class Friendship(Base):
     requester_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     requested_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     status = Column(String(20), default="pending")  # pending, accepted, rejected
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     
     # リレーション
     requester = relationship("User", foreign_keys=[requester_id], back_populates="sent_requests")
     requested = relationship("User", foreign_keys=[requested_id], back_populates="received_requests")
 
+    __table_args__ = (
+        # フレンド一覧・申請一覧（どちら側からも引けるように）
+        Index("ix_friendships_requester_status", "requester_id", "status"),
+        Index("ix_friendships_requested_status", "requested_id", "status"),
+    )
+
+
+class CategoryStat(Base):
+    """
+    カテゴリ別スポット数（spots から集計した値を書き込み時に更新）
+    # カテゴリ一覧・件数バッジ
+    """
+    __tablename__ = "category_stats"
+
+    category = Column(String(50), primary_key=True)
+    spot_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class TableVersion(Base):
+    """
+    テーブルごとの更新バージョン（書き込みのたびに+1）
+    # ETag / Last-Modified（条件付きGET）
+    """
+    __tablename__ = "table_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class TimelineEntry(Base):
+    """
+    フレンドの投稿のタイムライン（投稿時に各フレンドへ書き込む）
+    # フレンドのフィード（feed.py）
+    """
+    __tablename__ = "timeline_entries"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # タイムラインの持ち主
+    spot_id = Column(Integer, ForeignKey("spots.id"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, nullable=False)  # スポットの投稿日時（並び順）
+
+    __table_args__ = (
+        Index("ix_timeline_user_created_spot", "user_id", "created_at", "spot_id"),
+        Index("ix_timeline_user_author", "user_id", "author_id"),
+        Index("ix_timeline_spot", "spot_id"),
+    )
+
+
+class FeedPullUser(Base):
+    """
+    フレンドが多く、投稿をタイムラインに配らないユーザー
+    # フィードの読み込み時にこのユーザーの投稿を直接取りに行く（feed.py）
+    """
+    __tablename__ = "feed_pull_users"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
 
 # 以下これから実装
 class SpotLike(Base):
@@ -88,9 +164,11 @@ class SpotLike(Base):
     id = Column(Integer, primary_key=True, index=True)
     spot_id = Column(Integer, ForeignKey("spots.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     
     # 複合ユニーク制約（同じユーザーが同じスポットに複数いいね不可）
+    # 既存DBにも後から作れるようにユニークインデックスにしている（database.create_missing_indexes）
     __table_args__ = (
+        Index("uq_spot_likes_spot_user", "spot_id", "user_id", unique=True),
         {"sqlite_autoincrement": True},
     )
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+カーソル（キーセット）ページネーション
+- カーソルは並び順のキー（例: created_at, id）を base64 にした不透明な文字列
+- OFFSET を使わないので、深いページでも1ページ分の読み込みで済む
+"""
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Callable, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+from models import Spot
+
+
+def encode_cursor(kind: str, *values) -> str:
+    payload = json.dumps([kind, *values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="カーソルが不正です"
+    )
+
+
+def _as_int(value) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(value)
+    return value
+
+
+def _as_float(value) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise TypeError(value)
+    return float(value)
+
+
+def _as_datetime(value) -> datetime:
+    if not isinstance(value, str):
+        raise TypeError(value)
+    return datetime.fromisoformat(value)
+
+
+def decode_cursor(cursor: str, kind: str, *converters: Callable) -> list:
+    """カーソルを復元し、値を converters で型変換する。種類・要素数・値が不正なら400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        payload = None
+
+    if not isinstance(payload, list) or len(payload) != len(converters) + 1 or payload[0] != kind:
+        raise _invalid_cursor()
+    try:
+        return [convert(value) for convert, value in zip(converters, payload[1:])]
+    except (ValueError, TypeError, OverflowError):
+        raise _invalid_cursor()
+
+
+# 新着順（created_at DESC, id DESC）
+def created_cursor(spot: Spot) -> str:
+    return encode_cursor("created", spot.created_at.isoformat(), spot.id)
+
+
+def apply_created_cursor(query: Query, cursor: Optional[str], created_column=Spot.created_at, id_column=Spot.id) -> Query:
+    """新着順に並べ、カーソルがあればその続きから取得するクエリにする
+
+    created_column / id_column で Spot 以外（タイムラインなど）の列も使える
+    """
+    query = query.order_by(created_column.desc(), id_column.desc())
+    if cursor is None:
+        return query
+
+    created_at, spot_id = decode_cursor(cursor, "created", _as_datetime, _as_int)
+    # (created_at, id) < (cursor.created_at, cursor.id)
+    return query.filter(or_(
+        created_column < created_at,
+        and_(created_column == created_at, id_column < spot_id),
+    ))
+
+
+def page_after(rows: Sequence, per_page: int) -> Tuple[list, bool]:
+    """per_page + 1 件取得した結果を1ページ分と「続きがあるか」に分ける"""
+    return list(rows[:per_page]), len(rows) > per_page
+
+
+# 距離順（distance ASC, id ASC）
+def distance_cursor(distance: float, spot_id: int) -> str:
+    return encode_cursor("distance", distance, spot_id)
+
+
+def decode_distance_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """距離順のカーソルを (距離, id) に戻す（続きの絞り込みは spatial.spots_within_radius が SQL で行う）"""
+    if cursor is None:
+        return None
+    distance, spot_id = decode_cursor(cursor, "distance", _as_float, _as_int)
+    return distance, spot_id
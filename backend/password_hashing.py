@@ -0,0 +1,117 @@
+"""
+パスワードハッシュ（bcrypt）の専用ワーカープール
+- bcrypt は1回100ms以上かかるのでイベントループ上で実行しない
+- ワーカー数と待ち行列の上限を環境変数で設定
+- 待ち行列があふれたら 503 を返し、他のAPIを巻き込まない
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+import profiling
+
+# パスワードハッシュ化
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+DEFAULT_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+DEFAULT_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+
+class PasswordHashPool:
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        # bcrypt は計算中 GIL を解放するのでスレッドで並列に動く
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self.pending = 0       # 実行中 + 待ち
+        self.running = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _run(self, func, args, submitted_at: float):
+        started_at = time.perf_counter()
+        with self._lock:
+            self.running += 1
+            self.total_wait_seconds += started_at - submitted_at
+        try:
+            return func(*args)
+        finally:
+            finished_at = time.perf_counter()
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_run_seconds += finished_at - started_at
+
+    def _release(self, future) -> None:
+        # 実行せずにキャンセルされた場合（待ち行列中にクライアントが切断）も呼ばれる
+        with self._lock:
+            self.pending -= 1
+
+    async def submit(self, func, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="混雑しています。しばらくしてから再度お試しください",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+
+        # pending は _run ではなく Future の完了で減らす（キャンセルで _run が呼ばれなくても枠が戻る）
+        try:
+            future = self._executor.submit(self._run, profiling.track_thread(func), args, time.perf_counter())
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self.completed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "queued": self.pending - self.running,
+                "running": self.running,
+                "max_pending_seen": self.max_pending_seen,
+                "completed": completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.total_wait_seconds / completed * 1000, 2) if completed else 0.0,
+                "avg_run_ms": round(self.total_run_seconds / completed * 1000, 2) if completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+hash_pool = PasswordHashPool()
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await hash_pool.submit(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hash_pool.submit(verify_password, plain_password, hashed_password)
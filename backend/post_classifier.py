@@ -0,0 +1,119 @@
+"""
+おすすめ投稿の good / bad 判定（KNN）
+- 以前は frontend/js/recomends.js で TF.js の KNN を毎回学習・判定していた
+- 同じ学習データ・同じ判定（コサイン類似度, k=5）をサーバー側で行い、
+  posts テーブルの label / score 列に保存しておく
+"""
+import sqlite3
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+K = 5
+GOOD_RATING_THRESHOLD = 3.5
+
+# 学習データ（genre, rating, likes, byFriend）→ ラベル
+TRAINING_DATA = [
+    ([1, 1.0, 4, 0], "bad"),
+    ([2, 1.2, 4, 0], "bad"),
+    ([1, 2.1, 3, 0], "bad"),
+    ([5, 1.4, 3, 0], "bad"),
+    ([4, 4.6, 15, 0], "good"),
+    ([0, 4.5, 20, 1], "good"),
+    ([2, 4.8, 18, 1], "good"),
+    ([3, 0.5, 2, 0], "bad"),
+    ([1, 0.8, 6, 0], "bad"),
+    ([0, 4.3, 12, 0], "good"),
+    ([4, 4.1, 8, 1], "good"),
+    ([3, 4.8, 10, 1], "good"),
+    ([1, 2.5, 1, 0], "bad"),
+    ([2, 1.6, 5, 0], "bad"),
+    ([0, 4.7, 16, 1], "good"),
+    ([1, 1.2, 4, 1], "bad"),
+    ([3, 4.0, 11, 1], "good"),
+    ([5, 3.9, 7, 1], "good"),
+    ([6, 2.3, 2, 0], "bad"),
+    ([2, 3.9, 25, 1], "good"),
+    ([0, 4.0, 7, 0], "good"),
+    ([4, 2.5, 6, 0], "bad"),
+    ([3, 1.2, 3, 0], "bad"),
+    ([1, 4.0, 9, 1], "good"),
+    ([2, 4.2, 14, 1], "good"),
+    ([5, 1.0, 5, 0], "bad"),
+    ([6, 1.6, 5, 0], "bad"),
+    ([0, 4.9, 30, 1], "good"),
+    ([2, 1.3, 6, 0], "bad"),
+    ([1, 3.9, 10, 0], "good"),
+]
+
+
+class KNNClassifier:
+    """コサイン類似度によるKNN（TF.js knn-classifier と同じ判定方法）"""
+
+    def __init__(self, examples: List[Tuple[List[float], str]], k: int = K):
+        self.k = k
+        features = np.array([x for x, _ in examples], dtype=np.float64)
+        self.features = _normalize(features)
+        self.is_good = np.array([label == "good" for _, label in examples])
+
+    def good_ratio(self, features: np.ndarray) -> np.ndarray:
+        """各行について近傍 k 件のうち good の割合を返す"""
+        similarity = _normalize(features) @ self.features.T
+        k = min(self.k, self.features.shape[0])
+        nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        return self.is_good[nearest].mean(axis=1)
+
+
+def _normalize(features: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.where(norms == 0, 1.0, norms)
+
+
+_classifier: Optional[KNNClassifier] = None
+
+
+def get_classifier() -> KNNClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = KNNClassifier(TRAINING_DATA)
+    return _classifier
+
+
+def train() -> KNNClassifier:
+    """学習データから分類器を作り直す"""
+    global _classifier
+    _classifier = KNNClassifier(TRAINING_DATA)
+    return _classifier
+
+
+def ensure_label_columns(conn: sqlite3.Connection) -> None:
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(posts)")}
+    if "label" not in columns:
+        conn.execute("ALTER TABLE posts ADD COLUMN label TEXT")
+    if "score" not in columns:
+        conn.execute("ALTER TABLE posts ADD COLUMN score REAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_posts_label ON posts (label, id)")
+
+
+def classify_posts(conn: sqlite3.Connection, only_missing: bool = True) -> int:
+    """posts の label / score を計算して保存する。更新した件数を返す"""
+    sql = "SELECT id, genre, rating, likes, byFriend FROM posts"
+    if only_missing:
+        sql += " WHERE label IS NULL"
+    rows = conn.execute(sql).fetchall()
+    if not rows:
+        return 0
+
+    ids = [row[0] for row in rows]
+    features = np.array([row[1:] for row in rows], dtype=np.float64)
+    good_ratio = get_classifier().good_ratio(features)
+    ratings = features[:, 1]
+
+    # 多数決で good かつ 評価3.5以上 のみ good とする
+    labels = np.where((good_ratio > 0.5) & (ratings >= GOOD_RATING_THRESHOLD), "good", "bad")
+
+    conn.executemany(
+        "UPDATE posts SET label = ?, score = ? WHERE id = ?",
+        [(str(label), float(score), post_id) for label, score, post_id in zip(labels, good_ratio, ids)],
+    )
+    return len(ids)
@@ -0,0 +1,110 @@
+"""
+posts.db（おすすめ投稿）用の sqlite3 接続プール
+- リクエストごとに sqlite3.connect しないように接続を使い回す
+- SQLITE_PROFILE=production のときは spots.db と同じPRAGMAを設定
+- posts の変更はトリガーで posts_version に記録（/posts の ETag 用）
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from database import apply_sqlite_pragmas
+
+POSTS_DB_PATH = os.getenv("POSTS_DB_PATH", "data/posts.db")
+POOL_SIZE = int(os.getenv("POSTS_DB_POOL_SIZE", "5"))
+
+
+class SQLitePool:
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # プール内の接続はスレッドプールの複数スレッドから使う
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # dictで返すために必要
+        apply_sqlite_pragmas(conn)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        # 上限まで作成済みなら空くのを待つ
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+pool = SQLitePool(POSTS_DB_PATH, POOL_SIZE)
+
+_VERSION_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS posts_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO posts_version (id, version, updated_at) VALUES (1, 1, CURRENT_TIMESTAMP)",
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS posts_version_{op.lower()} AFTER {op} ON posts
+    BEGIN
+        UPDATE posts_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+    END
+    """
+    for op in ("INSERT", "UPDATE", "DELETE")
+]
+
+
+def ensure_version_table(conn: sqlite3.Connection) -> None:
+    """posts_version テーブルと更新トリガーを作成"""
+    for ddl in _VERSION_DDL:
+        conn.execute(ddl)
+
+
+def get_version(conn: sqlite3.Connection) -> Tuple[int, Optional[datetime]]:
+    """(version, updated_at)"""
+    row = conn.execute("SELECT version, updated_at FROM posts_version WHERE id = 1").fetchone()
+    if row is None:
+        return 0, None
+    # CURRENT_TIMESTAMP は UTC の 'YYYY-MM-DD HH:MM:SS'
+    updated_at = datetime.strptime(row["updated_at"], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return row["version"], updated_at
+
+
+def connection():
+    return pool.connection()
@@ -0,0 +1,355 @@
+"""
+サンプリングプロファイラ（ハンドラのどこで時間を使っているかを flamegraph 用の collapsed stacks で出す）
+- リクエスト単位: X-Profile: 1 ヘッダーか ?profile=1 を付けたリクエストだけ、
+  PROFILE_REQUEST_INTERVAL_MS ごとにスタックを取る（X-Admin-Token が必要。なければ普通に処理する）
+  レスポンスの X-Profile-Id で GET /api/admin/profiles/{id} から取得
+- 常時サンプラー: PROFILE_SAMPLER_INTERVAL_MS ごとに全スレッドのスタックを取ってルートごとに集計し、
+  PROFILE_WRITE_INTERVAL 秒ごとにサンプル数の多いルート上位 PROFILE_TOP_ROUTES 件を
+  PROFILE_DIR/hot_routes.folded に書き出す。デフォルトは無効で、PROFILE_SAMPLER=1 のときだけ動かす
+- どのリクエストのスタックかは、イベントループ上ではこのミドルウェアのフレーム、
+  ワーカースレッド（run_db・パスワードハッシュ）では track_thread で結びつけたリクエストで判定
+- スレッド上で動いている時間だけを数える（await で待っている間は数えない）
+- 出力は「フレーム;フレーム;... 回数」の形式（flamegraph.pl・speedscope にそのまま渡せる）
+
+cProfile は有効にしたスレッドしか測れず、スレッドプールでの処理が抜けるのでサンプリングにしている
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from types import CodeType, FrameType
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import metrics
+
+# 常時サンプラーは全スレッドのスタックを取り続けるので、明示的に有効にしたときだけ
+SAMPLER_ENABLED = os.getenv("PROFILE_SAMPLER", "0") == "1"
+SAMPLER_INTERVAL = float(os.getenv("PROFILE_SAMPLER_INTERVAL_MS", "10")) / 1000
+REQUEST_INTERVAL = float(os.getenv("PROFILE_REQUEST_INTERVAL_MS", "1")) / 1000
+WRITE_INTERVAL = float(os.getenv("PROFILE_WRITE_INTERVAL", "60"))
+TOP_ROUTES = int(os.getenv("PROFILE_TOP_ROUTES", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+# 保存しておくリクエスト単位のプロファイル数
+KEEP_PROFILES = 20
+# ルートごとに保存するスタックの種類数（超えた分は「(その他)」にまとめる）
+MAX_STACKS_PER_ROUTE = 5000
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "x-profile-id"
+
+
+class _ActiveRequest:
+    """処理中のリクエスト"""
+    __slots__ = ("scope", "route", "profile")
+
+    def __init__(self, scope, route: Callable[[], str]):
+        self.scope = scope
+        self.route = route
+        self.profile: Optional[RequestProfile] = None
+
+
+# イベントループ上: ミドルウェアの __call__ のフレーム → リクエスト
+_requests: Dict[FrameType, _ActiveRequest] = {}
+# ワーカースレッドの id → 実行を頼んだリクエスト
+_threads: Dict[int, _ActiveRequest] = {}
+# run_db などに渡す関数を包むときに、今のリクエストを取り出す
+_current: ContextVar[Optional[_ActiveRequest]] = ContextVar("profiling_request", default=None)
+
+
+def _run_tracked(request: _ActiveRequest, fn, args, kwargs):
+    thread_id = threading.get_ident()
+    previous = _threads.get(thread_id)
+    _threads[thread_id] = request
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if previous is None:
+            _threads.pop(thread_id, None)
+        else:
+            _threads[thread_id] = previous
+
+
+# スタックをたどるときはここで止める（ワーカースレッドの外側のフレームは要らない）
+_TRACKED_CODE = _run_tracked.__code__
+
+
+def track_thread(fn):
+    """別スレッドで実行する fn を、呼び出し元のリクエストに結びつける（リクエスト外ならそのまま）"""
+    request = _current.get()
+    if request is None:
+        return fn
+
+    def tracked(*args, **kwargs):
+        return _run_tracked(request, fn, args, kwargs)
+    return tracked
+
+
+_frame_names: Dict[CodeType, str] = {}
+
+
+def _frame_name(code: CodeType) -> str:
+    name = _frame_names.get(code)
+    if name is None:
+        name = _frame_names[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return name
+
+
+def _sample_threads() -> Iterator[Tuple[_ActiveRequest, str]]:
+    """リクエストを処理中のスレッドのスタックを (リクエスト, "外側;...;内側") で返す"""
+    me = threading.get_ident()
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id == me:
+            continue
+        codes: List[CodeType] = []
+        request = None
+        while frame is not None:
+            request = _requests.get(frame)
+            if request is not None:
+                break
+            code = frame.f_code
+            if code is _TRACKED_CODE:
+                request = _threads.get(thread_id)
+                break
+            codes.append(code)
+            frame = frame.f_back
+        if request is not None and codes:
+            yield request, ";".join(_frame_name(code) for code in reversed(codes))
+
+
+def _to_folded(stacks: Counter, prefix: str = "") -> str:
+    return "".join(f"{prefix}{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# ---- リクエスト単位 ----
+
+class RequestProfile:
+    """1リクエストの間だけ別スレッドで短い間隔のサンプリングをする"""
+
+    def __init__(self, request: _ActiveRequest, interval: float = REQUEST_INTERVAL):
+        self.id = uuid.uuid4().hex[:16]
+        self.request = request
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.status_code: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profile-{self.id}", daemon=True)
+        self._started = 0.0
+        self.duration = 0.0
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for request, stack in _sample_threads():
+                if request is self.request:
+                    self.stacks[stack] += 1
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.duration = time.perf_counter() - self._started
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> dict:
+        scope = self.request.scope
+        return {
+            "id": self.id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": self.request.route(),
+            "status": self.status_code,
+            "duration_ms": round(self.duration * 1000, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": sum(self.stacks.values()),
+        }
+
+    def folded(self) -> str:
+        return _to_folded(self.stacks)
+
+
+class ProfileStore:
+    """直近のリクエスト単位のプロファイル"""
+
+    def __init__(self, keep: int = KEEP_PROFILES):
+        self._profiles: deque = deque(maxlen=keep)
+
+    def add(self, profile: RequestProfile) -> None:
+        self._profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return next((profile for profile in self._profiles if profile.id == profile_id), None)
+
+    def list(self) -> List[dict]:
+        return [profile.summary() for profile in reversed(self._profiles)]
+
+    def clear(self) -> None:
+        self._profiles.clear()
+
+
+profiles = ProfileStore()
+
+
+class ProfilerMiddleware:
+    """処理中のリクエストを登録し、指定されたリクエストをプロファイルする ASGI ミドルウェア
+
+    routes には app.router.routes、authorize には X-Admin-Token の値を確認する関数を渡す
+    """
+
+    def __init__(self, app, routes: Sequence, authorize: Callable[[Optional[str]], bool]):
+        self.app = app
+        self.authorize = authorize
+        self._route_label = metrics.RouteLabeler(routes)
+
+    def _wants_profile(self, scope) -> bool:
+        headers = Headers(scope=scope)
+        flag = headers.get(PROFILE_HEADER)
+        if flag is None and b"profile" in scope["query_string"]:
+            flag = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [None])[0]
+        return flag in ("1", "true") and self.authorize(headers.get("x-admin-token"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # このコルーチンのフレームはリクエストの間ずっと同じなので、サンプラーはこれを目印にする
+        frame = sys._getframe()
+        request = _ActiveRequest(scope, lambda: self._route_label(scope))
+        _requests[frame] = request
+        token = _current.set(request)
+
+        profile = None
+        if self._wants_profile(scope):
+            profile = request.profile = RequestProfile(request)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, profile.id)
+            await send(message)
+
+        try:
+            if profile is None:
+                await self.app(scope, receive, send)
+            else:
+                profile.start()
+                try:
+                    await self.app(scope, receive, send_with_profile_id)
+                finally:
+                    profile.stop()
+                    profiles.add(profile)
+        finally:
+            _current.reset(token)
+            del _requests[frame]
+
+
+# ---- 常時サンプラー ----
+
+class BackgroundSampler:
+    """全スレッドのスタックを定期的に取り、ルートごとに集計する"""
+
+    def __init__(self, interval: float = SAMPLER_INTERVAL, write_interval: float = WRITE_INTERVAL,
+                 directory: str = PROFILE_DIR, top_routes: int = TOP_ROUTES):
+        self.interval = interval
+        self.write_interval = write_interval
+        self.directory = directory
+        self.top_routes = top_routes
+        self._stacks: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample_once(self) -> None:
+        samples = [(request.route(), stack) for request, stack in _sample_threads()]
+        with self._lock:
+            for route, stack in samples:
+                stacks = self._stacks.get(route)
+                if stacks is None:
+                    stacks = self._stacks[route] = Counter()
+                if stack not in stacks and len(stacks) >= MAX_STACKS_PER_ROUTE:
+                    stack = "(その他)"
+                stacks[stack] += 1
+
+    def hot_routes(self, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """サンプル数の多いルート（サンプル数 × 間隔 ≒ スレッド上の処理時間）"""
+        with self._lock:
+            totals = [(route, sum(stacks.values())) for route, stacks in self._stacks.items()]
+        totals.sort(key=lambda item: item[1], reverse=True)
+        return totals[:limit or self.top_routes]
+
+    def folded(self, limit: Optional[int] = None) -> str:
+        """上位ルートのスタック（一番外側のフレームをルート名にする）"""
+        routes = [route for route, _ in self.hot_routes(limit)]
+        with self._lock:
+            return "".join(_to_folded(Counter(self._stacks[route]), f"{route};") for route in routes)
+
+    def write(self) -> Optional[str]:
+        """PROFILE_DIR/hot_routes.folded に書き出す（サンプルがなければ何もしない）"""
+        text = self.folded()
+        if not text:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "hot_routes.folded")
+        # 読み込み途中のファイルを見せないように、書き終わってから置き換える
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+
+    def _run(self) -> None:
+        next_write = time.monotonic() + self.write_interval
+        while not self._stop.wait(self.interval):
+            self.sample_once()
+            if time.monotonic() >= next_write:
+                next_write = time.monotonic() + self.write_interval
+                try:
+                    self.write()
+                except OSError as e:  # 次の周期で再試行する
+                    print("プロファイルの書き出し失敗:", e)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            try:
+                self.write()
+            except OSError as e:
+                print("プロファイルの書き出し失敗:", e)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+
+sampler = BackgroundSampler()
+
+
+def start() -> None:
+    """常時サンプラーを開始（アプリ起動時。PROFILE_SAMPLER=1 のときだけ）"""
+    if SAMPLER_ENABLED:
+        sampler.start()
+
+
+def stop() -> None:
+    """常時サンプラーを止めて、集計を書き出す（アプリ終了時）"""
+    sampler.stop()
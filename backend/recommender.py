@@ -0,0 +1,236 @@
+"""
+おすすめスポットのスコアリング
+- spots の座標・評価・投稿日時を NumPy の列データ（スナップショット）として保持
+- スナップショットは table_versions の spots のバージョンで管理する（他のワーカーや Core での書き込みも反映）
+  - バージョンが進んだら、最大IDより後ろの追加分だけを読み込んで継ぎ足す
+  - このプロセスで ORM の更新・削除がコミットされたとき、または RECOMMEND_SNAPSHOT_MAX_AGE 秒たったときは作り直す
+    （他のワーカーでの更新・削除はこの間隔で反映される）
+  - 作り直し・継ぎ足しは1スレッドだけが行い、その間の他のリクエストは古いスナップショットを使う
+- 距離・評価・新しさを合成したスコアの上位を argpartition で取り出す
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+import versions
+from models import Spot
+
+SNAPSHOT_MAX_AGE = float(os.getenv("RECOMMEND_SNAPSHOT_MAX_AGE", "300"))
+
+EARTH_RADIUS_KM = 6371.0
+
+# スコアの重み（合計1.0）
+WEIGHT_DISTANCE = 0.5
+WEIGHT_RATING = 0.35
+WEIGHT_RECENCY = 0.15
+
+DISTANCE_SCALE_KM = 3.0     # この距離で距離スコアが 1/e になる
+RECENCY_HALF_LIFE_DAYS = 30.0
+
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+
+
+class SpotSnapshot:
+    """スコア計算に必要な列だけを持つ spots のスナップショット"""
+
+    def __init__(self, ids, latitudes, longitudes, ratings, created_ts, version: int, generation: int = 0,
+                 built_at: Optional[float] = None):
+        self.ids = ids
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.lat_rad = np.radians(latitudes)
+        self.lng_rad = np.radians(longitudes)
+        self.cos_lat = np.cos(self.lat_rad)
+        self.ratings = ratings
+        self.created_ts = created_ts
+        self.version = version          # table_versions の spots のバージョン
+        self.generation = generation    # このプロセスでの更新・削除の世代（invalidate）
+        self.max_id = int(ids.max()) if len(ids) else 0
+
+        # 評価スコアと作成時点の新しさスコアは検索位置に依存しないので先に計算しておく
+        # （新しさは経過時間に対して一様に減衰するので、検索時は係数を掛けるだけ）
+        self.built_at = time.time() if built_at is None else built_at
+        self.rating_score = WEIGHT_RATING * np.clip(ratings, 0.0, 5.0) / 5.0
+        age_days = np.maximum(self.built_at - created_ts, 0.0) / 86400.0
+        self.recency_score = WEIGHT_RECENCY * np.exp2(-age_days / RECENCY_HALF_LIFE_DAYS)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _read_columns(db: Session, after_id: int = 0):
+        query = db.query(Spot.id, Spot.latitude, Spot.longitude, Spot.rating, Spot.created_at)
+        if after_id:
+            query = query.filter(Spot.id > after_id)
+        rows = query.all()
+
+        now = time.time()
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        latitudes = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        longitudes = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        ratings = np.fromiter((row[3] or 0.0 for row in rows), dtype=np.float64, count=len(rows))
+        # SQLiteは naive datetime で返すのでUTCとして扱う
+        created_ts = np.fromiter(
+            (_to_timestamp(row[4], now) for row in rows), dtype=np.float64, count=len(rows)
+        )
+        return ids, latitudes, longitudes, ratings, created_ts
+
+    @classmethod
+    def load(cls, db: Session, version: int, generation: int = 0) -> "SpotSnapshot":
+        built_at = time.time()
+        return cls(*cls._read_columns(db), version, generation, built_at=built_at)
+
+    def extended(self, db: Session, version: int) -> "SpotSnapshot":
+        """max_id より後ろに追加されたスポットだけを読み込んで継ぎ足した新しいスナップショット"""
+        added = self._read_columns(db, self.max_id)
+        if len(added[0]) == 0:
+            columns = (self.ids, self.latitudes, self.longitudes, self.ratings, self.created_ts)
+        else:
+            columns = (
+                np.concatenate((old, new)) for old, new in
+                zip((self.ids, self.latitudes, self.longitudes, self.ratings, self.created_ts), added)
+            )
+        # 新しさスコアの基準時刻はそのまま（top() の減衰係数と合わせる）
+        return SpotSnapshot(*columns, version, self.generation, built_at=self.built_at)
+
+    def distances_km(self, lat: float, lng: float) -> np.ndarray:
+        """全スポットへの距離（km）をまとめて計算（Haversine公式）"""
+        phi = math.radians(lat)
+        lam = math.radians(lng)
+        # 100万件規模でも一時配列を増やさないように in-place で計算する
+        a = self.lat_rad - phi
+        a *= 0.5
+        np.sin(a, out=a)
+        a *= a
+        b = self.lng_rad - lam
+        b *= 0.5
+        np.sin(b, out=b)
+        b *= b
+        b *= self.cos_lat
+        b *= math.cos(phi)
+        a += b
+        np.minimum(a, 1.0, out=a)
+        np.sqrt(a, out=a)
+        np.arcsin(a, out=a)
+        a *= 2 * EARTH_RADIUS_KM
+        return a
+
+    def top(self, lat: float, lng: float, limit: int, now: Optional[float] = None) -> List[Tuple[int, float, float]]:
+        """スコア上位 limit 件を (spot_id, score, distance_km) で返す"""
+        if len(self) == 0:
+            return []
+
+        now = time.time() if now is None else now
+        distances = self.distances_km(lat, lng)
+        decay = 2.0 ** (-max(now - self.built_at, 0.0) / 86400.0 / RECENCY_HALF_LIFE_DAYS)
+
+        scores = distances / -DISTANCE_SCALE_KM
+        np.exp(scores, out=scores)
+        scores *= WEIGHT_DISTANCE
+        scores += self.rating_score
+        scores += decay * self.recency_score
+
+        # 上位 limit 件だけを部分ソートで取り出してから並べ替える
+        if limit < len(scores):
+            top_idx = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top_idx = np.arange(len(scores))
+        top_idx = top_idx[np.argsort(-scores[top_idx], kind="stable")]
+
+        return [
+            (int(self.ids[i]), float(scores[i]), float(distances[i]))
+            for i in top_idx
+        ]
+
+
+def _to_timestamp(value, default: float) -> float:
+    if value is None:
+        return default
+    if value.tzinfo is None:
+        return (value - _EPOCH_NAIVE).total_seconds()
+    return value.timestamp()
+
+
+# スナップショットの管理
+_lock = threading.Lock()
+_rebuild_lock = threading.Lock()  # 作り直し・継ぎ足しをするのは1スレッドだけ
+_generation = 0
+_snapshot: Optional[SpotSnapshot] = None
+
+
+def invalidate() -> None:
+    """このプロセスでの spots の更新・削除を知らせる（次回の取得時に作り直す。追加だけならバージョンで継ぎ足す）"""
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+def _is_current(snapshot: Optional[SpotSnapshot], version: int, generation: int) -> bool:
+    return (
+        snapshot is not None and snapshot.version == version and snapshot.generation == generation
+        and time.time() - snapshot.built_at <= SNAPSHOT_MAX_AGE
+    )
+
+
+def get_snapshot(db: Session) -> SpotSnapshot:
+    global _snapshot
+    version, _ = versions.get_versions(db, "spots")["spots"]
+    with _lock:
+        snapshot, generation = _snapshot, _generation
+    if _is_current(snapshot, version, generation):
+        return snapshot
+
+    # ブロックして待たない（DB_MODE=async では同じスレッドの別リクエストが持っていることがある）
+    if not _rebuild_lock.acquire(blocking=False):
+        # 作り直し中なら古いスナップショットを使う。まだ1つもなければ自分で読み込む（保存はしない）
+        return snapshot if snapshot is not None else SpotSnapshot.load(db, version, generation)
+    try:
+        with _lock:
+            snapshot, generation = _snapshot, _generation
+        if _is_current(snapshot, version, generation):
+            return snapshot
+        if (snapshot is None or snapshot.generation != generation
+                or time.time() - snapshot.built_at > SNAPSHOT_MAX_AGE):
+            snapshot = SpotSnapshot.load(db, version, generation)
+        else:
+            snapshot = snapshot.extended(db, version)
+        # 読み込み中に invalidate されたら generation がずれるので次回また作り直される
+        with _lock:
+            _snapshot = snapshot
+        return snapshot
+    finally:
+        _rebuild_lock.release()
+
+
+def recommend(db: Session, lat: float, lng: float, limit: int) -> List[Tuple[int, float, float]]:
+    return get_snapshot(db).top(lat, lng, limit)
+
+
+# ORM経由の更新・削除はコミット時にスナップショットを無効化する
+# （追加は spots のバージョンが進むので、次回の取得時に継ぎ足される）
+def _mark_spots_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["spots_changed"] = True
+
+
+for _event_name in ("after_update", "after_delete"):
+    event.listen(Spot, _event_name, _mark_spots_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("spots_changed", False):
+        invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_on_rollback(session):
+    session.info.pop("spots_changed", None)
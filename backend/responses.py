@@ -0,0 +1,40 @@
+"""
+レスポンスのシリアライズ（FAST_RESPONSES=1 で orjson）
+- 通常: ハンドラが返した Pydantic モデルを FastAPI が response_model で検証し直してから JSON 化
+- FAST_RESPONSES=1: ハンドラ内で作ったモデルを orjson で1回だけシリアライズして返す
+  （Response を返すと FastAPI は response_model の検証・変換を行わない）
+"""
+import os
+from typing import Any, Optional
+
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+FAST_RESPONSES = os.getenv("FAST_RESPONSES", "0") == "1"
+
+
+def _to_primitive(content: Any) -> Any:
+    # orjson は datetime などはそのまま扱えるので、Pydantic モデルだけ dict にする
+    if isinstance(content, BaseModel):
+        return content.model_dump()
+    if isinstance(content, dict):
+        return {key: _to_primitive(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [_to_primitive(value) for value in content]
+    return content
+
+
+def render(content: Any, response: Optional[Response] = None) -> Any:
+    """FAST_RESPONSES のときは ORJSONResponse、それ以外は content をそのまま返す"""
+    if not FAST_RESPONSES:
+        return content
+    fast = ORJSONResponse(_to_primitive(content))
+    if response is not None:
+        # 引数で受け取った Response に付けたヘッダー（ETag など）を引き継ぐ
+        fast.raw_headers.extend(
+            (key, value) for key, value in response.raw_headers if key != b"content-length"
+        )
+        if response.status_code:
+            fast.status_code = response.status_code
+    return fast
@@ -0,0 +1,98 @@
+# backend/routers/admin.py
+# 運用者向けのエンドポイント（ADMIN_TOKEN を設定したときだけ有効）
+import os
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+import profiling
+import slow_queries
+from password_hashing import hash_pool
+from routers.users import token_cache
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """ADMIN_TOKEN が設定されていて、token が一致するか"""
+    return bool(ADMIN_TOKEN) and bool(token) and secrets.compare_digest(token, ADMIN_TOKEN)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """X-Admin-Token ヘッダーが ADMIN_TOKEN と一致しなければ拒否（未設定なら存在しない扱い）"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者トークンが違います")
+
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/auth-stats")
+async def get_auth_stats():
+    """トークンキャッシュ・パスワードハッシュ処理の統計"""
+    return {
+        "token_cache": token_cache.stats(),
+        "password_hashing": hash_pool.stats(),
+    }
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    order: str = Query("total_ms", pattern="^(total_ms|max_ms|count)$", description="並び順"),
+):
+    """遅いクエリの上位（正規化SQLごと。slow_queries.py）"""
+    return {
+        "enabled": slow_queries.ENABLED,
+        "threshold_ms": slow_queries.THRESHOLD_SECONDS * 1000 if slow_queries.ENABLED else None,
+        "queries": slow_queries.slow_query_log.top(limit, order),
+    }
+
+
+@router.delete("/slow-queries")
+async def clear_slow_queries():
+    """集計をリセット"""
+    slow_queries.slow_query_log.clear()
+    return {"message": "遅いクエリの集計をリセットしました"}
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """直近のリクエスト単位のプロファイル（X-Profile: 1 を付けたリクエスト。profiling.py）"""
+    return {"profiles": profiling.profiles.list()}
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    """collapsed stacks（flamegraph.pl・speedscope 用）"""
+    profile = profiling.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="プロファイルが見つかりません")
+    return profile.folded()
+
+
+@router.get("/hot-routes")
+async def get_hot_routes(limit: int = Query(profiling.TOP_ROUTES, ge=1, le=100)):
+    """常時サンプラーでサンプル数の多いルート"""
+    return {
+        "enabled": profiling.sampler.running,
+        "interval_ms": profiling.sampler.interval * 1000,
+        "routes": [{"route": route, "samples": samples} for route, samples in profiling.sampler.hot_routes(limit)],
+    }
+
+
+@router.get("/hot-routes/folded", response_class=PlainTextResponse)
+async def get_hot_routes_folded(limit: int = Query(profiling.TOP_ROUTES, ge=1, le=100)):
+    """上位ルートの collapsed stacks（一番外側のフレームがルート）"""
+    return profiling.sampler.folded(limit)
+
+
+@router.delete("/hot-routes")
+async def clear_hot_routes():
+    """常時サンプラーの集計をリセット"""
+    profiling.sampler.clear()
+    return {"message": "プロファイルの集計をリセットしました"}
@@ -1,11 +1,16 @@
 # backend/routers/friends.py 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import or_, and_
 from pydantic import BaseModel
 from typing import List, Optional
-from database import get_db
+from database import get_db, run_db
+from friend_graph import friend_graph
+from routers.spots import SpotCardResponse, spot_load_options
+from routers.users import CurrentUser, get_current_user
+import feed
 import models
+import user_search
 
 router = APIRouter(prefix="/api/friends", tags=["friends"])
 
@@ -43,17 +48,20 @@ class FriendResponse(BaseModel):
     class Config:
         from_attributes = True
 
-def get_current_user_id(
+def _find_user_id(db: Session, username: str) -> Optional[int]:
+    return db.query(models.User.id).filter(models.User.username == username).scalar()
+
+async def get_current_user_id(
     username: str = Query(..., description="現在のユーザー名"),
     db: Session = Depends(get_db)
 ) -> int:
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
+    user_id = await run_db(db, _find_user_id, username)
+    if not user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"ユーザー '{username}' が見つかりません"
         )
-    return user.id
+    return user_id
 
 @router.get("/search")
 async def search_users(
@@ -62,59 +70,65 @@ async def search_users(
     # current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    current_user_id = get_current_user_id(username=username, db=db)
     """ユーザー検索"""
-    if len(query) < 2:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="検索キーワードは2文字以上で入力してください"
-        )
+    current_user_id = await get_current_user_id(username=username, db=db)
+
+    def run(db: Session):
+        if len(query) < 2:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="検索キーワードは2文字以上で入力してください"
+            )
     
-    # ユーザー検索（自分以外）
-    users = db.query(models.User).filter(
-        models.User.id != current_user_id,
-        or_(
-            models.User.username.contains(query),
-            models.User.display_name.contains(query)
-        )
-    ).limit(10).all()
+        # ユーザー検索（自分以外）。全文インデックスを使う（user_search.py）
+        users = user_search.search_users(db, query, exclude_user_id=current_user_id, limit=10)
     
-    result = []
-    for user in users:
-        # フレンド関係をチェック
-        friendship = db.query(models.Friendship).filter(
+        # フレンド関係をまとめてチェック（ユーザーごとにクエリを発行しない）
+        user_ids = [user.id for user in users]
+        friendships = db.query(models.Friendship).filter(
             or_(
                 and_(
                     models.Friendship.requester_id == current_user_id,
-                    models.Friendship.requested_id == user.id
+                    models.Friendship.requested_id.in_(user_ids)
                 ),
                 and_(
-                    models.Friendship.requester_id == user.id,
+                    models.Friendship.requester_id.in_(user_ids),
                     models.Friendship.requested_id == current_user_id
                 )
             )
-        ).first()
+        ).order_by(models.Friendship.id).all() if user_ids else []
+
+        friendship_by_user = {}
+        for friendship in friendships:
+            other_id = friendship.requested_id if friendship.requester_id == current_user_id else friendship.requester_id
+            friendship_by_user.setdefault(other_id, friendship)
+    
+        result = []
+        for user in users:
+            friendship = friendship_by_user.get(user.id)
         
-        is_friend = False
-        request_status = None
+            is_friend = False
+            request_status = None
         
-        if friendship:
-            if friendship.status == "accepted":
-                is_friend = True
-            elif friendship.requester_id == current_user_id:
-                request_status = "sent"
-            else:
-                request_status = "received"
+            if friendship:
+                if friendship.status == "accepted":
+                    is_friend = True
+                elif friendship.requester_id == current_user_id:
+                    request_status = "sent"
+                else:
+                    request_status = "received"
         
-        result.append(UserSearchResponse(
-            id=user.id,
-            username=user.username,
-            display_name=user.display_name,
-            is_friend=is_friend,
-            request_status=request_status
-        ))
-    
-    return {"users": result}
+            result.append(UserSearchResponse(
+                id=user.id,
+                username=user.username,
+                display_name=user.display_name,
+                is_friend=is_friend,
+                request_status=request_status
+            ))
+    
+        return {"users": result}
+
+    return await run_db(db, run)
 
 @router.post("/request")
 async def send_friend_request(
@@ -123,65 +137,67 @@ async def send_friend_request(
     db: Session = Depends(get_db)
 ):
     """フレンド申請送信"""
+    def run(db: Session):
+        # 申請先ユーザー検索
+        target_user = db.query(models.User).filter(
+            models.User.username == request_data.username
+        ).first()
     
-    # 申請先ユーザー検索
-    target_user = db.query(models.User).filter(
-        models.User.username == request_data.username
-    ).first()
-    
-    if not target_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ユーザーが見つかりません"
-        )
-    
-    if target_user.id == current_user_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="自分自身にフレンド申請はできません"
-        )
-    
-    # 既存の申請をチェック
-    existing_request = db.query(models.Friendship).filter(
-        or_(
-            and_(
-                models.Friendship.requester_id == current_user_id,
-                models.Friendship.requested_id == target_user.id
-            ),
-            and_(
-                models.Friendship.requester_id == target_user.id,
-                models.Friendship.requested_id == current_user_id
+        if not target_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="ユーザーが見つかりません"
             )
-        )
-    ).first()
     
-    if existing_request:
-        if existing_request.status == "accepted":
+        if target_user.id == current_user_id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="既にフレンドです"
+                detail="自分自身にフレンド申請はできません"
             )
-        elif existing_request.status == "pending":
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="既にフレンド申請を送信済みです"
+    
+        # 既存の申請をチェック
+        existing_request = db.query(models.Friendship).filter(
+            or_(
+                and_(
+                    models.Friendship.requester_id == current_user_id,
+                    models.Friendship.requested_id == target_user.id
+                ),
+                and_(
+                    models.Friendship.requester_id == target_user.id,
+                    models.Friendship.requested_id == current_user_id
+                )
             )
+        ).first()
     
-    # フレンド申請作成
-    friend_request = models.Friendship(
-        requester_id=current_user_id,
-        requested_id=target_user.id,
-        status="pending"
-    )
+        if existing_request:
+            if existing_request.status == "accepted":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="既にフレンドです"
+                )
+            elif existing_request.status == "pending":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="既にフレンド申請を送信済みです"
+                )
     
-    db.add(friend_request)
-    db.commit()
-    db.refresh(friend_request)
+        # フレンド申請作成
+        friend_request = models.Friendship(
+            requester_id=current_user_id,
+            requested_id=target_user.id,
+            status="pending"
+        )
     
-    return {
-        "message": f"{target_user.display_name}さんにフレンド申請を送信しました",
-        "request_id": friend_request.id
-    }
+        db.add(friend_request)
+        db.commit()
+        db.refresh(friend_request)
+    
+        return {
+            "message": f"{target_user.display_name}さんにフレンド申請を送信しました",
+            "request_id": friend_request.id
+        }
+
+    return await run_db(db, run)
 
 @router.get("/requests/received")
 async def get_received_requests(
@@ -189,28 +205,34 @@ async def get_received_requests(
     # current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    current_user_id = get_current_user_id(username=username, db=db)
     """受信したフレンド申請一覧"""
-    
-    requests = db.query(models.Friendship).filter(
-        models.Friendship.requested_id == current_user_id,
-        models.Friendship.status == "pending"
-    ).all()
-    
-    result = []
-    for req in requests:
-        requester = db.query(models.User).filter(models.User.id == req.requester_id).first()
-        result.append(FriendRequestResponse(
-            id=req.id,
-            requester_id=req.requester_id,
-            requested_id=req.requested_id,
-            requester_name=requester.display_name,
-            requested_name="あなた",
-            status=req.status,
-            created_at=req.created_at.isoformat()
-        ))
-    
-    return {"requests": result}
+    current_user_id = await get_current_user_id(username=username, db=db)
+
+    def run(db: Session):
+        # 申請者は JOIN で一緒に取得
+        requests = db.query(models.Friendship).options(
+            joinedload(models.Friendship.requester)
+        ).filter(
+            models.Friendship.requested_id == current_user_id,
+            models.Friendship.status == "pending"
+        ).all()
+    
+        result = []
+        for req in requests:
+            requester = req.requester
+            result.append(FriendRequestResponse(
+                id=req.id,
+                requester_id=req.requester_id,
+                requested_id=req.requested_id,
+                requester_name=requester.display_name,
+                requested_name="あなた",
+                status=req.status,
+                created_at=req.created_at.isoformat()
+            ))
+    
+        return {"requests": result}
+
+    return await run_db(db, run)
 
 @router.get("/requests/sent")
 async def get_sent_requests(
@@ -218,28 +240,34 @@ async def get_sent_requests(
     # current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    current_user_id = get_current_user_id(username=username, db=db)
     """送信したフレンド申請一覧"""
-    
-    requests = db.query(models.Friendship).filter(
-        models.Friendship.requester_id == current_user_id,
-        models.Friendship.status == "pending"
-    ).all()
-    
-    result = []
-    for req in requests:
-        requested = db.query(models.User).filter(models.User.id == req.requested_id).first()
-        result.append(FriendRequestResponse(
-            id=req.id,
-            requester_id=req.requester_id,
-            requested_id=req.requested_id,
-            requester_name="あなた",
-            requested_name=requested.display_name,
-            status=req.status,
-            created_at=req.created_at.isoformat()
-        ))
-    
-    return {"requests": result}
+    current_user_id = await get_current_user_id(username=username, db=db)
+
+    def run(db: Session):
+        # 申請先は JOIN で一緒に取得
+        requests = db.query(models.Friendship).options(
+            joinedload(models.Friendship.requested)
+        ).filter(
+            models.Friendship.requester_id == current_user_id,
+            models.Friendship.status == "pending"
+        ).all()
+    
+        result = []
+        for req in requests:
+            requested = req.requested
+            result.append(FriendRequestResponse(
+                id=req.id,
+                requester_id=req.requester_id,
+                requested_id=req.requested_id,
+                requester_name="あなた",
+                requested_name=requested.display_name,
+                status=req.status,
+                created_at=req.created_at.isoformat()
+            ))
+    
+        return {"requests": result}
+
+    return await run_db(db, run)
 
 @router.post("/requests/{request_id}/accept")
 async def accept_friend_request(
@@ -248,34 +276,39 @@ async def accept_friend_request(
     db: Session = Depends(get_db)
 ):
     """フレンド申請承認"""
+    def run(db: Session):
+        friend_request = db.query(models.Friendship).filter(
+            models.Friendship.id == request_id,
+            models.Friendship.requested_id == current_user_id,
+            models.Friendship.status == "pending"
+        ).first()
     
-    friend_request = db.query(models.Friendship).filter(
-        models.Friendship.id == request_id,
-        models.Friendship.requested_id == current_user_id,
-        models.Friendship.status == "pending"
-    ).first()
-    
-    if not friend_request:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="フレンド申請が見つかりません"
-        )
-    
-    # ステータス更新
-    friend_request.status = "accepted"
-    db.commit()
-    
-    # 申請者の情報取得
-    requester = db.query(models.User).filter(models.User.id == friend_request.requester_id).first()
+        if not friend_request:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="フレンド申請が見つかりません"
+            )
     
-    return {
-        "message": f"{requester.display_name}さんとフレンドになりました",
-        "friend": FriendResponse(
-            id=requester.id,
-            username=requester.username,
-            display_name=requester.display_name
-        )
-    }
+        # ステータス更新（お互いの最近の投稿も同じトランザクションでタイムラインへ）
+        friend_request.status = "accepted"
+        db.flush()
+        feed.on_friendship_added(db.connection(), friend_request.requester_id, friend_request.requested_id)
+        db.commit()
+        friend_graph.add_friendship(friend_request.requester_id, friend_request.requested_id)
+    
+        # 申請者の情報取得
+        requester = db.query(models.User).filter(models.User.id == friend_request.requester_id).first()
+    
+        return {
+            "message": f"{requester.display_name}さんとフレンドになりました",
+            "friend": FriendResponse(
+                id=requester.id,
+                username=requester.username,
+                display_name=requester.display_name
+            )
+        }
+
+    return await run_db(db, run)
 
 @router.post("/requests/{request_id}/reject")
 async def reject_friend_request(
@@ -284,24 +317,27 @@ async def reject_friend_request(
     db: Session = Depends(get_db)
 ):
     """フレンド申請拒否"""
+    def run(db: Session):
+        friend_request = db.query(models.Friendship).filter(
+            models.Friendship.id == request_id,
+            models.Friendship.requested_id == current_user_id,
+            models.Friendship.status == "pending"
+        ).first()
     
-    friend_request = db.query(models.Friendship).filter(
-        models.Friendship.id == request_id,
-        models.Friendship.requested_id == current_user_id,
-        models.Friendship.status == "pending"
-    ).first()
-    
-    if not friend_request:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="フレンド申請が見つかりません"
-        )
+        if not friend_request:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="フレンド申請が見つかりません"
+            )
     
-    # ステータス更新
-    friend_request.status = "rejected"
-    db.commit()
+        # ステータス更新
+        friend_request.status = "rejected"
+        db.commit()
+        friend_graph.remove_friendship(friend_request.requester_id, friend_request.requested_id)
     
-    return {"message": "フレンド申請を拒否しました"}
+        return {"message": "フレンド申請を拒否しました"}
+
+    return await run_db(db, run)
 
 @router.get("/")
 async def get_friends(
@@ -309,30 +345,54 @@ async def get_friends(
     db: Session = Depends(get_db)
 ):
     """フレンド一覧取得"""
-    
-    friendships = db.query(models.Friendship).filter(
-        or_(
-            models.Friendship.requester_id == current_user_id,
-            models.Friendship.requested_id == current_user_id
-        ),
-        models.Friendship.status == "accepted"
-    ).all()
-    
-    friends = []
-    for friendship in friendships:
-        if friendship.requester_id == current_user_id:
-            friend_id = friendship.requested_id
-        else:
-            friend_id = friendship.requester_id
-        
-        friend = db.query(models.User).filter(models.User.id == friend_id).first()
-        friends.append(FriendResponse(
-            id=friend.id,
-            username=friend.username,
-            display_name=friend.display_name
-        ))
-    
-    return {"friends": friends}
+    def run(db: Session):
+        # フレンドIDはキャッシュ（friend_graph.py）から取得
+        friend_ids = sorted(friend_graph.get_friend_ids(db, current_user_id))
+        # フレンドのユーザー情報は IN でまとめて取得
+        users_by_id = {
+            user.id: user
+            for user in db.query(models.User).filter(models.User.id.in_(friend_ids))
+        } if friend_ids else {}
+    
+        friends = []
+        for friend_id in friend_ids:
+            friend = users_by_id[friend_id]
+            friends.append(FriendResponse(
+                id=friend.id,
+                username=friend.username,
+                display_name=friend.display_name
+            ))
+    
+        return {"friends": friends}
+
+    return await run_db(db, run)
+
+@router.get("/feed")
+async def get_feed(
+    cursor: Optional[str] = Query(None, description="前回レスポンスの next_cursor"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """フレンドが投稿したスポットの新着順フィード（feed.py）
+
+    friends_only のスポットを含むので、閲覧者は ?username= ではなくトークンで決める
+    """
+    def run(db: Session):
+        spot_ids, next_cursor = feed.get_feed_page(db, current_user.id, cursor, limit)
+        # 1ページ分のスポットを所有者名と一緒にまとめて取得
+        spots_by_id = {
+            spot.id: spot
+            for spot in db.query(models.Spot).options(*spot_load_options("card"))
+            .filter(models.Spot.id.in_(spot_ids))
+        } if spot_ids else {}
+
+        return {
+            "spots": [SpotCardResponse.model_validate(spots_by_id[spot_id]) for spot_id in spot_ids],
+            "next_cursor": next_cursor
+        }
+
+    return await run_db(db, run)
 
 @router.delete("/{friend_id}")
 async def remove_friend(
@@ -341,28 +401,33 @@ async def remove_friend(
     db: Session = Depends(get_db)
 ):
     """フレンド削除"""
-    
-    friendship = db.query(models.Friendship).filter(
-        or_(
-            and_(
-                models.Friendship.requester_id == current_user_id,
-                models.Friendship.requested_id == friend_id
+    def run(db: Session):
+        friendship = db.query(models.Friendship).filter(
+            or_(
+                and_(
+                    models.Friendship.requester_id == current_user_id,
+                    models.Friendship.requested_id == friend_id
+                ),
+                and_(
+                    models.Friendship.requester_id == friend_id,
+                    models.Friendship.requested_id == current_user_id
+                )
             ),
-            and_(
-                models.Friendship.requester_id == friend_id,
-                models.Friendship.requested_id == current_user_id
-            )
-        ),
-        models.Friendship.status == "accepted"
-    ).first()
+            models.Friendship.status == "accepted"
+        ).first()
     
-    if not friendship:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="フレンド関係が見つかりません"
-        )
+        if not friendship:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="フレンド関係が見つかりません"
+            )
     
-    db.delete(friendship)
-    db.commit()
+        db.delete(friendship)
+        db.flush()
+        feed.on_friendship_removed(db.connection(), current_user_id, friend_id)
+        db.commit()
+        friend_graph.remove_friendship(current_user_id, friend_id)
     
-    return {"message": "フレンドを削除しました"}
\ No newline at end of file
+        return {"message": "フレンドを削除しました"}
+
+    return await run_db(db, run)
\ No newline at end of file
@@ -1,12 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Annotated, Dict, List, Optional, Union
 from datetime import datetime
-import math
 
-from database import get_db
-from models import Spot, User
-from pydantic import BaseModel
+import os
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+
+from database import engine, get_db, run_db
+from models import Spot, SpotLike, User
+from routers import admin
+from routers.users import CurrentUser, get_current_user
+from pydantic import BaseModel, Field, computed_field
+from sqlalchemy import delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only
+import category_stats
+import conditional
+import data_export
+import images
+import likes
+import pagination
+import recommender
+import responses
+import spatial
+import spot_import
+import versions
 
 router = APIRouter(prefix="/api/spots", tags=["spots"])
 
@@ -29,117 +50,378 @@ class SpotUpdate(BaseModel):
     address: Optional[str] = None
     # is_public: Optional[bool] = None
 
-class SpotResponse(BaseModel):
+class SpotMarkerResponse(BaseModel):
+    """地図のマーカー表示用（view=marker）"""
     id: int
     title: str
-    description: Optional[str]
     category: Optional[str]
     latitude: float
     longitude: float
     rating: float
+    distance: Optional[float] = None  # 位置検索時のみ（km）
+
+    class Config:
+        from_attributes = True
+
+class SpotCardResponse(SpotMarkerResponse):
+    """一覧のカード表示用（view=card）"""
     address: Optional[str]
     # is_public: bool
     owner_id: int
     owner_name: str
     created_at: datetime
-    
-    class Config:
-        from_attributes = True
+    like_count: int = 0  # 数秒遅れることがある（likes.py）
+    image_path: Optional[str] = Field(None, exclude=True)
+
+    @computed_field
+    @property
+    def image_urls(self) -> Optional[Dict[str, str]]:
+        """元画像とサムネイル（幅 160 / 480 / 1080）のURL。画像がなければ None"""
+        return images.image_urls(self.image_path)
+
+class SpotResponse(SpotCardResponse):
+    """詳細表示用（view=detail）"""
+    description: Optional[str]
+
+class RecommendedSpotResponse(SpotResponse):
+    score: float
+
+class LikeResponse(BaseModel):
+    liked: bool
+    like_count: int  # 書き込み待ちの増減を含む
+
+# view ごとのレスポンスモデル
+SPOT_VIEWS = {"marker": SpotMarkerResponse, "card": SpotCardResponse, "detail": SpotResponse}
 
 class SpotListResponse(BaseModel):
-    spots: List[SpotResponse]
-    total: int
+    # 情報の多い順に当てはめる（detail → card → marker）
+    spots: List[Annotated[Union[SpotResponse, SpotCardResponse, SpotMarkerResponse], Field(union_mode="left_to_right")]]
+    total: Optional[int]  # total_mode=none のときは None
     page: int
     per_page: int
+    next_cursor: Optional[str] = None  # 続きがあるときのみ
+
+
+def spot_load_options(view: str = "detail") -> list:
+    """view のレスポンスに必要な列だけ読むオプション（所有者の表示名は JOIN で同時に取得）
+
+    読み込まない列にアクセスすると例外にする（気づかないうちに1件ずつ読み込まないように）
+    """
+    model = SPOT_VIEWS[view]
+    # created_at はカーソル作成に使うので常に読む
+    names = {"id", "created_at"} | (set(model.model_fields) & set(Spot.__table__.columns.keys()))
+    options = [load_only(*(getattr(Spot, name) for name in sorted(names)), raiseload=True)]
+    if "owner_name" in model.model_fields:
+        options.append(joinedload(Spot.owner).load_only(User.display_name, raiseload=True))
+    return options
+
+
+# TODO: 認証機能実装後に削除（仮ユーザーの存在確認はプロセスで1回だけ）
+DUMMY_OWNER_ID = 1
+_dummy_owner_ready = False
+
+
+def _ensure_dummy_owner(db: Session) -> int:
+    """仮ユーザー（ID=1）がなければ作成してIDを返す"""
+    global _dummy_owner_ready
+    if not _dummy_owner_ready:
+        if db.get(User, DUMMY_OWNER_ID) is None:
+            db.add(User(
+                id=DUMMY_OWNER_ID,
+                username="dummy_user",
+                hashed_password="dummy_hash",
+                display_name="テストユーザー"
+            ))
+            db.commit()
+        _dummy_owner_ready = True
+    return DUMMY_OWNER_ID
+
+
+def _count_spots(query, db: Session, total_mode: str, category: Optional[str]) -> Optional[int]:
+    """total_mode に応じた総数（exact: COUNT / estimate: 概算 / none: 返さない）"""
+    if total_mode == "exact":
+        return query.order_by(None).count()
+    if total_mode == "estimate":
+        if category:
+            # カテゴリ絞り込みは集計済みの件数を使う
+            return category_stats.get_counts(db).get(category, 0)
+        # 絞り込みなしなら最大IDで概算（主キーインデックスだけで済む）
+        return db.query(func.max(Spot.id)).scalar() or 0
+    return None
+
+
+def _spot_validators(db: Session, spot_id: int):
+    """スポット1件の ETag 用の値（更新日時 + 表示名のバージョン）。なければ None"""
+    row = db.query(Spot.updated_at, Spot.created_at).filter(Spot.id == spot_id).first()
+    if row is None:
+        return None
+    names_version, _ = versions.get_versions(db, versions.OWNER_NAMES)[versions.OWNER_NAMES]
+    return row.updated_at or row.created_at, names_version
+
+
+async def _list_validators(db, request: Request, *parts):
+    """spots と表示名のバージョンから一覧系の ETag と Last-Modified を作る
+
+    users のほかの列（ログイン・パスワード変更など）では変わらない
+    """
+    table_versions = await run_db(db, versions.get_versions, "spots", versions.OWNER_NAMES)
+    etag = conditional.make_etag(
+        *parts, *(version for version, _ in table_versions.values()), request.url.query
+    )
+    last_modified = max((updated for _, updated in table_versions.values() if updated), default=None)
+    return etag, last_modified
 
 
 # エンドポイント実装
 @router.get("/", response_model=SpotListResponse)
 async def get_spots(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
     category: Optional[str] = Query(None),
     lat: Optional[float] = Query(None),
     lng: Optional[float] = Query(None),
     radius: Optional[float] = Query(None, ge=0, le=100),
+    cursor: Optional[str] = Query(None, description="前回レスポンスの next_cursor（指定時は page を無視）"),
+    total_mode: str = Query("exact", pattern="^(exact|estimate|none)$", description="総数の取得方法"),
+    view: str = Query("detail", pattern="^(marker|card|detail)$", description="返す項目（marker: 地図用 / card: 一覧用 / detail: すべて）"),
     db: Session = Depends(get_db)
 ):
     """スポット一覧取得（検索・絞り込み対応）"""
+    # 変更がなければ一覧を読み込まずに 304
+    etag, last_modified = await _list_validators(db, request, "spots")
+    cached = conditional.not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
+    response_model = SPOT_VIEWS[view]
+
+    def run(db: Session):
+        # 基本クエリ
+        # query = db.query(Spot).filter(Spot.is_public == True)
+        query = db.query(Spot)
     
-    # 基本クエリ
-    # query = db.query(Spot).filter(Spot.is_public == True)
-    query = db.query(Spot)
-    
-    # カテゴリ絞り込み
-    if category:
-        query = query.filter(Spot.category == category)
-    
-    # 位置絞り込み（後で距離計算）
-    spots_query = query
+        # カテゴリ絞り込み
+        if category:
+            query = query.filter(Spot.category == category)
     
-    # ページネーション前の総数取得
-    total = query.count()
+        offset = (page - 1) * per_page if cursor is None else 0
+
+        # 位置絞り込み（R*Tree で候補を絞り込み → SQL で距離を計算して距離順に1ページ分）
+        if lat is not None and lng is not None and radius is not None:
+            total = None
+            if total_mode == "exact":
+                total = spatial.count_within_radius(query, db, lat, lng, radius)
+            elif total_mode == "estimate":
+                estimated = spatial.estimate_within_radius(db, lat, lng, radius)
+                if category:
+                    # カテゴリの割合は集計済みの件数から
+                    counts = category_stats.get_counts(db)
+                    estimated *= counts.get(category, 0) / max(sum(counts.values()), 1)
+                total = round(estimated)
+            # カーソルの続きも SQL の (distance, id) 条件で1ページ分だけ読む
+            # view に必要な列・所有者名・距離を1回のSELECTで読む
+            rows = spatial.spots_within_radius(
+                query.options(*spot_load_options(view)), db, lat, lng, radius,
+                limit=per_page + 1, offset=offset, after=pagination.decode_distance_cursor(cursor),
+            )
+            page_items, has_more = pagination.page_after(rows, per_page)
+
+            spots = []
+            for distance, spot in page_items:
+                spot.distance = round(distance, 3)
+                spots.append(spot)
+            # カーソルには丸める前の距離を入れる（SQL の比較とずれないように）
+            last_distance, last_spot = page_items[-1] if has_more else (None, None)
+
+            return SpotListResponse(
+                spots=[response_model.model_validate(spot) for spot in spots],
+                total=total,
+                page=page,
+                per_page=per_page,
+                next_cursor=pagination.distance_cursor(last_distance, last_spot.id) if has_more else None
+            )
+
+        # ページネーション前の総数取得
+        total = _count_spots(query, db, total_mode, category)
     
-    # ページネーション適用
-    offset = (page - 1) * per_page
-    spots = spots_query.offset(offset).limit(per_page).all()
+        # ページネーション適用（新着順。カーソル指定時は OFFSET なし）
+        # view に必要な列と所有者名だけを1回のSELECTで読む
+        query = pagination.apply_created_cursor(query.options(*spot_load_options(view)), cursor)
+        spots, has_more = pagination.page_after(query.offset(offset).limit(per_page + 1).all(), per_page)
 
     
-    return SpotListResponse(
-        spots=spots,
-        total=total,
-        page=page,
-        per_page=per_page
+        return SpotListResponse(
+            spots=[response_model.model_validate(spot) for spot in spots],
+            total=total,
+            page=page,
+            per_page=per_page,
+            next_cursor=pagination.created_cursor(spots[-1]) if has_more else None
+        )
+
+    result = await run_db(db, run)
+    conditional.set_cache_headers(response, etag, last_modified)
+    # FAST_RESPONSES=1 なら orjson で1回だけシリアライズ（responses.py）
+    return responses.render(result, response)
+
+# /{spot_id} より先に登録する（"export" が spot_id として解釈されないように）
+@router.get("/export")
+async def export_spots(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    category: Optional[str] = Query(None),
+    south: Optional[float] = Query(None, ge=-90, le=90, description="矩形で絞り込む場合は4つとも指定"),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """スポットのエクスポート（NDJSON / CSV をストリーミングで返す。ログインユーザーから見えるものだけ）"""
+    bounds = (south, north, west, east)
+    bbox = None
+    if any(value is not None for value in bounds):
+        if any(value is None for value in bounds):
+            raise HTTPException(status_code=400, detail="south / north / west / east はすべて指定してください")
+        bbox = bounds
+
+    # 読み込みはサーバーサイドカーソルで少しずつ（data_export.py）
+    return StreamingResponse(
+        data_export.export_spots(engine, format, category, bbox, viewer_id=current_user.id),
+        media_type=data_export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="spots.{format}"'},
     )
 
 @router.get("/{spot_id}", response_model=SpotResponse)
-async def get_spot(spot_id: int, db: Session = Depends(get_db)):
+async def get_spot(spot_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """特定スポット取得"""
-    spot = db.query(Spot).filter(Spot.id == spot_id).first()
-    if not spot:
+    validators = await run_db(db, _spot_validators, spot_id)
+    if validators is None:
         raise HTTPException(status_code=404, detail="スポットが見つかりません")
+    last_modified, names_version = validators
+    etag = conditional.make_etag("spot", spot_id, last_modified, names_version)
+    cached = conditional.not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
+    def run(db: Session):
+        spot = db.query(Spot).options(*spot_load_options("detail")).filter(Spot.id == spot_id).first()
+        if not spot:
+            raise HTTPException(status_code=404, detail="スポットが見つかりません")
     
-    return spot
+        return SpotResponse.model_validate(spot)
+
+    result = await run_db(db, run)
+    conditional.set_cache_headers(response, etag, last_modified)
+    # FAST_RESPONSES=1 なら orjson で1回だけシリアライズ（responses.py）
+    return responses.render(result, response)
 
 @router.post("/", response_model=SpotResponse)
 async def create_spot(spot: SpotCreate, db: Session = Depends(get_db)):
     """新規スポット投稿"""
+    def run(db: Session):
+        # TODO: 認証機能実装後にowner_idを正しく設定
+        # 現在は仮のユーザーID（1）を使用
+        owner_id = _ensure_dummy_owner(db)
     
-    # TODO: 認証機能実装後にowner_idを正しく設定
-    # 現在は仮のユーザーID（1）を使用
-    owner_id = 1
-    
-    # 仮ユーザーが存在しない場合は作成
-    user = db.query(User).filter(User.id == owner_id).first()
-    if not user:
-        dummy_user = User(
-            id=1,
-            username="dummy_user",
-            email="dummy@example.com",
-            hashed_password="dummy_hash",
-            display_name="テストユーザー"
+        # スポット作成
+        db_spot = Spot(
+            title=spot.title,
+            description=spot.description,
+            category=spot.category,
+            latitude=spot.latitude,
+            longitude=spot.longitude,
+            rating=spot.rating,
+            address=spot.address,
+            # is_public=spot.is_public,
+            owner_id=owner_id
         )
-        db.add(dummy_user)
+    
+        db.add(db_spot)
         db.commit()
+        db.refresh(db_spot)
     
-    # スポット作成
-    db_spot = Spot(
-        title=spot.title,
-        description=spot.description,
-        category=spot.category,
-        latitude=spot.latitude,
-        longitude=spot.longitude,
-        rating=spot.rating,
-        address=spot.address,
-        # is_public=spot.is_public,
-        owner_id=owner_id
+        return SpotResponse.model_validate(db_spot)
+
+    return responses.render(await run_db(db, run))
+
+@router.post("/import")
+async def import_spots(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$", description="省略時は Content-Type で判定"),
+    owner_id: Optional[int] = Query(None, description="投稿者（省略時は自分。他のユーザーを指定するには X-Admin-Token が必要）"),
+    x_admin_token: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """スポットの一括取り込み（NDJSON / CSV をリクエストボディで送る）"""
+    if owner_id is None or owner_id == current_user.id:
+        owner_id = current_user.id
+    elif not admin.is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="他のユーザーの投稿として取り込むには管理者トークンが必要です")
+    elif await run_db(db, lambda db: db.get(User, owner_id)) is None:
+        raise HTTPException(status_code=404, detail="投稿者が見つかりません")
+    fmt = format or spot_import.detect_format(None, request.headers.get("content-type"))
+    stream = request.stream()
+
+    def body_chunks():
+        # ワーカースレッドから、イベントループ側のリクエストボディを少しずつ受け取る
+        while True:
+            try:
+                yield anyio.from_thread.run(stream.__anext__)
+            except StopAsyncIteration:
+                return
+
+    # 読み込み・検証・INSERT はまとめてスレッドで（spot_import.py）
+    return await run_in_threadpool(
+        spot_import.import_spots, engine, spot_import.iter_lines(body_chunks()), fmt, owner_id
     )
-    
-    db.add(db_spot)
-    db.commit()
-    db.refresh(db_spot)
-    
-    return db_spot
+
+@router.post("/{spot_id}/image", response_model=SpotResponse)
+async def upload_spot_image(spot_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """スポット画像のアップロード（サムネイルはバックグラウンドで作成）"""
+    # 存在しないスポットへの画像を保存しないように、先にスポットを確認する
+    def exists(db: Session):
+        return db.query(Spot.id).filter(Spot.id == spot_id).first() is not None
+
+    if not await run_db(db, exists):
+        raise HTTPException(status_code=404, detail="スポットが見つかりません")
+
+    # ディスクへの書き込みとハッシュ計算はスレッドで（images.py）
+    filename, created = await run_in_threadpool(images.store_upload, file.file)
+
+    def run(db: Session):
+        spot = db.query(Spot).filter(Spot.id == spot_id).first()
+        if not spot:
+            return None
+        spot.image_path = filename
+        db.commit()
+        db.refresh(spot)
+        return SpotResponse.model_validate(spot)
+
+    result = await run_db(db, run)
+    if result is None:
+        # 確認後に削除された場合。新しく保存した画像は他から参照されていないので消す
+        if created:
+            await run_in_threadpool(images.discard, filename)
+        raise HTTPException(status_code=404, detail="スポットが見つかりません")
+    # 既存の画像でも、サムネイル作成が失敗していればここで作り直す
+    if images.thumbnails_missing(filename):
+        images.schedule_thumbnails(filename)
+    return responses.render(result)
+
+@router.get("/images/{filename}")
+async def get_spot_image(filename: str):
+    """スポット画像の配信（内容のハッシュがファイル名なので長期キャッシュ）"""
+    path, media_type, immutable = images.resolve(filename)
+    headers = {
+        "Cache-Control": images.IMMUTABLE_CACHE_CONTROL if immutable else images.FALLBACK_CACHE_CONTROL,
+    }
+    if images.ACCEL_REDIRECT_PREFIX:
+        # nginx に配信させる（sendfile）
+        relative = os.path.relpath(path, images.IMAGE_DIR).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = images.ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative
+        return Response(media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 @router.put("/{spot_id}", response_model=SpotResponse)
 async def update_spot(
@@ -148,38 +430,90 @@ async def update_spot(
     db: Session = Depends(get_db)
 ):
     """スポット更新"""
-    spot = db.query(Spot).filter(Spot.id == spot_id).first()
-    if not spot:
-        raise HTTPException(status_code=404, detail="スポットが見つかりません")
+    def run(db: Session):
+        spot = db.query(Spot).filter(Spot.id == spot_id).first()
+        if not spot:
+            raise HTTPException(status_code=404, detail="スポットが見つかりません")
     
-    # TODO: 認証機能実装後に所有者チェック追加
-    # if spot.owner_id != current_user.id:
-    #     raise HTTPException(status_code=403, detail="権限がありません")
+        # TODO: 認証機能実装後に所有者チェック追加
+        # if spot.owner_id != current_user.id:
+        #     raise HTTPException(status_code=403, detail="権限がありません")
     
-    # 更新データの適用
-    update_data = spot_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(spot, field, value)
+        # 更新データの適用
+        update_data = spot_update.dict(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(spot, field, value)
     
-    spot.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(spot)
+        # updated_at はモデルの onupdate（UTC）で更新される。変更がなければ UPDATE もしない
+        db.commit()
+        db.refresh(spot)
     
-    return spot
+        return SpotResponse.model_validate(spot)
+
+    return responses.render(await run_db(db, run))
 
 @router.delete("/{spot_id}")
 async def delete_spot(spot_id: int, db: Session = Depends(get_db)):
     """スポット削除"""
-    spot = db.query(Spot).filter(Spot.id == spot_id).first()
-    if not spot:
-        raise HTTPException(status_code=404, detail="スポットが見つかりません")
+    def run(db: Session):
+        spot = db.query(Spot).filter(Spot.id == spot_id).first()
+        if not spot:
+            raise HTTPException(status_code=404, detail="スポットが見つかりません")
     
-    # TODO: 認証機能実装後に所有者チェック追加
+        # TODO: 認証機能実装後に所有者チェック追加
     
-    db.delete(spot)
-    db.commit()
+        db.delete(spot)
+        db.commit()
     
-    return {"message": "スポットを削除しました"}
+        return {"message": "スポットを削除しました"}
+
+    return await run_db(db, run)
+
+def _like_count(db: Session, spot_id: int) -> int:
+    stored = db.query(Spot.like_count).filter(Spot.id == spot_id).scalar()
+    if stored is None:
+        raise HTTPException(status_code=404, detail="スポットが見つかりません")
+    return stored + likes.like_counter.pending(spot_id)
+
+@router.post("/{spot_id}/like", response_model=LikeResponse)
+async def like_spot(
+    spot_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """いいね（済みなら何もしない）。like_count はまとめて更新（likes.py）"""
+    def run(db: Session):
+        _like_count(db, spot_id)  # スポットの存在確認
+        db.add(SpotLike(spot_id=spot_id, user_id=current_user.id))
+        try:
+            db.commit()
+        except IntegrityError:
+            # (spot_id, user_id) のユニークインデックス：いいね済み
+            db.rollback()
+        else:
+            likes.like_counter.add(spot_id, 1)
+        return LikeResponse(liked=True, like_count=_like_count(db, spot_id))
+
+    return await run_db(db, run)
+
+@router.delete("/{spot_id}/like", response_model=LikeResponse)
+async def unlike_spot(
+    spot_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """いいねの取り消し（していなければ何もしない）"""
+    def run(db: Session):
+        _like_count(db, spot_id)
+        result = db.execute(delete(SpotLike).where(
+            SpotLike.spot_id == spot_id, SpotLike.user_id == current_user.id
+        ))
+        db.commit()
+        if result.rowcount:
+            likes.like_counter.add(spot_id, -1)
+        return LikeResponse(liked=False, like_count=_like_count(db, spot_id))
+
+    return await run_db(db, run)
 
 @router.get("/recommend/for-user")
 async def get_recommendations(
@@ -188,28 +522,56 @@ async def get_recommendations(
     limit: int = Query(5, ge=1, le=20),
     db: Session = Depends(get_db)
 ):
-    """おすすめスポット取得（簡単ロジック）"""
-    
-    #return {
-    #    "recommendations": recommended_spots,
-    #    "algorithm": "distance_and_rating_based",
-    #    "user_location": {"lat": user_lat, "lng": user_lng}
-    #}
-    pass
+    """おすすめスポット取得（距離・評価・新しさのスコア順）"""
+    def run(db: Session):
+        ranked = recommender.recommend(db, user_lat, user_lng, limit)
+
+        spots_by_id = {
+            spot.id: spot
+            for spot in db.query(Spot).options(*spot_load_options("detail"))
+            .filter(Spot.id.in_([spot_id for spot_id, _, _ in ranked]))
+        }
+        recommended_spots = []
+        for spot_id, score, distance in ranked:
+            spot = spots_by_id.get(spot_id)
+            if spot is None:  # スナップショット作成後に削除された
+                continue
+            spot.distance = round(distance, 3)
+            spot.score = round(score, 4)
+            recommended_spots.append(RecommendedSpotResponse.model_validate(spot))
+
+        return {
+            "recommendations": recommended_spots,
+            "algorithm": "distance_rating_recency",
+            "user_location": {"lat": user_lat, "lng": user_lng}
+        }
+
+    return responses.render(await run_db(db, run))
 
 @router.get("/categories/")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(
+    request: Request,
+    response: Response,
+    include_counts: bool = Query(False, description="カテゴリごとのスポット数も返す"),
+    db: Session = Depends(get_db)
+):
     """利用可能なカテゴリ一覧取得"""
-    # 現在登録されているカテゴリを取得
-    categories = db.query(Spot.category).distinct().filter(
-        Spot.category.isnot(None),
-        # Spot.is_public == True
-    ).all()
-    
-    category_list = [cat[0] for cat in categories if cat[0]]
+    table_versions = await run_db(db, versions.get_versions, "spots")
+    spots_version, last_modified = table_versions["spots"]
+    etag = conditional.make_etag("categories", spots_version, include_counts)
+    cached = conditional.not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+
+    # 現在登録されているカテゴリと件数（category_stats.py、同じバージョンならDBに触れない）
+    counts = await run_db(db, category_stats.get_counts, spots_version)
     
     # デフォルトカテゴリも含める
     default_categories = ["グルメ", "観光", "ショッピング", "エンターテイメント", "自然", "文化"]
-    all_categories = list(set(category_list + default_categories))
+    all_categories = sorted(set(counts) | set(default_categories))
     
-    return {"categories": sorted(all_categories)}
\ No newline at end of file
+    result = {"categories": all_categories}
+    if include_counts:
+        result["counts"] = {category: counts.get(category, 0) for category in all_categories}
+    conditional.set_cache_headers(response, etag, last_modified)
+    return responses.render(result, response)
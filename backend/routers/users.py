@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Security
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from passlib.context import CryptContext
-from database import get_db
+from cache import TTLCache
+from database import get_db, run_db
+from password_hashing import hash_password_async, verify_password_async
 import models
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
+import os
+import time
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/login")
 
@@ -23,9 +27,6 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
-# パスワードハッシュ化
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Pydanticモデル（リクエスト・レスポンス用）
 class UserRegister(BaseModel):
     username: str
@@ -45,15 +46,49 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
-# パスワードハッシュ化関数
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+class CurrentUser(BaseModel):
+    """認証済みユーザー（トークンキャッシュに保存する項目）"""
+    id: int
+    username: str
+    display_name: str
+    created_at: datetime
+
+# 検証済みトークン → ユーザーのキャッシュ（毎リクエストのDB検索を省く）
+# 期限はTTLとトークンのexpの早い方。ユーザー更新（無効化など）のコミット時に削除する
+token_cache = TTLCache(
+    max_size=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300")),
+)
+
+def invalidate_user_tokens(user_id: int) -> int:
+    return token_cache.delete_where(lambda token, user: user.id == user_id)
+
+def _mark_user_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+event.listen(models.User, "after_update", _mark_user_changed)
+event.listen(models.User, "after_delete", _mark_user_changed)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_user_tokens(user_id)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_user_ids", None)
+
+def _find_user(db: Session, username: str):
+    return db.query(models.User).filter(models.User.username == username).first()
 
 # トークンからユーザーを取得する関数例
 async def get_current_user(token: str = Security(oauth2_scheme), db: Session = Depends(get_db)):
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="認証情報が無効です",
@@ -67,24 +102,32 @@ async def get_current_user(token: str = Security(oauth2_scheme), db: Session = D
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
+    user = await run_db(db, _find_user, username)
+    if user is None or not user.is_active:
         raise credentials_exception
-    return user
+
+    current_user = CurrentUser(
+        id=user.id,
+        username=user.username,
+        display_name=user.display_name,
+        created_at=user.created_at
+    )
+    token_cache.set(token, current_user, ttl_seconds=payload.get("exp", 0) - time.time())
+    return current_user
 
 # ユーザー登録
 @router.post("/register", response_model=UserResponse)
 async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
     # ユーザー名の重複チェック
-    existing_user = db.query(models.User).filter(models.User.username == user_data.username).first()
+    existing_user = await run_db(db, _find_user, user_data.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="このユーザー名は既に使用されています"
         )
     
-    # パスワードハッシュ化
-    hashed_password = hash_password(user_data.password)
+    # パスワードハッシュ化（専用ワーカーで実行。password_hashing.py 参照）
+    hashed_password = await hash_password_async(user_data.password)
     
     # 表示名の設定（未設定の場合はユーザー名を使用）
     display_name = user_data.display_name or user_data.username
@@ -96,24 +139,27 @@ async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
         display_name=display_name
     )
     
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    def run(db: Session):
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
     
-    return UserResponse(
-        id=new_user.id,
-        username=new_user.username,
-        display_name=new_user.display_name,
-        created_at=new_user.created_at.isoformat()
-    )
+        return UserResponse(
+            id=new_user.id,
+            username=new_user.username,
+            display_name=new_user.display_name,
+            created_at=new_user.created_at.isoformat()
+        )
+
+    return await run_db(db, run)
 
 # ユーザーログイン
 @router.post("/login")
 async def login_user(login_data: UserLogin, db: Session = Depends(get_db)):
     
     # ユーザー検索
-    user = db.query(models.User).filter(models.User.username == login_data.username).first()
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    user = await run_db(db, _find_user, login_data.username)
+    if not user or not await verify_password_async(login_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="ユーザー名またはパスワードが正しくありません"
@@ -133,7 +179,7 @@ async def login_user(login_data: UserLogin, db: Session = Depends(get_db)):
     }
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
+async def read_users_me(current_user: CurrentUser = Depends(get_current_user)):
     return UserResponse(
         id=current_user.id,
         username=current_user.username,
@@ -145,7 +191,7 @@ async def read_users_me(current_user: models.User = Depends(get_current_user)):
 # ユーザー一覧取得（開発・テスト用）
 @router.get("/", response_model=list[UserResponse])
 async def get_users(db: Session = Depends(get_db)):
-    users = db.query(models.User).filter(models.User.is_active == True).all()
+    users = await run_db(db, lambda db: db.query(models.User).filter(models.User.is_active == True).all())
     return [
         UserResponse(
             id=user.id,
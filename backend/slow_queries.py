@@ -0,0 +1,172 @@
+"""
+遅いクエリのログ（EXPLAIN つき）
+- SLOW_QUERY_MS 以上かかった SQL を、正規化したSQL（IN のリストや数値・文字列リテラルをまとめたもの）ごとに集計
+- 初めて見たSQLは実行計画（SQLite: EXPLAIN QUERY PLAN / MySQL: EXPLAIN）を取得して一緒に保存
+- SLOW_QUERY_SAMPLE_RATE の割合だけ1件ずつログに出す（集計はすべて）
+- 呼び出し元のルートは metrics.py のリクエスト情報から取る（METRICS_ENABLED=0 なら不明）
+- 上位は GET /api/admin/slow-queries で確認（routers/admin.py）
+- SLOW_QUERY_MS=off で無効
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+import metrics
+
+_threshold = os.getenv("SLOW_QUERY_MS", "200")
+ENABLED = _threshold != "off"
+THRESHOLD_SECONDS = float(_threshold) / 1000 if ENABLED else float("inf")
+SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "1.0"))
+# 保存する正規化SQLの種類数（超えたら合計時間の少ないものから捨てる）
+MAX_ENTRIES = int(os.getenv("SLOW_QUERY_MAX_ENTRIES", "200"))
+# ログに出すパラメータの最大文字数（長い値・個人情報を出しすぎないように）
+MAX_PARAMS_CHARS = 200
+
+# 実行計画を取るのは読み込み系のSQLだけ
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE)\b", re.IGNORECASE)
+_IN_LIST = re.compile(r"\(\s*(?:\?|%s|:\w+|\$\d+)(?:\s*,\s*(?:\?|%s|:\w+|\$\d+))*\s*\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """同じ形のSQLが1つにまとまるように正規化"""
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+def _short_params(parameters) -> str:
+    text = repr(parameters)
+    return text if len(text) <= MAX_PARAMS_CHARS else text[:MAX_PARAMS_CHARS] + "..."
+
+
+def explain(connection, statement: str, parameters) -> Optional[List[str]]:
+    """同じ接続で実行計画を取得（SQLAlchemy のイベントを通さないよう DBAPI のカーソルで実行）"""
+    if not _EXPLAINABLE.match(statement):
+        return None
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    elif dialect in ("mysql", "mariadb"):
+        prefix = "EXPLAIN "
+    else:
+        return None
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        columns = [description[0] for description in cursor.description or ()]
+        rows = cursor.fetchall()
+    except Exception as e:  # 計画が取れなくても元のクエリには影響させない
+        return [f"EXPLAIN 失敗: {e}"]
+    finally:
+        cursor.close()
+    if dialect == "sqlite":
+        # (id, parent, notused, detail) → detail
+        return [str(row[-1]) for row in rows]
+    return [json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) for row in rows]
+
+
+class SlowQueryLog:
+    """正規化SQLごとの件数・時間・実行計画"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def needs_plan(self, sql: str) -> bool:
+        entry = self._entries.get(sql)
+        return entry is None or entry["plan"] is None
+
+    def record(self, sql: str, statement: str, parameters, seconds: float, route: Optional[str],
+               plan: Optional[List[str]]) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            entry = self._entries.get(sql)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    # 合計時間が一番少ないものを捨てる
+                    del self._entries[min(self._entries, key=lambda key: self._entries[key]["total_ms"])]
+                entry = self._entries[sql] = {
+                    "sql": sql, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "routes": Counter(), "plan": None, "first_seen": now,
+                }
+            ms = seconds * 1000
+            entry["count"] += 1
+            entry["total_ms"] += ms
+            if ms >= entry["max_ms"]:
+                # 一番遅かったときのSQL・パラメータを残す
+                entry["max_ms"] = ms
+                entry["example"] = statement
+                entry["example_params"] = _short_params(parameters)
+            entry["routes"][route or "-"] += 1
+            entry["last_seen"] = now
+            if plan is not None and entry["plan"] is None:
+                entry["plan"] = plan
+            return entry
+
+    def top(self, limit: int = 20, order: str = "total_ms") -> List[dict]:
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry[order], reverse=True)[:limit]
+            return [
+                {**entry, "total_ms": round(entry["total_ms"], 3), "max_ms": round(entry["max_ms"], 3),
+                 "mean_ms": round(entry["total_ms"] / entry["count"], 3), "routes": dict(entry["routes"])}
+                for entry in entries
+            ]
+
+
+slow_query_log = SlowQueryLog()
+
+_instrumented = set()
+
+
+def _on_slow_query(conn, statement: str, parameters, executemany: bool, seconds: float) -> None:
+    sql = normalize(statement)
+    # 実行計画は正規化SQLごとに1回だけ取る
+    plan = explain(conn, statement, parameters) if not executemany and slow_query_log.needs_plan(sql) else None
+    route = metrics.current_route()
+    slow_query_log.record(sql, statement, parameters, seconds, route, plan)
+    if random.random() < SAMPLE_RATE:
+        print("遅いクエリ:", json.dumps({
+            "ms": round(seconds * 1000, 3), "route": route, "sql": sql,
+            "params": _short_params(parameters), "plan": plan,
+        }, ensure_ascii=False))
+
+
+def instrument_engine(engine) -> None:
+    """エンジンのクエリ時間を測り、THRESHOLD_SECONDS 以上のものを記録する"""
+    if not ENABLED or engine in _instrumented:
+        return
+    _instrumented.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info["slow_query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("slow_query_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        if seconds >= THRESHOLD_SECONDS:
+            _on_slow_query(conn, statement, parameters, executemany, seconds)
@@ -0,0 +1,218 @@
+"""
+位置検索用ヘルパー
+- Haversine公式による距離計算
+- 半径検索用のバウンディングボックス計算
+- SQLite R*Tree 空間インデックス（spots_rtree）の作成・同期
+- 半径検索: 距離の計算・並べ替え・LIMIT は SQL で行い、検索半径を小さい円から広げていく
+"""
+import math
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, and_, func, or_, text
+from sqlalchemy.orm import Query, Session
+
+from models import Spot
+
+EARTH_RADIUS_KM = 6371.0
+# 半径検索で最初に探す半径（km）。足りなければ2倍ずつ広げる
+RING_START_KM = 1.0
+
+# R*Tree はSQLite専用の仮想テーブルなので Base.metadata とは別管理
+# （create_all の対象にしない）
+_rtree_metadata = MetaData()
+spots_rtree = Table(
+    "spots_rtree",
+    _rtree_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("min_lat", Float),
+    Column("max_lat", Float),
+    Column("min_lng", Float),
+    Column("max_lng", Float),
+)
+
+# spots テーブルへの INSERT / UPDATE / DELETE を R*Tree に反映するトリガー
+_RTREE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS spots_rtree
+    USING rtree(id, min_lat, max_lat, min_lng, max_lng)
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS spots_rtree_insert AFTER INSERT ON spots
+    BEGIN
+        INSERT OR REPLACE INTO spots_rtree
+        VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS spots_rtree_update AFTER UPDATE OF latitude, longitude ON spots
+    BEGIN
+        INSERT OR REPLACE INTO spots_rtree
+        VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS spots_rtree_delete AFTER DELETE ON spots
+    BEGIN
+        DELETE FROM spots_rtree WHERE id = old.id;
+    END
+    """,
+]
+
+
+def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """2点間の距離（km）をHaversine公式で計算"""
+    # 度からラジアンに変換
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    # 角度差を計算
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lng2 - lng1)
+    # Haversine公式適用
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    # 距離に変換
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def register_sqlite_functions(dbapi_connection) -> None:
+    """SQLite の接続に haversine_km(lat1, lng1, lat2, lng2) を登録（database.py の connect イベントから）"""
+    dbapi_connection.create_function("haversine_km", 4, calculate_distance, deterministic=True)
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """中心と半径を含む緯度経度の矩形 (south, north, west, east) を返す
+
+    距離の判定（calculate_distance）と同じ球（EARTH_RADIUS_KM）で計算する
+    （1度=111.32km などの別の値だと、矩形が円より小さくなり半径ぎりぎりのスポットが漏れる）
+    """
+    angle = radius_km / EARTH_RADIUS_KM  # 中心角（ラジアン）
+    d_lat = math.degrees(angle)
+    cos_lat = math.cos(math.radians(lat))
+    if lat + d_lat >= 90.0 or lat - d_lat <= -90.0 or math.sin(angle) >= cos_lat:
+        # 極を含む円は全経度
+        d_lng = 180.0
+    else:
+        # 円に接する経線までの経度差（経度が最大になる点は中心より極側にある）
+        d_lng = math.degrees(math.asin(math.sin(angle) / cos_lat))
+
+    south = max(lat - d_lat, -90.0)
+    north = min(lat + d_lat, 90.0)
+    # 日付変更線をまたぐ検索は想定しない（国内利用のため）
+    west = max(lng - d_lng, -180.0)
+    east = min(lng + d_lng, 180.0)
+    return south, north, west, east
+
+
+def uses_rtree(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def create_spatial_index(engine) -> None:
+    """R*Tree 仮想テーブルと同期トリガーを作成（SQLiteのみ）
+
+    既存DBで spots にだけデータがある場合は R*Tree にまとめて投入する。
+    SQLite以外は spots の (latitude, longitude) 複合インデックスで代用する。
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    with engine.begin() as conn:
+        for ddl in _RTREE_DDL:
+            conn.execute(text(ddl))
+
+        indexed = conn.execute(text("SELECT COUNT(*) FROM spots_rtree")).scalar()
+        if indexed == 0:
+            conn.execute(text("""
+                INSERT INTO spots_rtree (id, min_lat, max_lat, min_lng, max_lng)
+                SELECT id, latitude, latitude, longitude, longitude FROM spots
+            """))
+
+
+def filter_bbox(query, use_rtree: bool, south: float, north: float, west: float, east: float):
+    """クエリ（Query / select）を緯度経度の矩形で絞り込む"""
+    if use_rtree:
+        # R*Tree はボックスを外側に丸めて保存するので境界上の点も漏れない（はみ出た分は下の条件で除く）
+        query = query.join(spots_rtree, spots_rtree.c.id == Spot.id).filter(
+            spots_rtree.c.max_lat >= south,
+            spots_rtree.c.min_lat <= north,
+            spots_rtree.c.max_lng >= west,
+            spots_rtree.c.min_lng <= east,
+        )
+
+    return query.filter(
+        Spot.latitude.between(south, north),
+        Spot.longitude.between(west, east),
+    )
+
+
+def bbox_candidates(query: Query, db: Session, lat: float, lng: float, radius_km: float) -> Query:
+    """クエリにバウンディングボックスの事前絞り込みを追加"""
+    return filter_bbox(query, uses_rtree(db), *bounding_box(lat, lng, radius_km))
+
+
+def distance_km(db: Session, lat: float, lng: float):
+    """スポットから (lat, lng) までの距離（km）の SQL 式"""
+    if uses_rtree(db):
+        return func.haversine_km(Spot.latitude, Spot.longitude, lat, lng)
+    # MySQL: 同じ地球半径で計算（メートル → km）
+    return func.ST_Distance_Sphere(
+        func.point(Spot.longitude, Spot.latitude), func.point(lng, lat), EARTH_RADIUS_KM * 1000
+    ) / 1000
+
+
+def _within(query: Query, db: Session, lat: float, lng: float, radius_km: float):
+    distance = distance_km(db, lat, lng)
+    return bbox_candidates(query, db, lat, lng, radius_km).filter(distance <= radius_km), distance
+
+
+def spots_within_radius(query: Query, db: Session, lat: float, lng: float, radius_km: float,
+                        limit: Optional[int] = None, offset: int = 0,
+                        after: Optional[Tuple[float, int]] = None) -> List[Tuple[float, Spot]]:
+    """半径内のスポットを距離順に limit 件（None ならすべて）、(距離km, Spot) のリストで返す
+
+    query は Spot を絞り込むクエリ（カテゴリ条件・load_only などのオプション）。
+    距離は同じ SELECT の列として読むので、スポットの読み込みは1回で済む。
+    候補はバウンディングボックス（R*Tree）で絞り、距離の計算・並べ替え・LIMIT は SQL で行う。
+    after=(距離, id) を渡すと (distance, id) がそれより後ろのものだけ（キーセット）。
+    RING_START_KM の円（after があればその距離 + RING_START_KM）から探し始め、
+    足りなければ半径を2倍にして探し直す
+    （密集地では半径全体の候補を読まずに済む。内側の円で足りれば、外側にそれより近い点はない）
+    """
+    start = RING_START_KM if after is None else after[0] + RING_START_KM
+    ring = radius_km if limit is None else min(start, radius_km)
+    while True:
+        candidates, distance = _within(query, db, lat, lng, ring)
+        if after is not None:
+            # (distance, id) > (after_distance, after_id)
+            candidates = candidates.filter(or_(
+                distance > after[0],
+                and_(distance == after[0], Spot.id > after[1]),
+            ))
+        ordered = distance.label("distance")
+        rows = (
+            candidates.add_columns(ordered)
+            .order_by(ordered, Spot.id).offset(offset).limit(limit).all()
+        )
+        if limit is None or len(rows) >= limit or ring >= radius_km:
+            return [(row.distance, row[0]) for row in rows]
+        ring = min(ring * 2, radius_km)
+
+
+def count_within_radius(query: Query, db: Session, lat: float, lng: float, radius_km: float) -> int:
+    """半径内の件数"""
+    candidates, _ = _within(query.with_entities(Spot.id), db, lat, lng, radius_km)
+    return candidates.order_by(None).count()
+
+
+def estimate_within_radius(db: Session, lat: float, lng: float, radius_km: float) -> float:
+    """半径内の全スポット数の概算（空間インデックスだけで数えたバウンディングボックス内の件数 × 円/正方形の面積比）"""
+    south, north, west, east = bounding_box(lat, lng, radius_km)
+    if uses_rtree(db):
+        in_box = db.query(func.count()).select_from(spots_rtree).filter(
+            spots_rtree.c.max_lat >= south, spots_rtree.c.min_lat <= north,
+            spots_rtree.c.max_lng >= west, spots_rtree.c.min_lng <= east,
+        ).scalar()
+    else:
+        in_box = db.query(func.count(Spot.id)).filter(
+            Spot.latitude.between(south, north), Spot.longitude.between(west, east)
+        ).scalar()
+    return in_box * math.pi / 4
@@ -0,0 +1,226 @@
+"""
+スポットの一括取り込み（NDJSON / CSV）
+- 1行ずつ読みながら検証し、CHUNK_SIZE 件ごとに executemany でまとめて INSERT
+- チャンクごとに1トランザクション（カテゴリ件数・更新バージョンも同じトランザクションで反映）
+- 不正な行はスキップして行番号とエラーを返す
+- POST /api/spots/import と CLI から使う
+
+    cd backend
+    python spot_import.py spots.ndjson --owner-id 1
+    python spot_import.py spots.csv --chunk-size 10000
+"""
+import argparse
+import codecs
+import csv
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import bindparam, func, select
+
+import category_stats
+import feed
+import versions
+from models import Spot
+
+CHUNK_SIZE = int(os.getenv("SPOT_IMPORT_CHUNK_SIZE", "5000"))
+# レスポンスに含めるエラーの最大件数（件数自体はすべて数える）
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ("ndjson", "csv")
+
+# INSERT する列（created_at / updated_at はチャンクごとに同じ時刻）
+INSERT_COLUMNS = (
+    "title", "description", "category", "latitude", "longitude", "rating",
+    "address", "visibility", "owner_id", "like_count", "created_at", "updated_at",
+)
+
+
+class SpotImportRow(BaseModel):
+    """取り込む1行（SpotCreate と同じ項目 + 座標の範囲チェック）"""
+    title: str = Field(min_length=1, max_length=100)
+    description: Optional[str] = None
+    category: Optional[str] = Field(None, max_length=50)
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    rating: Optional[float] = 0
+    address: Optional[str] = Field(None, max_length=200)
+    visibility: Optional[str] = "friends_only"
+
+
+def detect_format(name: Optional[str], content_type: Optional[str] = None) -> str:
+    """ファイル名・Content-Type から形式を判定（わからなければ ndjson）"""
+    if content_type and "csv" in content_type:
+        return "csv"
+    if name and name.lower().endswith(".csv"):
+        return "csv"
+    return "ndjson"
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """バイト列のチャンクを行に分割（UTF-8、BOM付きも可）"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+def iter_records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """(行番号, レコード, エラー) を順に返す"""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            # CSVの空欄は未指定として扱う
+            yield reader.line_num, {key: value for key, value in record.items() if key and value != ""}, None
+        return
+
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"JSONとして読めません: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "1行に1つのJSONオブジェクトを書いてください"
+            continue
+        yield line_no, record, None
+
+
+class SpotImporter:
+    """検証済みの行を溜めて、CHUNK_SIZE 件ごとに INSERT する"""
+
+    def __init__(self, engine, owner_id: int, chunk_size: int = CHUNK_SIZE):
+        self.engine = engine
+        self.owner_id = owner_id
+        self.chunk_size = chunk_size
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self._rows: List[dict] = []
+
+        table = Spot.__table__
+        self._compiled = table.insert().values(
+            {name: bindparam(name) for name in INSERT_COLUMNS}
+        ).compile(dialect=engine.dialect)
+        process = table.c.created_at.type.dialect_impl(engine.dialect).bind_processor(engine.dialect)
+        self._process_datetime = process or (lambda value: value)
+
+    def add_error(self, line_no: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def add(self, line_no: int, record: dict) -> None:
+        try:
+            row = SpotImportRow.model_validate(record)
+        except ValidationError as e:
+            message = "; ".join(
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            self.add_error(line_no, message)
+            return
+        self._rows.append({
+            "title": row.title,
+            "description": row.description,
+            "category": row.category,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            "rating": row.rating or 0,
+            "address": row.address,
+            "visibility": row.visibility,
+            "owner_id": self.owner_id,
+            "like_count": 0,
+        })
+        if len(self._rows) >= self.chunk_size:
+            self.flush()
+
+    def _insert(self, conn, rows: List[dict]) -> None:
+        now = datetime.now(timezone.utc)
+        if self._compiled.positiontup is None:
+            # 名前付きパラメータのドライバは通常の executemany
+            for row in rows:
+                row["created_at"] = row["updated_at"] = now
+            conn.execute(Spot.__table__.insert(), rows)
+            return
+
+        # 1行ごとの型変換・デフォルト値の処理を省き、ドライバの executemany に直接渡す
+        timestamp = self._process_datetime(now)
+        for row in rows:
+            row["created_at"] = row["updated_at"] = timestamp
+        positions = self._compiled.positiontup
+        conn.exec_driver_sql(self._compiled.string, [tuple(row[name] for name in positions) for row in rows])
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        # ORM のイベントを通らないので、件数・バージョン・フィードはここで更新する
+        with self.engine.begin() as conn:
+            last_id = conn.execute(select(func.max(Spot.id))).scalar() or 0
+            self._insert(conn, rows)
+            feed.fan_out_after(conn, self.owner_id, last_id)
+            category_stats.apply_deltas(conn, Counter(row["category"] for row in rows))
+            # 推薦のスナップショットはバージョンが進んだのを見て追加分を継ぎ足す
+            versions.bump(conn, ["spots"])
+        category_stats.invalidate()
+        self.inserted += len(rows)
+
+    def result(self) -> dict:
+        return {"inserted": self.inserted, "failed": self.failed, "errors": self.errors}
+
+
+def import_spots(engine, lines: Iterable[str], fmt: str, owner_id: int, chunk_size: int = CHUNK_SIZE) -> dict:
+    """行のイテレータから取り込み、件数とエラーを返す"""
+    if fmt not in FORMATS:
+        raise ValueError(f"未対応の形式です: {fmt}")
+    importer = SpotImporter(engine, owner_id, chunk_size)
+    for line_no, record, error in iter_records(lines, fmt):
+        if error:
+            importer.add_error(line_no, error)
+        else:
+            importer.add(line_no, record)
+    importer.flush()
+    return importer.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スポットの一括取り込み（NDJSON / CSV）")
+    parser.add_argument("path", help="取り込むファイル（- で標準入力）")
+    parser.add_argument("--format", choices=FORMATS, help="省略時は拡張子で判定")
+    parser.add_argument("--owner-id", type=int, default=1, help="投稿者のユーザーID")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from database import SessionLocal, create_tables, engine
+    from models import User
+
+    create_tables()
+    with SessionLocal() as db:
+        if db.get(User, args.owner_id) is None:
+            parser.error(f"ユーザーID {args.owner_id} が存在しません")
+
+    fmt = args.format or detect_format(args.path)
+    if args.path == "-":
+        result = import_spots(engine, iter_lines(iter(lambda: sys.stdin.buffer.read(1 << 16), b"")),
+                              fmt, args.owner_id, args.chunk_size)
+    else:
+        with open(args.path, "rb") as f:
+            result = import_spots(engine, iter_lines(iter(lambda: f.read(1 << 16), b"")),
+                                  fmt, args.owner_id, args.chunk_size)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# テスト用の一時ディレクトリにDBを作る（main.py は data/posts.db を相対パスで開く）
+_tmp_dir = tempfile.mkdtemp(prefix="spotshare-test-")
+os.makedirs(os.path.join(_tmp_dir, "data"), exist_ok=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/data/spots.db"
+os.chdir(_tmp_dir)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import category_stats  # noqa: E402
+import likes  # noqa: E402
+import main  # noqa: E402
+import recommender  # noqa: E402
+from database import Base, SessionLocal, create_tables, engine  # noqa: E402
+from friend_graph import friend_graph  # noqa: E402
+from routers import spots as spots_router  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    create_tables()
+    yield
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    # プロセス内キャッシュもリセット
+    recommender.invalidate()
+    category_stats.invalidate()
+    friend_graph.clear()
+    likes.like_counter.clear()
+    spots_router._dummy_owner_ready = False
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
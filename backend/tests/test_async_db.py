@@ -0,0 +1,72 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import database
+import main
+
+pytest.importorskip("aiosqlite")
+
+
+@pytest.fixture
+def async_client():
+    """DB_MODE=async と同じ AsyncSession でリクエストを処理するクライアント（DB_MODE=sync でも動かす）"""
+    if database.DB_MODE == "async":
+        with TestClient(main.app) as test_client:
+            yield test_client
+        return
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(database.to_async_url(database.DATABASE_URL))
+    event.listen(async_engine.sync_engine, "connect", database._on_sqlite_connect)
+    session_factory = async_sessionmaker(async_engine, autoflush=False)
+
+    async def get_async_db():
+        async with session_factory() as db:
+            yield db
+
+    main.app.dependency_overrides[database.get_db] = get_async_db
+    try:
+        with TestClient(main.app) as test_client:
+            yield test_client
+    finally:
+        main.app.dependency_overrides.pop(database.get_db, None)
+        # イベントループ外なので接続はプールごと同期的に閉じる
+        async_engine.sync_engine.dispose()
+
+
+def test_to_async_url():
+    assert database.to_async_url("sqlite:///data/spots.db") == "sqlite+aiosqlite:///data/spots.db"
+    assert database.to_async_url("mysql+pymysql://u:p@db/spots") == "mysql+aiomysql://u:p@db/spots"
+    with pytest.raises(ValueError):
+        database.to_async_url("postgresql://u:p@db/spots")
+
+
+def test_spot_endpoints_with_async_session(async_client):
+    client = async_client
+    client.post("/api/users/register", json={"username": "alice", "password": "secret-password"})
+    token = client.post("/api/users/login", json={"username": "alice", "password": "secret-password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    created = client.post("/api/spots/", json={
+        "title": "東京タワー", "category": "観光", "latitude": 35.6586, "longitude": 139.7454, "rating": 4.5,
+    })
+    assert created.status_code == 200
+    spot_id = created.json()["id"]
+
+    # 一覧・詳細・半径検索（haversine_km は接続ごとに登録）・更新・いいね・推薦
+    listing = client.get("/api/spots/", params={"view": "card"})
+    assert [spot["title"] for spot in listing.json()["spots"]] == ["東京タワー"]
+    cached = client.get("/api/spots/", params={"view": "card"}, headers={"If-None-Match": listing.headers["etag"]})
+    assert cached.status_code == 304
+    nearby = client.get("/api/spots/", params={"lat": 35.6586, "lng": 139.7454, "radius": 1}).json()
+    assert nearby["spots"][0]["distance"] == pytest.approx(0, abs=1e-6)
+
+    assert client.put(f"/api/spots/{spot_id}", json={"description": "展望台"}).json()["description"] == "展望台"
+    assert client.get(f"/api/spots/{spot_id}").json()["description"] == "展望台"
+    assert client.post(f"/api/spots/{spot_id}/like", headers=headers).json() == {"liked": True, "like_count": 1}
+
+    recommended = client.get("/api/spots/recommend/for-user", params={"user_lat": 35.66, "user_lng": 139.75})
+    assert recommended.status_code == 200
+    assert client.get("/api/users/me", headers=headers).json()["username"] == "alice"
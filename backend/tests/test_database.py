@@ -0,0 +1,33 @@
+from sqlalchemy import create_engine, event, text
+
+import database
+import posts_db
+
+
+def test_production_profile_sets_pragmas_on_both_databases(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "SQLITE_PROFILE", "production")
+    monkeypatch.setattr(database, "SQLITE_PRODUCTION_PRAGMAS", [
+        *[pragma for pragma in database.SQLITE_PRODUCTION_PRAGMAS if "busy_timeout" not in pragma],
+        "PRAGMA busy_timeout=1234",
+    ])
+
+    # spots.db: engine と同じ接続時のフック
+    spots_engine = create_engine(f"sqlite:///{tmp_path}/spots.db")
+    event.listen(spots_engine, "connect", database._on_sqlite_connect)
+    try:
+        with spots_engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 1234
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+    finally:
+        spots_engine.dispose()
+
+    # posts.db: 自前の接続プール
+    pool = posts_db.SQLitePool(str(tmp_path / "posts.db"), size=1)
+    try:
+        with pool.connection() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    finally:
+        pool.close()
+
@@ -0,0 +1,35 @@
+import random
+from collections import Counter
+
+import dataset_generator
+import models
+from database import engine
+from password_hashing import verify_password
+
+
+def test_preferential_attachment_is_heavy_tailed():
+    edges = list(dataset_generator.preferential_attachment_edges(2000, 3, random.Random(1)))
+    assert len(edges) == len(set(edges)) == 3 * (2000 - 3) + 3
+    degrees = Counter(node for edge in edges for node in edge)
+    ordered = sorted(degrees.values())
+    # 平均は約6だが、ハブのフレンド数は桁違いに多い
+    assert ordered[len(ordered) // 2] <= 5
+    assert ordered[-1] >= 60
+
+
+def test_generate_writes_users_spots_and_friendships(db):
+    counts = dataset_generator.generate(engine, users=50, spots=300, edges_per_user=2,
+                                        status_mix="accepted=0.7,pending=0.2,rejected=0.1",
+                                        password="pw", log=lambda message: None)
+    assert counts == {"users": 50, "friendships": 2 * 48 + 1, "spots": 300}
+
+    user = db.query(models.User).filter_by(username="user000000").one()
+    assert verify_password("pw", user.hashed_password)
+    statuses = {status for (status,) in db.query(models.Friendship.status).distinct()}
+    assert statuses == {"accepted", "pending", "rejected"}
+
+    spots = db.query(models.Spot).all()
+    assert all(24 < spot.latitude < 46 and 122 < spot.longitude < 146 for spot in spots)
+    # 集計・タイムラインも作り直されている
+    assert sum(stat.spot_count for stat in db.query(models.CategoryStat)) == 300
+    assert db.query(models.TimelineEntry).count() > 0
@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+
+import data_export
+import spot_import
+from database import engine
+from models import Friendship, Spot, User
+
+
+def _login(client, username, password="secret-password"):
+    client.post("/api/users/register", json={"username": username, "password": password})
+    token = client.post("/api/users/login", json={"username": username, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _seed(client, db):
+    headers = _login(client, "alice")
+    owner = db.query(User).filter_by(username="alice").one()
+    owner.display_name = "アリス"
+    db.add_all([
+        Spot(title="東京タワー", category="観光", latitude=35.6586, longitude=139.7454, rating=4.5, owner_id=owner.id),
+        Spot(title="道頓堀", category="観光", latitude=34.6687, longitude=135.5013, rating=4.0, owner_id=owner.id),
+        Spot(title="ラーメン", category="グルメ", latitude=35.6590, longitude=139.7000, rating=3.5, owner_id=owner.id,
+             description="行列,\n\"必至\""),
+    ])
+    db.commit()
+    return owner, headers
+
+
+def test_export_spots_ndjson_with_filters(client, db):
+    _, headers = _seed(client, db)
+
+    assert client.get("/api/spots/export").status_code == 401
+
+    response = client.get("/api/spots/export", params={"category": "観光"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["title"] for row in rows] == ["東京タワー", "道頓堀"]
+    assert rows[0]["owner_name"] == "アリス"
+
+    # 東京周辺の矩形
+    bbox = {"south": 35.5, "north": 35.8, "west": 139.5, "east": 139.9}
+    rows = [json.loads(line) for line in client.get("/api/spots/export", params=bbox, headers=headers).text.splitlines()]
+    assert [row["title"] for row in rows] == ["東京タワー", "ラーメン"]
+
+    assert client.get("/api/spots/export", params={"south": 35.5}, headers=headers).status_code == 400
+
+
+def test_export_only_includes_spots_visible_to_the_user(client, db):
+    owner, _ = _seed(client, db)
+    db.add_all([
+        Spot(title="公開", category="観光", latitude=35.0, longitude=139.0, visibility="public", owner_id=owner.id),
+        Spot(title="非公開", category="観光", latitude=35.0, longitude=139.0, visibility="private", owner_id=owner.id),
+    ])
+    bob, carol = _login(client, "bob"), _login(client, "carol")
+    bob_id = db.query(User).filter_by(username="bob").one().id
+    db.add(Friendship(requester_id=owner.id, requested_id=bob_id, status="accepted"))
+    db.commit()
+
+    def titles(headers):
+        return {json.loads(line)["title"] for line in client.get("/api/spots/export", headers=headers).text.splitlines()}
+
+    # フレンドは private 以外、他人は public だけ
+    assert titles(bob) == {"東京タワー", "道頓堀", "ラーメン", "公開"}
+    assert titles(carol) == {"公開"}
+
+
+def test_export_csv_streams_in_batches_and_round_trips(client, db):
+    owner, headers = _seed(client, db)
+
+    chunks = list(data_export.export_spots(engine, "csv", batch_size=1))
+    assert len(chunks) == 3  # 1行ずつ書き出している
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+    assert rows[2]["description"] == "行列,\n\"必至\""
+
+    # 書き出した CSV はそのまま取り込める（公開範囲もそのまま）
+    db.query(Spot).filter(Spot.title == "道頓堀").update({"visibility": "public"})
+    db.query(Spot).filter(Spot.title == "ラーメン").update({"visibility": "private"})
+    db.commit()
+    exported = client.get("/api/spots/export", params={"format": "csv"}, headers=headers).content
+    result = spot_import.import_spots(engine, spot_import.iter_lines([exported]), "csv", owner.id)
+    assert result["inserted"] == 3
+    assert db.query(Spot).filter(Spot.description == "行列,\n\"必至\"").count() == 2
+    imported = db.query(Spot.title, Spot.visibility).order_by(Spot.id).all()[3:]
+    assert imported == [("東京タワー", "friends_only"), ("道頓堀", "public"), ("ラーメン", "private")]
+
+
+def test_export_posts(client):
+    response = client.get("/posts/export", params={"format": "csv", "label": "good"})
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["name"] for row in rows] == [post["name"] for post in client.get("/posts", params={"label": "good"}).json()]
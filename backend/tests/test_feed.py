@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, timezone
+
+import feed
+import models
+from routers.users import create_access_token
+
+
+def _user(db, username):
+    user = models.User(username=username, hashed_password="x", display_name=username)
+    db.add(user)
+    db.flush()
+    return user
+
+
+def _befriend(db, a, b, status="accepted"):
+    db.add(models.Friendship(requester_id=a.id, requested_id=b.id, status=status))
+    db.flush()
+
+
+def _post(db, owner, n, start=0, visibility="friends_only"):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    spots = [
+        models.Spot(title=f"{owner.username}-{i}", latitude=35.0, longitude=139.0, owner_id=owner.id,
+                    visibility=visibility, created_at=base + timedelta(minutes=i))
+        for i in range(start, start + n)
+    ]
+    db.add_all(spots)
+    db.commit()
+    return spots
+
+
+def _auth(username):
+    return {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+
+
+def _feed(client, username, **params):
+    response = client.get("/api/friends/feed", params=params, headers=_auth(username))
+    assert response.status_code == 200
+    return response.json()
+
+
+def _titles(page):
+    return [spot["title"] for spot in page["spots"]]
+
+
+def test_feed_pages_friends_spots_newest_first(client, db):
+    me, alice, bob, stranger = (_user(db, name) for name in ("me", "alice", "bob", "stranger"))
+    _befriend(db, me, alice)
+    _befriend(db, bob, me)
+    _post(db, alice, 3)
+    _post(db, bob, 2, start=10)
+    _post(db, stranger, 2, start=20)
+
+    # 投稿時にフレンドのタイムラインへ書き込まれている
+    assert db.query(models.TimelineEntry).filter_by(user_id=me.id).count() == 5
+
+    first = _feed(client, "me", limit=3)
+    assert _titles(first) == ["bob-11", "bob-10", "alice-2"]
+    assert first["spots"][0]["owner_name"] == "bob"
+    second = _feed(client, "me", limit=3, cursor=first["next_cursor"])
+    assert _titles(second) == ["alice-1", "alice-0"]
+    assert second["next_cursor"] is None
+
+
+def test_feed_follows_accept_and_remove(client, db):
+    me, alice = _user(db, "me"), _user(db, "alice")
+    _befriend(db, alice, me, status="pending")
+    _post(db, alice, 2)
+    assert _titles(_feed(client, "me")) == []
+
+    # 承認すると相手の最近の投稿がタイムラインに入る
+    request_id = db.query(models.Friendship).one().id
+    client.post(f"/api/friends/requests/{request_id}/accept", params={"username": "me"})
+    assert _titles(_feed(client, "me")) == ["alice-1", "alice-0"]
+
+    client.delete(f"/api/friends/{alice.id}", params={"username": "me"})
+    assert _titles(_feed(client, "me")) == []
+    assert db.query(models.TimelineEntry).count() == 0
+
+
+def test_feed_hides_private_and_deleted_spots(client, db):
+    me, alice = _user(db, "me"), _user(db, "alice")
+    _befriend(db, me, alice)
+    _post(db, alice, 1)
+    _post(db, alice, 1, start=1, visibility="private")
+    deleted = _post(db, alice, 1, start=2)[0]
+
+    client.delete(f"/api/spots/{deleted.id}")
+    assert _titles(_feed(client, "me")) == ["alice-0"]
+
+
+def test_feed_viewer_comes_from_token_not_username(client, db):
+    me, alice, stranger = _user(db, "me"), _user(db, "alice"), _user(db, "stranger")
+    _befriend(db, me, alice)
+    _post(db, alice, 1)
+    assert _titles(_feed(client, "me")) == ["alice-0"]
+
+    # ?username= を他人の名前にしても、そのユーザーのフィードは読めない
+    assert client.get("/api/friends/feed", params={"username": "me"}).status_code == 401
+    spoofed = client.get("/api/friends/feed", params={"username": "me"}, headers=_auth("stranger"))
+    assert _titles(spoofed.json()) == []
+
+
+def test_feed_pulls_spots_of_users_with_many_friends(client, db, monkeypatch):
+    monkeypatch.setattr(feed, "FANOUT_MAX_FRIENDS", 2)
+    celebrity = _user(db, "celebrity")
+    fans = [_user(db, f"fan{i}") for i in range(3)]
+    for fan in fans:
+        _befriend(db, fan, celebrity)
+    db.commit()
+    _post(db, celebrity, 1)
+
+    # 3人目の承認で fan-out on read に切り替わる
+    other = _user(db, "other")
+    _befriend(db, other, celebrity, status="pending")
+    db.commit()
+    request_id = db.query(models.Friendship).filter_by(status="pending").one().id
+    client.post(f"/api/friends/requests/{request_id}/accept", params={"username": "celebrity"})
+    assert feed.is_pull_user(db.connection(), celebrity.id)
+    db.rollback()
+
+    # 以降の投稿はタイムラインに書き込まず、読み込み時に取りに行く
+    _post(db, celebrity, 2, start=1)
+    assert db.query(models.TimelineEntry).filter(models.TimelineEntry.spot_id.in_(
+        db.query(models.Spot.id).filter(models.Spot.title != "celebrity-0")
+    )).count() == 0
+
+    first = _feed(client, "fan0", limit=2)
+    assert _titles(first) == ["celebrity-2", "celebrity-1"]
+    assert _titles(_feed(client, "fan0", limit=2, cursor=first["next_cursor"])) == ["celebrity-0"]
+    assert _titles(_feed(client, "other")) == ["celebrity-2", "celebrity-1", "celebrity-0"]
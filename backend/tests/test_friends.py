@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import models
+import user_search
+from database import request_engine
+
+
+@contextmanager
+def count_queries():
+    counter = {"count": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["count"] += 1
+
+    event.listen(request_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(request_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _seed(db, n_friends, n_received, n_sent):
+    me = models.User(username="me", hashed_password="x", display_name="me")
+    db.add(me)
+    db.flush()
+    for i in range(n_friends + n_received + n_sent):
+        other = models.User(username=f"user{i:03d}", hashed_password="x", display_name=f"ユーザー{i}")
+        db.add(other)
+        db.flush()
+        if i < n_friends:
+            db.add(models.Friendship(requester_id=me.id, requested_id=other.id, status="accepted"))
+        elif i < n_friends + n_received:
+            db.add(models.Friendship(requester_id=other.id, requested_id=me.id, status="pending"))
+        else:
+            db.add(models.Friendship(requester_id=me.id, requested_id=other.id, status="pending"))
+    db.commit()
+
+
+def _query_counts(client):
+    endpoints = [
+        ("/api/friends/", {"username": "me"}),
+        ("/api/friends/requests/received", {"username": "me"}),
+        ("/api/friends/requests/sent", {"username": "me"}),
+        ("/api/friends/search", {"username": "me", "query": "user"}),
+    ]
+    counts = {}
+    for path, params in endpoints:
+        with count_queries() as counter:
+            response = client.get(path, params=params)
+        assert response.status_code == 200
+        counts[path] = counter["count"]
+    return counts
+
+
+@pytest.mark.parametrize("size", [2, 30])
+def test_friend_endpoints_use_constant_query_count(client, db, size):
+    _seed(db, n_friends=size, n_received=size, n_sent=size)
+
+    counts = _query_counts(client)
+
+    # 件数に関係なく「ユーザー特定 + 一覧取得 (+ まとめて取得)」で済む
+    search_count = counts.pop("/api/friends/search")
+    assert counts == {
+        "/api/friends/": 3,
+        "/api/friends/requests/received": 2,
+        "/api/friends/requests/sent": 2,
+    }
+    # 検索は 前方一致 + 全文検索 + ユーザー取得 + フレンド関係 が上限
+    assert search_count <= 5
+
+
+def test_search_reports_relationship_status(client, db):
+    _seed(db, n_friends=1, n_received=1, n_sent=1)
+
+    users = client.get("/api/friends/search", params={"username": "me", "query": "user"}).json()["users"]
+    by_name = {user["username"]: user for user in users}
+    assert by_name["user000"]["is_friend"] is True
+    assert by_name["user001"]["request_status"] == "received"
+    assert by_name["user002"]["request_status"] == "sent"
+
+
+def test_friend_graph_cache_follows_accept_and_remove(client, db):
+    from friend_graph import are_friends, friend_graph
+
+    _seed(db, n_friends=1, n_received=1, n_sent=0)
+    me = db.query(models.User).filter_by(username="me").one()
+    friend = db.query(models.User).filter_by(username="user000").one()
+    requester = db.query(models.User).filter_by(username="user001").one()
+
+    assert [f["username"] for f in client.get("/api/friends/", params={"username": "me"}).json()["friends"]] == ["user000"]
+
+    # 2回目以降はキャッシュからフレンドIDを取得（ユーザー特定 + IN の2クエリ）
+    with count_queries() as counter:
+        client.get("/api/friends/", params={"username": "me"})
+    assert counter["count"] == 2
+
+    request_id = db.query(models.Friendship).filter_by(requester_id=requester.id).one().id
+    client.post(f"/api/friends/requests/{request_id}/accept", params={"username": "me"})
+    with count_queries() as counter:
+        assert are_friends(db, me.id, requester.id)
+    assert counter["count"] == 0
+
+    client.delete(f"/api/friends/{friend.id}", params={"username": "me"})
+    assert friend_graph.cached_friend_ids(me.id) == {requester.id}
+    assert not are_friends(db, friend.id, me.id)
+
+
+def test_friend_graph_does_not_cache_set_loaded_during_accept(db, monkeypatch):
+    from database import engine
+    from friend_graph import FriendGraphCache
+
+    _seed(db, n_friends=1, n_received=1, n_sent=0)
+    me = db.query(models.User).filter_by(username="me").one()
+    requester = db.query(models.User).filter_by(username="user001").one()
+    cache = FriendGraphCache()
+
+    # 読み込みのSELECTの直後に、別リクエストの承認がコミットされた状況を作る
+    def accept_during_load(conn, cursor, statement, parameters, context, executemany):
+        cache.add_friendship(me.id, requester.id)
+
+    event.listen(engine, "after_cursor_execute", accept_during_load)
+    try:
+        assert requester.id not in cache.get_friend_ids(db, me.id)
+    finally:
+        event.remove(engine, "after_cursor_execute", accept_during_load)
+    assert cache.cached_friend_ids(me.id) is None  # 古い集合はキャッシュしない
+
+    cache.get_friend_ids(db, me.id)
+    assert cache.cached_friend_ids(me.id) is not None
+
+    # TTL を過ぎたら読み直す
+    cache.ttl = -1
+    assert cache.cached_friend_ids(me.id) is None
+
+
+@pytest.mark.skipif(user_search.USER_SEARCH_BACKEND != "fts", reason="全文インデックス無効")
+def test_search_uses_fulltext_index_for_japanese_names(client, db):
+    for username, display_name in [("me", "me"), ("tanaka", "田中太郎"), ("suzuki", "鈴木花子"), ("tanabe", "田辺一郎")]:
+        db.add(models.User(username=username, hashed_password="x", display_name=display_name))
+    db.commit()
+
+    def search(query):
+        response = client.get("/api/friends/search", params={"username": "me", "query": query})
+        return [user["username"] for user in response.json()["users"]]
+
+    assert search("田中太") == ["tanaka"]
+    assert search("田中") == ["tanaka"]              # 2文字は trigram が使えないので表示名の前方一致
+    assert search("中太") == []                      # 2文字の部分一致は対象外
+    assert search("tana") == ["tanabe", "tanaka"]    # 前方一致（ユーザー名順）
+    assert search("uzuki") == ["suzuki"]
+
+    # 表示名の変更にインデックスが追従する
+    user = db.query(models.User).filter_by(username="suzuki").one()
+    user.display_name = "山田花子"
+    db.commit()
+    assert search("鈴木花") == []
+    assert search("山田花") == ["suzuki"]
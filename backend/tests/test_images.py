@@ -0,0 +1,93 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+import images
+from models import Spot, User
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+def _png(color="red", size=(1200, 800)) -> bytes:
+    buffer = io.BytesIO()
+    PIL.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _spot(db):
+    owner = User(username="alice", hashed_password="x", display_name="alice")
+    db.add(owner)
+    db.flush()
+    spot = Spot(title="カフェ", category="グルメ", latitude=35.0, longitude=139.0, rating=4.0, owner_id=owner.id)
+    db.add(spot)
+    db.commit()
+    return spot
+
+
+def test_upload_dedupes_and_serves_thumbnails(client, db, monkeypatch):
+    spot = _spot(db)
+    scheduled = []
+    monkeypatch.setattr(images, "schedule_thumbnails", scheduled.append)
+
+    data = _png()
+    first = client.post(f"/api/spots/{spot.id}/image", files={"file": ("a.png", data, "image/png")})
+    assert first.status_code == 200
+    urls = first.json()["image_urls"]
+    second = client.post(f"/api/spots/{spot.id}/image", files={"file": ("b.png", data, "image/png")})
+    assert second.json()["image_urls"] == urls
+    # 同じ内容は1回だけ保存。サムネイルがまだなければ作成し直す
+    assert len(set(scheduled)) == 1
+    assert len(scheduled) == 2
+
+    original = client.get(urls["original"])
+    assert original.content == data
+    assert original.headers["cache-control"] == images.IMMUTABLE_CACHE_CONTROL
+
+    # サムネイル作成前は元画像を短いキャッシュで返す
+    pending = client.get(urls["480"])
+    assert pending.headers["content-type"] == "image/png"
+    assert pending.headers["cache-control"] == images.FALLBACK_CACHE_CONTROL
+
+    filename = scheduled[0]
+    images.make_thumbnails(images.original_path(filename), filename.split(".")[0], images.THUMBNAIL_SIZES)
+    thumbnail = client.get(urls["480"])
+    assert thumbnail.headers["content-type"] == "image/webp"
+    assert thumbnail.headers["cache-control"] == images.IMMUTABLE_CACHE_CONTROL
+    assert PIL.open(io.BytesIO(thumbnail.content)).size == (480, 320)
+
+    # サムネイルがそろっていれば再アップロードでは作らない
+    client.post(f"/api/spots/{spot.id}/image", files={"file": ("c.png", data, "image/png")})
+    assert len(scheduled) == 2
+
+    card = client.get("/api/spots/", params={"view": "card"}).json()["spots"][0]
+    assert card["image_urls"] == urls
+
+
+def test_upload_to_missing_spot_stores_nothing(client, db, monkeypatch):
+    monkeypatch.setattr(images, "schedule_thumbnails", lambda filename: None)
+    data = _png("green", (10, 10))
+    response = client.post("/api/spots/999/image", files={"file": ("a.png", data, "image/png")})
+    assert response.status_code == 404
+    assert not os.path.exists(images.original_path(hashlib.sha256(data).hexdigest() + ".png"))
+
+
+def test_upload_rejects_non_images(client, db):
+    spot = _spot(db)
+    response = client.post(f"/api/spots/{spot.id}/image", files={"file": ("a.txt", b"hello", "text/plain")})
+    assert response.status_code == 415
+    assert client.get("/api/spots/images/" + "0" * 64 + ".png").status_code == 404
+    assert client.get("/api/spots/images/..%2F..%2Fspots.db").status_code == 404
+
+
+def test_thumbnails_are_made_in_process_pool():
+    filename, created = images.store_upload(io.BytesIO(_png("blue")))
+    assert created
+    try:
+        images.schedule_thumbnails(filename).result(timeout=60)
+    finally:
+        images.shutdown()
+    digest = filename.split(".")[0]
+    for size in images.THUMBNAIL_SIZES:
+        assert PIL.open(images.thumbnail_path(digest, size)).format == "WEBP"
@@ -0,0 +1,98 @@
+import pytest
+from sqlalchemy import event
+
+import likes
+import models
+from database import engine
+
+
+@pytest.fixture
+def manual_flush(monkeypatch):
+    # 定期フラッシュがテストの途中で走らないようにする（client より先に使う）
+    monkeypatch.setattr(likes, "FLUSH_INTERVAL", 3600)
+
+
+def _login(client, username, password="secret-password"):
+    client.post("/api/users/register", json={"username": username, "password": password})
+    response = client.post("/api/users/login", json={"username": username, "password": password})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def _spot(db, title="spot"):
+    owner = db.query(models.User).first()
+    spot = models.Spot(title=title, latitude=35.0, longitude=139.0, owner_id=owner.id)
+    db.add(spot)
+    db.commit()
+    return spot.id
+
+
+def test_like_is_unique_per_user_and_counted_after_flush(manual_flush, client, db):
+    alice, bob = _login(client, "alice"), _login(client, "bob")
+    spot_id = _spot(db)
+
+    assert client.post(f"/api/spots/{spot_id}/like", headers=alice).json() == {"liked": True, "like_count": 1}
+    # 2回目は数えない
+    assert client.post(f"/api/spots/{spot_id}/like", headers=alice).json() == {"liked": True, "like_count": 1}
+    assert client.post(f"/api/spots/{spot_id}/like", headers=bob).json()["like_count"] == 2
+    assert client.delete(f"/api/spots/{spot_id}/like", headers=bob).json() == {"liked": False, "like_count": 1}
+    assert client.delete(f"/api/spots/{spot_id}/like", headers=bob).json()["like_count"] == 1
+    assert db.query(models.SpotLike).count() == 1
+
+    # spots.like_count はフラッシュまで更新しない
+    detail = client.get(f"/api/spots/{spot_id}")
+    listing = client.get("/api/spots/")
+    assert detail.json()["like_count"] == 0
+    likes.like_counter.flush(engine)
+    assert client.get(f"/api/spots/{spot_id}").json()["like_count"] == 1
+    # フラッシュでは ETag は変わらない（like_count は検証に含めない）
+    for url, cached in ((f"/api/spots/{spot_id}", detail), ("/api/spots/", listing)):
+        assert client.get(url, headers={"If-None-Match": cached.headers["etag"]}).status_code == 304
+    assert len(likes.like_counter) == 0
+
+    assert client.post("/api/spots/999999/like", headers=alice).status_code == 404
+    assert client.post(f"/api/spots/{spot_id}/like").status_code == 401
+
+
+def test_flush_updates_all_spots_in_one_batch(manual_flush, client, db):
+    headers = [_login(client, f"user{i}") for i in range(3)]
+    spot_ids = [_spot(db, f"spot{i}") for i in range(3)]
+    for spot_id in spot_ids:
+        for header in headers:
+            client.post(f"/api/spots/{spot_id}/like", headers=header)
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE spots"):
+            statements.append(executemany)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        assert likes.like_counter.flush(engine) == 3
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    # 9件のいいねが executemany の UPDATE 1回になる
+    assert statements == [True]
+    counts = dict(db.query(models.Spot.id, models.Spot.like_count))
+    assert counts == {spot_id: 3 for spot_id in spot_ids}
+
+    # recount は spot_likes の件数から作り直す
+    client.delete(f"/api/spots/{spot_ids[0]}/like", headers=headers[0])
+    likes.recount(engine)
+    db.expire_all()
+    assert dict(db.query(models.Spot.id, models.Spot.like_count))[spot_ids[0]] == 2
+
+
+def test_deleting_liked_spot_removes_its_likes(manual_flush, client, db):
+    alice = _login(client, "alice")
+    spot_id = _spot(db)
+    other_id = _spot(db, "other")
+    client.post(f"/api/spots/{spot_id}/like", headers=alice)
+    client.post(f"/api/spots/{other_id}/like", headers=alice)
+
+    assert client.delete(f"/api/spots/{spot_id}").status_code == 200
+    # いいねの行も書き込み待ちの増減も残らない（外部キー制約のあるDBでも削除できる）
+    assert [like.spot_id for like in db.query(models.SpotLike)] == [other_id]
+    assert likes.like_counter.pending(spot_id) == 0
+    assert likes.like_counter.flush(engine) == 1
@@ -0,0 +1,66 @@
+import re
+
+import pytest
+
+import metrics
+import models
+
+
+def _sample(text, name, **labels):
+    """メトリクスのテキストから1行の値を取り出す"""
+    for line in text.splitlines():
+        if not line.startswith(name + "{") and line.split(" ")[0] != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', line.split(" ")[0]))
+        if all(found.get(key) == value for key, value in labels.items()):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+@pytest.mark.skipif(not metrics.ENABLED, reason="METRICS_ENABLED=0")
+def test_metrics_report_latency_status_and_queries_per_route(client, db):
+    metrics.clear()
+    owner = models.User(username="owner", hashed_password="x", display_name="owner")
+    db.add(owner)
+    db.flush()
+    spot = models.Spot(title="spot", latitude=35.0, longitude=139.0, owner_id=owner.id)
+    db.add(spot)
+    db.commit()
+
+    for _ in range(3):
+        assert client.get(f"/api/spots/{spot.id}").status_code == 200
+    assert client.get("/api/spots/999999").status_code == 404
+    assert client.get("/no-such-path").status_code == 404
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    route = "/api/spots/{spot_id}"
+    assert _sample(text, "http_requests_total", method="GET", route=route, status="200") == 3
+    assert _sample(text, "http_requests_total", method="GET", route=route, status="404") == 1
+    assert _sample(text, "http_requests_total", route="unmatched", status="404") == 1
+    assert _sample(text, "http_request_duration_seconds_count", route=route) == 4
+    assert _sample(text, "http_request_duration_seconds_bucket", route=route, le="+Inf") == 4
+
+    # スポット詳細はリクエストごとにクエリを数えている（ETag用 + 本体）
+    queries = _sample(text, "http_request_db_queries_sum", route=route)
+    assert 4 <= queries <= 4 * 4
+    assert _sample(text, "http_request_db_queries_bucket", route="unmatched", le="0.0") == 1
+    assert _sample(text, "db_pool_checkout_seconds_count", engine="request") > 0
+    assert "# TYPE db_pool_checked_out gauge" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    try:
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(("/x",), value)
+        lines = histogram.render()
+    finally:
+        metrics.REGISTRY.remove(histogram)
+
+    assert 'test_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/x",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{route="/x"} 4' in lines
@@ -0,0 +1,36 @@
+def test_posts_filtered_by_precomputed_label(client):
+    good = client.get("/posts", params={"label": "good"}).json()
+    bad = client.get("/posts", params={"label": "bad"}).json()
+
+    assert len(good) + len(bad) == len(client.get("/posts").json())
+    # recomends.js と同じ判定: KNNで good かつ 評価3.5以上
+    assert all(post["rating"] >= 3.5 for post in good)
+    assert {"カフェゆらり", "スイーツ工房ふわり", "ラーメン武蔵"} <= {post["name"] for post in good}
+    assert {"ラーメン虎丸", "カフェグリーン"} <= {post["name"] for post in bad}
+
+    limited = client.get("/posts", params={"label": "good", "limit": 2}).json()
+    assert [post["id"] for post in limited] == [post["id"] for post in good[:2]]
+
+
+def test_posts_conditional_get(client, monkeypatch):
+    from routers import admin
+
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    first = client.get("/posts", params={"label": "good"})
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+
+    cached = client.get("/posts", params={"label": "good"}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    # 絞り込み条件が違えば別の ETag
+    assert client.get("/posts", params={"label": "bad"}).headers["etag"] != etag
+
+    # 再判定は管理者のみ
+    assert client.post("/posts/classify").status_code == 403
+    assert client.get("/posts", params={"label": "good"}, headers={"If-None-Match": etag}).status_code == 304
+
+    # 再判定で posts が更新されると ETag も変わる
+    client.post("/posts/classify", headers={"X-Admin-Token": "secret"})
+    assert client.get("/posts", params={"label": "good"}, headers={"If-None-Match": etag}).status_code == 200
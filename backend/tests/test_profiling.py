@@ -0,0 +1,62 @@
+import pytest
+
+import profiling
+from routers import admin
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    profiling.profiles.clear()
+    profiling.sampler.clear()
+    yield {"X-Admin-Token": "secret"}
+    profiling.profiles.clear()
+    profiling.sampler.clear()
+
+
+def _register(client, username="alice", password="secret-password"):
+    assert client.post("/api/users/register", json={"username": username, "password": password}).status_code == 200
+    return {"username": username, "password": password}
+
+
+def test_profile_single_request_with_header(client, admin_token):
+    credentials = _register(client)
+
+    # bcrypt の照合はパスワードハッシュ用のスレッドで動く → このリクエストのスタックとして数える
+    response = client.post("/api/users/login", json=credentials, headers={"X-Profile": "1", **admin_token})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    listed = client.get("/api/admin/profiles", headers=admin_token).json()["profiles"]
+    assert listed[0]["id"] == profile_id
+    assert listed[0]["route"] == "/api/users/login"
+    assert listed[0]["status"] == 200
+    assert listed[0]["samples"] > 0
+
+    folded = client.get(f"/api/admin/profiles/{profile_id}", headers=admin_token).text
+    lines = folded.splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("password_hashing.py:verify_password" in line for line in lines)
+
+
+def test_profile_flag_is_ignored_without_admin_token(client, admin_token):
+    credentials = _register(client)
+    response = client.post("/api/users/login", params={"profile": "1"}, json=credentials)
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert client.get("/api/admin/profiles", headers=admin_token).json()["profiles"] == []
+
+
+def test_background_sampler_aggregates_by_route(client, admin_token, tmp_path):
+    credentials = _register(client)
+    sampler = profiling.BackgroundSampler(interval=0.001, directory=str(tmp_path))
+    sampler.start()
+    try:
+        assert client.post("/api/users/login", json=credentials).status_code == 200
+    finally:
+        sampler.stop()  # 止めるときに書き出す
+
+    assert "/api/users/login" in dict(sampler.hot_routes())
+    with open(tmp_path / "hot_routes.folded", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert any(line.startswith("/api/users/login;") for line in lines)
@@ -0,0 +1,67 @@
+import gzip
+
+import pytest
+
+import compression
+import responses
+from models import Spot, User
+
+
+def _seed(db, n_spots):
+    owner = User(username="alice", hashed_password="x", display_name="alice")
+    db.add(owner)
+    db.flush()
+    db.add_all([
+        Spot(title=f"spot{i}", description="説明" * 20, category="グルメ",
+             latitude=35.0 + i * 1e-4, longitude=139.0, rating=4.0, owner_id=owner.id)
+        for i in range(n_spots)
+    ])
+    db.commit()
+
+
+def test_fast_responses_match_default_output(client, db, monkeypatch):
+    _seed(db, 3)
+    urls = ["/api/spots/?per_page=2", "/api/spots/1", "/api/spots/categories/?include_counts=true",
+            "/api/spots/recommend/for-user?user_lat=35&user_lng=139"]
+    default = [client.get(url) for url in urls]
+
+    monkeypatch.setattr(responses, "FAST_RESPONSES", True)
+    fast = [client.get(url) for url in urls]
+
+    for before, after in zip(default, fast):
+        assert after.status_code == 200
+        assert after.json() == before.json()
+        assert after.headers.get("etag") == before.headers.get("etag")
+
+
+@pytest.mark.skipif(not compression.ENABLED, reason="RESPONSE_COMPRESSION=off")
+def test_large_responses_are_compressed(client, db):
+    _seed(db, 50)
+
+    response = client.get("/api/spots/?per_page=50", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.headers["etag"].startswith("W/")
+    assert len(response.json()["spots"]) == 50
+    # 弱い ETag でも 304 になる
+    cached = client.get("/api/spots/?per_page=50", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert "Accept-Encoding" in cached.headers["vary"]
+
+    small = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+    # 圧縮しなかったレスポンスにも Vary を付ける（小さい・Accept-Encoding なし）
+    identity = client.get("/api/spots/?per_page=50", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    for response in (small, identity):
+        assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_choose_encoding():
+    assert compression.choose_encoding("gzip, deflate") == "gzip"
+    assert compression.choose_encoding("gzip;q=0") is None
+    assert compression.choose_encoding("identity") is None
+    if compression.brotli is not None:
+        assert compression.choose_encoding("gzip, br") == "br"
+    assert gzip.decompress(compression._Compressor("gzip").finish(b"x" * 10)) == b"x" * 10
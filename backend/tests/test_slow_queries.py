@@ -0,0 +1,54 @@
+import pytest
+
+import metrics
+import models
+import slow_queries
+from routers import admin
+
+
+@pytest.fixture
+def slow_log(monkeypatch):
+    # すべてのクエリを「遅い」とみなす（ログ出力はしない）
+    monkeypatch.setattr(slow_queries, "THRESHOLD_SECONDS", 0.0)
+    monkeypatch.setattr(slow_queries, "SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    slow_queries.slow_query_log.clear()
+    yield slow_queries.slow_query_log
+    slow_queries.slow_query_log.clear()
+
+
+def test_normalize_groups_literals_and_in_lists():
+    assert slow_queries.normalize("SELECT * FROM spots WHERE id IN (?, ?, ?) AND title = 'a''b'  LIMIT 20") == \
+        "SELECT * FROM spots WHERE id IN (...) AND title = ? LIMIT ?"
+    assert slow_queries.normalize("SELECT anon_1.id FROM t WHERE x IN (?)") == "SELECT anon_1.id FROM t WHERE x IN (...)"
+
+
+@pytest.mark.skipif(not slow_queries.ENABLED, reason="SLOW_QUERY_MS=off")
+def test_slow_queries_are_deduplicated_with_plan_and_route(client, db, slow_log):
+    db.add_all([models.User(username=name, hashed_password="x", display_name=name) for name in ("me", "you")])
+    db.commit()
+
+    for _ in range(2):
+        assert client.get("/api/friends/requests/received", params={"username": "me"}).status_code == 200
+
+    entries = [entry for entry in slow_log.top(200) if "FROM friendships" in entry["sql"]]
+    assert len(entries) == 1  # 同じ形のSQLは1つにまとまる
+    entry = entries[0]
+    assert entry["count"] == 2
+    assert entry["plan"] and any("friendships" in line for line in entry["plan"])
+    if metrics.ENABLED:
+        assert entry["routes"] == {"/api/friends/requests/received": 2}
+
+    # 管理者トークンがなければ見えない
+    assert client.get("/api/admin/slow-queries").status_code == 403
+    response = client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "secret"}, params={"order": "count"})
+    assert response.status_code == 200
+    assert any("FROM friendships" in query["sql"] for query in response.json()["queries"])
+
+    client.delete("/api/admin/slow-queries", headers={"X-Admin-Token": "secret"})
+    assert len(slow_log) == 0
+
+
+def test_admin_endpoints_are_hidden_without_token(client, monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", None)
+    assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "x"}).status_code == 404
@@ -0,0 +1,80 @@
+import json
+
+import spot_import
+from database import engine
+from models import Spot, User
+
+
+def _login(client, username, password="secret-password"):
+    client.post("/api/users/register", json={"username": username, "password": password})
+    token = client.post("/api/users/login", json={"username": username, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_import_ndjson_reports_row_errors(client, db):
+    headers = {**_login(client, "importer"), "Content-Type": "application/x-ndjson"}
+    lines = [
+        {"title": "東京タワー", "category": "観光", "latitude": 35.6586, "longitude": 139.7454, "rating": 4.5},
+        {"title": "", "latitude": 35.0, "longitude": 139.0},
+        {"title": "範囲外", "latitude": 135.0, "longitude": 139.0},
+        {"title": "新宿御苑", "category": "自然", "latitude": 35.6852, "longitude": 139.7100},
+    ]
+    body = "\n".join(json.dumps(line, ensure_ascii=False) for line in lines) + "\n{broken\n"
+
+    assert client.post("/api/spots/import", content=body.encode(),
+                       headers={"Content-Type": "application/x-ndjson"}).status_code == 401
+
+    response = client.post("/api/spots/import", content=body.encode(), headers=headers)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["inserted"] == 2
+    assert result["failed"] == 3
+    assert [error["line"] for error in result["errors"]] == [2, 3, 5]
+
+    # 取り込んだスポットは一覧・件数・半径検索（R*Tree）に反映される
+    assert client.get("/api/spots/").json()["total"] == 2
+    counts = client.get("/api/spots/categories/", params={"include_counts": True}).json()["counts"]
+    assert (counts["観光"], counts["自然"]) == (1, 1)
+    nearby = client.get("/api/spots/", params={"lat": 35.6586, "lng": 139.7454, "radius": 1}).json()
+    assert [spot["title"] for spot in nearby["spots"]] == ["東京タワー"]
+    assert {spot.owner.username for spot in db.query(Spot)} == {"importer"}
+
+
+def test_import_as_another_owner_requires_admin_token(client, db, monkeypatch):
+    from routers import admin
+
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    headers = {**_login(client, "importer"), "Content-Type": "application/x-ndjson"}
+    _login(client, "other")
+    other_id = db.query(User).filter_by(username="other").one().id
+    body = json.dumps({"title": "代理", "latitude": 35.0, "longitude": 139.0}, ensure_ascii=False).encode()
+
+    response = client.post("/api/spots/import", params={"owner_id": other_id}, content=body, headers=headers)
+    assert response.status_code == 403
+    assert db.query(Spot).count() == 0
+
+    response = client.post("/api/spots/import", params={"owner_id": other_id}, content=body,
+                           headers={**headers, "X-Admin-Token": "secret"})
+    assert response.json()["inserted"] == 1
+    assert db.query(Spot).one().owner_id == other_id
+
+
+def test_import_csv_in_chunks(db):
+    owner = User(username="importer", hashed_password="x", display_name="importer")
+    db.add(owner)
+    db.commit()
+
+    rows = ["title,category,latitude,longitude,rating,description"]
+    rows += [f"spot{i},グルメ,35.{i:04d},139.0,,\"複数行の\n説明{i}\"" for i in range(25)]
+    rows.append("bad,グルメ,not-a-number,139.0,,")
+    chunks = [("\n".join(rows) + "\n").encode()[i:i + 7] for i in range(0, 4096, 7)]
+
+    result = spot_import.import_spots(engine, spot_import.iter_lines(chunks), "csv", owner.id, chunk_size=10)
+    assert (result["inserted"], result["failed"]) == (25, 1)
+    assert result["errors"][0]["line"] == 52
+
+    spots = db.query(Spot).order_by(Spot.id).all()
+    assert len(spots) == 25
+    assert spots[3].description == "複数行の\n説明3"
+    assert spots[3].rating == 0
+    assert {spot.owner_id for spot in spots} == {owner.id}
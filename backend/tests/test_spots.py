@@ -0,0 +1,328 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from database import request_engine
+from models import Spot, User
+import spatial
+
+
+@contextmanager
+def capture_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(request_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(request_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _add_user(db, username="alice"):
+    user = User(username=username, hashed_password="x", display_name=username)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _add_spot(db, owner, title, lat, lng, category="グルメ"):
+    spot = Spot(title=title, category=category, latitude=lat, longitude=lng, rating=4.0, owner_id=owner.id)
+    db.add(spot)
+    db.commit()
+    return spot
+
+
+def test_calculate_distance():
+    # 東京駅 → 新宿駅 はおよそ6km
+    distance = spatial.calculate_distance(35.6812, 139.7671, 35.6896, 139.7006)
+    assert 5.5 < distance < 6.5
+
+
+def test_radius_search_orders_by_distance(client, db):
+    owner = _add_user(db)
+    _add_spot(db, owner, "新宿", 35.6896, 139.7006)
+    _add_spot(db, owner, "東京", 35.6812, 139.7671)
+    _add_spot(db, owner, "大阪", 34.7025, 135.4959)
+
+    response = client.get("/api/spots/", params={"lat": 35.6812, "lng": 139.7671, "radius": 10})
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["total"] == 2
+    assert [spot["title"] for spot in data["spots"]] == ["東京", "新宿"]
+    assert data["spots"][0]["distance"] == 0
+    assert data["spots"][0]["owner_name"] == "alice"
+
+
+def test_radius_search_keeps_spots_just_inside_on_each_axis(client, db):
+    import math
+
+    owner = _add_user(db)
+    lat, lng, radius = 35.0, 139.0, 10.0
+    angle = 9.999 / spatial.EARTH_RADIUS_KM
+    d_lat = math.degrees(angle)
+    d_lng = math.degrees(2 * math.asin(math.sin(angle / 2) / math.cos(math.radians(lat))))
+    # 経度が最大になる点（中心より北側で円に接する）
+    tangent_lat = math.degrees(math.asin(math.sin(math.radians(lat)) / math.cos(angle)))
+    tangent_lng = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+    points = {
+        "north": (lat + d_lat, lng), "south": (lat - d_lat, lng),
+        "east": (lat, lng + d_lng), "west": (lat, lng - d_lng),
+        "tangent": (tangent_lat, lng + tangent_lng),
+        "outside": (lat + math.degrees(10.01 / spatial.EARTH_RADIUS_KM), lng),
+    }
+    for title, (spot_lat, spot_lng) in points.items():
+        assert (spatial.calculate_distance(lat, lng, spot_lat, spot_lng) < radius) == (title != "outside")
+        _add_spot(db, owner, title, spot_lat, spot_lng)
+
+    data = client.get("/api/spots/", params={"lat": lat, "lng": lng, "radius": radius, "per_page": 10}).json()
+    assert {spot["title"] for spot in data["spots"]} == {"north", "south", "east", "west", "tangent"}
+    assert data["total"] == 5
+
+
+def test_radius_search_expands_rings_in_sql(client, db):
+    owner = _add_user(db)
+    # 東京駅から約0.5km / 0.9km / 3km / 7km（最初の円 RING_START_KM=1 には2件しかない）
+    for title, d_lat in [("3km", 0.027), ("0.5km", 0.0045), ("7km", 0.063), ("0.9km", 0.0081)]:
+        _add_spot(db, owner, title, 35.6812 + d_lat, 139.7671)
+
+    params = {"lat": 35.6812, "lng": 139.7671, "radius": 10, "per_page": 3}
+    with capture_statements() as statements:
+        data = client.get("/api/spots/", params=params).json()
+    assert [spot["title"] for spot in data["spots"]] == ["0.5km", "0.9km", "3km"]
+    assert data["total"] == 4
+    # 距離順の並べ替え・LIMIT は SQL で行う
+    assert any("ORDER BY distance" in statement and "LIMIT" in statement for statement in statements)
+
+    estimate = client.get("/api/spots/", params={**params, "total_mode": "estimate"}).json()
+    assert estimate["total"] == round(4 * 3.141592653589793 / 4)
+
+
+def test_radius_cursor_pages_in_sql_with_ties(client, db):
+    owner = _add_user(db)
+    # 同じ距離のスポットが続くページをまたぐ
+    for i in range(3):
+        _add_spot(db, owner, f"same{i}", 35.0045, 139.0)
+    _add_spot(db, owner, "far", 35.04, 139.0)
+
+    params = {"lat": 35.0, "lng": 139.0, "radius": 10, "per_page": 2, "total_mode": "none"}
+    first = client.get("/api/spots/", params=params).json()
+    with capture_statements() as statements:
+        second = client.get("/api/spots/", params={**params, "cursor": first["next_cursor"]}).json()
+    assert [s["title"] for s in first["spots"] + second["spots"]] == ["same0", "same1", "same2", "far"]
+    assert second["next_cursor"] is None
+    # 続きのページもカーソル以降を SQL で絞り、1ページ分 + 1件だけ読む
+    paged = [statement for statement in statements if "ORDER BY distance" in statement]
+    assert paged and all("LIMIT" in statement and "distance" in statement.split("WHERE", 1)[1] for statement in paged)
+
+
+def test_rtree_follows_update_and_delete(client, db):
+    owner = _add_user(db)
+    spot = _add_spot(db, owner, "移転", 34.7025, 135.4959)
+
+    spot.latitude, spot.longitude = 35.6812, 139.7671
+    db.commit()
+    params = {"lat": 35.6812, "lng": 139.7671, "radius": 1}
+    assert client.get("/api/spots/", params=params).json()["total"] == 1
+
+    db.delete(spot)
+    db.commit()
+    assert client.get("/api/spots/", params=params).json()["total"] == 0
+
+
+def test_recommendations_rank_by_score(client, db):
+    owner = _add_user(db)
+    _add_spot(db, owner, "近い", 35.6813, 139.7672)
+    far = _add_spot(db, owner, "遠い", 34.7025, 135.4959)
+
+    params = {"user_lat": 35.6812, "user_lng": 139.7671, "limit": 1}
+    data = client.get("/api/spots/recommend/for-user", params=params).json()
+    assert [spot["title"] for spot in data["recommendations"]] == ["近い"]
+
+    # 書き込みでスナップショットが作り直される
+    far.latitude, far.longitude = 35.6812, 139.7671
+    far.rating = 5.0
+    db.commit()
+    data = client.get("/api/spots/recommend/for-user", params=params).json()
+    assert [spot["title"] for spot in data["recommendations"]] == ["遠い"]
+
+
+def test_recommendation_snapshot_follows_table_version(client, db):
+    import recommender
+    import versions
+    from database import engine
+
+    owner = _add_user(db)
+    _add_spot(db, owner, "近い", 35.6813, 139.7672)
+    params = {"user_lat": 35.6812, "user_lng": 139.7671, "limit": 1}
+    assert [s["title"] for s in client.get("/api/spots/recommend/for-user", params=params).json()["recommendations"]] == ["近い"]
+
+    # ORM を通らない書き込み（他のワーカー・一括取り込み）もバージョンを見て追加分だけ読む
+    with engine.begin() as conn:
+        conn.execute(Spot.__table__.insert().values(
+            title="追加", category="グルメ", latitude=35.6812, longitude=139.7671, rating=5.0,
+            owner_id=owner.id, like_count=0,
+        ))
+        versions.bump(conn, ["spots"])
+    with capture_statements() as statements:
+        data = client.get("/api/spots/recommend/for-user", params=params).json()
+    assert [s["title"] for s in data["recommendations"]] == ["追加"]
+    assert any("spots.id >" in statement for statement in statements)
+    assert len(recommender._snapshot) == 2
+
+    # 作り直し中の他のリクエストは古いスナップショットを使う
+    with engine.begin() as conn:
+        versions.bump(conn, ["spots"])
+    with recommender._rebuild_lock:
+        assert recommender.get_snapshot(db) is recommender._snapshot
+
+
+def test_cursor_pagination_walks_all_spots(client, db):
+    owner = _add_user(db)
+    for i in range(5):
+        _add_spot(db, owner, f"spot{i}", 35.0, 139.0 + i * 0.001)
+
+    titles, cursor = [], None
+    while True:
+        params = {"per_page": 2, "total_mode": "none"}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get("/api/spots/", params=params).json()
+        assert data["total"] is None
+        titles += [spot["title"] for spot in data["spots"]]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    # 新着順で重複・抜けなし
+    assert titles == [f"spot{i}" for i in reversed(range(5))]
+
+    near = client.get("/api/spots/", params={"lat": 35.0, "lng": 139.0, "radius": 5, "per_page": 3}).json()
+    rest = client.get("/api/spots/", params={
+        "lat": 35.0, "lng": 139.0, "radius": 5, "per_page": 3, "cursor": near["next_cursor"],
+    }).json()
+    assert [s["title"] for s in near["spots"] + rest["spots"]] == [f"spot{i}" for i in range(5)]
+    assert rest["next_cursor"] is None
+
+    assert client.get("/api/spots/", params={"cursor": near["next_cursor"]}).status_code == 400
+
+
+@pytest.mark.parametrize("payload, params", [
+    (["created", "x"], {}),
+    (["created", "notadate", 1], {}),
+    (["created", "2024-01-01T00:00:00", "1"], {}),
+    (["created", "2024-01-01T00:00:00", 1, 2], {}),
+    (["distance", None, 1], {"lat": 35.0, "lng": 139.0, "radius": 5}),
+    (["distance", 1.5], {"lat": 35.0, "lng": 139.0, "radius": 5}),
+    (["distance", "1.5", {}], {"lat": 35.0, "lng": 139.0, "radius": 5}),
+])
+def test_malformed_cursor_payload_is_400(client, db, payload, params):
+    import pagination
+
+    cursor = pagination.encode_cursor(*payload)
+    assert client.get("/api/spots/", params={**params, "cursor": cursor}).status_code == 400
+
+
+def test_category_counts_follow_spot_writes(client, db):
+    owner = _add_user(db)
+    _add_spot(db, owner, "ラーメン", 35.0, 139.0, category="グルメ")
+    moved = _add_spot(db, owner, "公園", 35.0, 139.0, category="グルメ")
+
+    def counts():
+        return client.get("/api/spots/categories/", params={"include_counts": True}).json()["counts"]
+
+    assert counts()["グルメ"] == 2
+    assert counts()["自然"] == 0
+
+    client.put(f"/api/spots/{moved.id}", json={"category": "自然"})
+    assert (counts()["グルメ"], counts()["自然"]) == (1, 1)
+
+    client.delete(f"/api/spots/{moved.id}")
+    data = client.get("/api/spots/categories/", params={"include_counts": True}).json()
+    assert data["counts"]["自然"] == 0
+    assert "グルメ" in data["categories"]
+
+
+def test_conditional_get_returns_304_until_spot_changes(client, db):
+    owner = _add_user(db)
+    spot = _add_spot(db, owner, "東京", 35.6812, 139.7671)
+
+    for url in ("/api/spots/", f"/api/spots/{spot.id}"):
+        first = client.get(url)
+        etag = first.headers["etag"]
+        assert first.headers["last-modified"]
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+        client.put(f"/api/spots/{spot.id}", json={"description": url})
+        changed = client.get(url, headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+
+        # 値が変わらない更新では updated_at も ETag も変わらない
+        client.put(f"/api/spots/{spot.id}", json={"description": url})
+        assert client.get(url, headers={"If-None-Match": changed.headers["etag"]}).status_code == 304
+
+
+def test_list_etag_changes_only_for_spots_and_owner_names(client, db):
+    owner = _add_user(db)
+    _add_spot(db, owner, "東京", 35.6812, 139.7671)
+    etag = client.get("/api/spots/").headers["etag"]
+
+    # 一覧に出ないユーザーの列・ユーザーの追加では変わらない
+    owner.is_active = False
+    _add_user(db, "other")
+    assert client.get("/api/spots/", headers={"If-None-Match": etag}).status_code == 304
+
+    owner.display_name = "新しい名前"
+    db.commit()
+    assert client.get("/api/spots/", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_versions_bump_once_per_transaction(db):
+    import versions
+
+    owner = _add_user(db)
+    before = versions.get_versions(db, "spots")["spots"][0]
+    for i in range(3):
+        db.add(Spot(title=f"spot{i}", latitude=35.0, longitude=139.0, owner_id=owner.id))
+        db.flush()
+    db.commit()
+    assert versions.get_versions(db, "spots")["spots"][0] == before + 1
+
+    # ロールバックした分は次のコミットに持ち越さない
+    db.add(Spot(title="取り消し", latitude=35.0, longitude=139.0, owner_id=owner.id))
+    db.flush()
+    db.rollback()
+    owner.is_active = False
+    db.commit()
+    assert versions.get_versions(db, "spots")["spots"][0] == before + 1
+
+
+@pytest.mark.parametrize("view, expected_keys", [
+    ("marker", {"id", "title", "category", "latitude", "longitude", "rating", "distance"}),
+    ("card", {"id", "title", "category", "latitude", "longitude", "rating", "distance",
+              "address", "owner_id", "owner_name", "created_at", "like_count", "image_urls"}),
+])
+def test_spot_list_is_one_statement_per_view(client, db, view, expected_keys):
+    for i in range(5):
+        _add_spot(db, _add_user(db, f"user{i}"), f"spot{i}", 35.0, 139.0)
+
+    # 新着順と半径検索（距離も同じ SELECT で読む）
+    for params in ({}, {"lat": 35.0, "lng": 139.0, "radius": 1}):
+        with capture_statements() as statements:
+            response = client.get("/api/spots/", params={"view": view, "total_mode": "none", **params})
+        spots = response.json()["spots"]
+        assert len(spots) == 5
+        assert set(spots[0]) == expected_keys
+
+        # 所有者の表示名も含めて spots を読むのは1回だけ、description は読まない
+        spot_selects = [sql for sql in statements if "FROM spots" in sql]
+        assert len(spot_selects) == 1
+        assert "description" not in spot_selects[0]
+        assert ("JOIN users" in spot_selects[0]) == (view == "card")
+        if view == "card":
+            assert {spot["owner_name"] for spot in spots} == {f"user{i}" for i in range(5)}
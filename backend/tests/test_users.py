@@ -0,0 +1,101 @@
+import models
+from routers.users import token_cache
+
+
+def _login(client, username="alice", password="secret-password"):
+    client.post("/api/users/register", json={"username": username, "password": password})
+    response = client.post("/api/users/login", json={"username": username, "password": password})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_me_is_served_from_token_cache(client, monkeypatch):
+    from routers import admin
+
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    token_cache.clear()
+    headers = _login(client)
+    before = token_cache.stats()
+
+    for _ in range(3):
+        response = client.get("/api/users/me", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["username"] == "alice"
+
+    # 統計は管理者トークンが必要
+    assert client.get("/api/admin/auth-stats", headers=headers).status_code == 403
+    stats = client.get("/api/admin/auth-stats", headers={"X-Admin-Token": "secret"}).json()["token_cache"]
+    assert stats["misses"] - before["misses"] == 1
+    assert stats["hits"] - before["hits"] == 2
+
+
+def test_deactivated_user_is_evicted(client, db):
+    token_cache.clear()
+    headers = _login(client)
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+
+    user = db.query(models.User).filter_by(username="alice").one()
+    user.is_active = False
+    db.commit()
+
+    assert client.get("/api/users/me", headers=headers).status_code == 401
+
+
+def test_password_pool_rejects_when_queue_is_full():
+    import asyncio
+    import threading
+
+    import pytest
+    from fastapi import HTTPException
+
+    from password_hashing import PasswordHashPool
+
+    pool = PasswordHashPool(workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(pool.submit(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc_info:
+            await pool.submit(release.wait)
+        release.set()
+        await first
+        return exc_info.value.status_code
+
+    assert asyncio.run(scenario()) == 503
+    stats = pool.stats()
+    assert stats["completed"] == 1 and stats["rejected"] == 1 and stats["pending"] == 0
+    pool.shutdown()
+
+
+def test_password_pool_releases_slot_of_cancelled_job():
+    import asyncio
+    import threading
+
+    from password_hashing import PasswordHashPool
+
+    pool = PasswordHashPool(workers=1, max_pending=2)
+    release = threading.Event()
+    ran = []
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.submit(release.wait, 5))
+        try:
+            await asyncio.sleep(0.01)
+            # 待ち行列中にクライアントが切断した（タスクがキャンセルされた）
+            queued = asyncio.ensure_future(pool.submit(ran.append, "queued"))
+            await asyncio.sleep(0.01)
+            queued.cancel()
+            await asyncio.gather(queued, return_exceptions=True)
+            pending_after_cancel = pool.stats()["pending"]
+        finally:
+            release.set()
+            await running
+        return pending_after_cancel
+
+    try:
+        assert asyncio.run(scenario()) == 1
+        assert pool.stats()["pending"] == 0
+        assert ran == []
+    finally:
+        pool.shutdown()
@@ -0,0 +1,144 @@
+"""
+ユーザー検索（ユーザー名・表示名の部分一致）
+- SQLite: FTS5 の trigram インデックス（users_fts）をトリガーで users と同期
+- MySQL : ngram パーサーの FULLTEXT インデックス
+- ユーザー名の前方一致はインデックスの範囲検索で先に返す
+- SQLite で3文字未満の検索語は trigram が使えないので、ユーザー名・表示名の前方一致だけにする
+  （全件を LIKE '%q%' で走査しないように。「中太」で「田中太郎」は見つからない）
+- USER_SEARCH_BACKEND=like で従来の LIKE '%q%' 検索に戻せる
+"""
+import os
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+
+USER_SEARCH_BACKEND = os.getenv("USER_SEARCH_BACKEND", "fts")
+
+# trigram は3文字未満の検索語には使えない
+TRIGRAM_MIN_LENGTH = 3
+
+_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts
+    USING fts5(username, display_name, content='users', content_rowid='id', tokenize='trigram')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users
+    BEGIN
+        INSERT INTO users_fts (rowid, username, display_name)
+        VALUES (new.id, new.username, new.display_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username, display_name ON users
+    BEGIN
+        INSERT INTO users_fts (users_fts, rowid, username, display_name)
+        VALUES ('delete', old.id, old.username, old.display_name);
+        INSERT INTO users_fts (rowid, username, display_name)
+        VALUES (new.id, new.username, new.display_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users
+    BEGIN
+        INSERT INTO users_fts (users_fts, rowid, username, display_name)
+        VALUES ('delete', old.id, old.username, old.display_name);
+    END
+    """,
+]
+
+
+def create_user_search_index(engine) -> None:
+    """検索用インデックスを作成（既存のユーザーも取り込む）"""
+    if USER_SEARCH_BACKEND != "fts":
+        return
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'users_fts'"
+            )).first()
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                conn.execute(text("INSERT INTO users_fts (users_fts) VALUES ('rebuild')"))
+
+        elif engine.dialect.name == "mysql":
+            exists = conn.execute(text(
+                "SELECT 1 FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = 'ft_users_names'"
+            )).first()
+            if not exists:
+                conn.execute(text(
+                    "ALTER TABLE users ADD FULLTEXT INDEX ft_users_names (username, display_name) WITH PARSER ngram"
+                ))
+
+
+def _fts_quote(query: str) -> str:
+    # 検索語をそのまま1フレーズとして扱う（FTSの演算子を無効化）
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    return prefix + "\U0010ffff"
+
+
+def search_users(db: Session, query: str, exclude_user_id: int, limit: int = 10) -> List[models.User]:
+    """ユーザー名・表示名に query を含むユーザーを関連度順で返す"""
+    dialect = db.get_bind().dialect.name
+    use_fts = USER_SEARCH_BACKEND == "fts" and dialect in ("sqlite", "mysql")
+
+    if not use_fts:
+        return db.query(models.User).filter(
+            models.User.id != exclude_user_id,
+            (models.User.username.contains(query)) | (models.User.display_name.contains(query))
+        ).limit(limit).all()
+
+    # 1. ユーザー名の前方一致（username インデックスの範囲検索）
+    ids = [
+        user_id for (user_id,) in db.query(models.User.id).filter(
+            models.User.username >= query,
+            models.User.username < _prefix_upper_bound(query),
+            models.User.id != exclude_user_id
+        ).order_by(models.User.username).limit(limit)
+    ]
+
+    # 2. 部分一致（全文インデックス、関連度順）
+    if len(ids) < limit:
+        remaining = limit - len(ids)
+        params = {"exclude": exclude_user_id, "limit": remaining + len(ids)}
+
+        if dialect == "sqlite" and len(query) >= TRIGRAM_MIN_LENGTH:
+            params["q"] = _fts_quote(query)
+            rows = db.execute(text(
+                "SELECT rowid FROM users_fts WHERE users_fts MATCH :q AND rowid != :exclude "
+                "ORDER BY bm25(users_fts) LIMIT :limit"
+            ), params)
+        elif dialect == "mysql":
+            params["q"] = _fts_quote(query)
+            rows = db.execute(text(
+                "SELECT id FROM users WHERE MATCH (username, display_name) AGAINST (:q IN BOOLEAN MODE) "
+                "AND id != :exclude "
+                "ORDER BY MATCH (username, display_name) AGAINST (:q IN BOOLEAN MODE) DESC LIMIT :limit"
+            ), params)
+        else:
+            # SQLiteで3文字未満の検索語は表示名の前方一致（display_name インデックスの範囲検索）
+            rows = db.query(models.User.id).filter(
+                models.User.display_name >= query,
+                models.User.display_name < _prefix_upper_bound(query),
+                models.User.id != exclude_user_id
+            ).order_by(models.User.display_name).limit(params["limit"])
+
+        seen = set(ids)
+        for (user_id,) in rows:
+            if user_id not in seen and len(ids) < limit:
+                ids.append(user_id)
+                seen.add(user_id)
+
+    if not ids:
+        return []
+    users_by_id = {user.id: user for user in db.query(models.User).filter(models.User.id.in_(ids))}
+    return [users_by_id[user_id] for user_id in ids if user_id in users_by_id]
@@ -0,0 +1,91 @@
+"""
+テーブルの更新バージョン（table_versions）
+- ORM で spots / users を書き込むと、同じトランザクションでバージョンを+1する
+  （flush ごとではなく、コミット直前に1トランザクション1回だけ。行ロックを持つのはコミットまでの短い間）
+- ユーザーの表示名（一覧に出る owner_name）が変わったときは owner_names も+1する
+- 条件付きGET（conditional.py）の ETag / Last-Modified に使う
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import Spot, TableVersion, User
+
+# バージョンを管理するモデル → table_versions.name
+TRACKED_MODELS = {Spot: "spots", User: "users"}
+# スポットの一覧・詳細に出るユーザーの列（変わったら owner_names を+1）
+OWNER_NAMES = "owner_names"
+OWNER_NAME_COLUMNS = ("display_name",)
+# flush で変更を見つけたテーブル名をコミットまで溜めておく session.info のキー
+_PENDING_KEY = "versions_pending"
+
+
+def bump(connection, names: Iterable[str]) -> None:
+    """バージョンを+1（行がなければ作成）"""
+    table = TableVersion.__table__
+    now = datetime.now(timezone.utc)
+    for name in sorted(set(names)):
+        result = connection.execute(
+            update(table).where(table.c.name == name)
+            .values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, version=1, updated_at=now))
+
+
+def create_table_versions(engine) -> None:
+    """管理対象の行を作っておく（初回の同時書き込みで重複INSERTにならないように）"""
+    table = TableVersion.__table__
+    with engine.begin() as conn:
+        existing = set(conn.execute(select(table.c.name)).scalars())
+        missing = [name for name in (*TRACKED_MODELS.values(), OWNER_NAMES) if name not in existing]
+        if missing:
+            now = datetime.now(timezone.utc)
+            conn.execute(table.insert(), [{"name": name, "version": 1, "updated_at": now} for name in missing])
+
+
+def get_versions(db: Session, *names: str) -> Dict[str, Tuple[int, datetime]]:
+    """name → (version, updated_at)。未作成のテーブルは (0, None)"""
+    rows = db.execute(
+        select(TableVersion.name, TableVersion.version, TableVersion.updated_at)
+        .where(TableVersion.name.in_(names))
+    ).all()
+    found = {name: (version, updated_at) for name, version, updated_at in rows}
+    return {name: found.get(name, (0, None)) for name in names}
+
+
+def _owner_name_changed(obj) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[column].history.has_changes() for column in OWNER_NAME_COLUMNS)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_on_flush(session, flush_context):
+    """変更のあったテーブルを記録するだけ（バージョンの更新はコミット直前にまとめて）"""
+    changed = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        name = TRACKED_MODELS.get(type(obj))
+        if name and (obj not in session.dirty or session.is_modified(obj)):
+            changed.add(name)
+            if name == "users" and obj in session.dirty and _owner_name_changed(obj):
+                changed.add(OWNER_NAMES)
+    if changed:
+        session.info.setdefault(_PENDING_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_before_commit(session):
+    # コミット時の flush はこのイベントの後なので、先に flush して変更をそろえる
+    session.flush()
+    changed = session.info.pop(_PENDING_KEY, None)
+    if changed:
+        bump(session.connection(), changed)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_on_end(session, transaction):
+    # ロールバックされたトランザクションの分は捨てる（SAVEPOINT の終了では捨てない）
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)